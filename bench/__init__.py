@@ -0,0 +1,8 @@
+#!/bin/python3
+
+'''
+    FlexiMan benchmarks
+    Each submodule is a benchmark, run from the repository's root with `python3 -m bench.<name>`, that prints its results
+    All of them take `-e/--entrypoint` to run against a real FlexiLynx (see `bench._common`),
+        and otherwise run against a local stand-in (see `bench._standin`)
+'''
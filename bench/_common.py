@@ -0,0 +1,93 @@
+#!/bin/python3
+
+'''
+    Shared setup and timing for the benchmarks
+    If `-e/--entrypoint` is given, FlexiLynx is brought up from it (to `--runlevel`, as by FlexiMan itself),
+        otherwise the local stand-in (`bench._standin`) is installed in its place
+'''
+
+#> Imports
+import sys
+import json
+import types
+import typing
+import timeit
+import argparse
+from pathlib import Path
+#</Imports
+
+#> Header >/
+__all__ = ('parser', 'setup', 'synthetic_root', 'root_packages', 'timed', 'written', 'fmt_time', 'fmt_size', 'table')
+
+def parser(description: str) -> argparse.ArgumentParser:
+    '''Returns an `ArgumentParser` with the options that every benchmark takes'''
+    ap = argparse.ArgumentParser(description=description)
+    ap.add_argument('-e', '--entrypoint', type=Path, default=None,
+                    help='Bring up FlexiLynx from this entrypoint (or directory containing __init__.py), rather than using the local stand-in')
+    ap.add_argument('--runlevel', type=int, default=2, help='The runlevel to bring FlexiLynx to, if --entrypoint is given (default: %(default)s)')
+    return ap
+def setup(args: argparse.Namespace) -> types.ModuleType:
+    '''Brings up FlexiLynx (or installs the stand-in) as given by `args`, and returns `fmlib.total_autobind`'''
+    if args.entrypoint is None:
+        from . import _standin
+        _standin.install()
+        print('Using the local FlexiLynx stand-in', file=sys.stderr)
+    else:
+        from cli import preutil
+        preutil.exec_entrypoint(argparse.Namespace(entrypoint=args.entrypoint, root=args.entrypoint, runlevel=args.runlevel))
+    from fmlib import total_autobind
+    return total_autobind
+
+def synthetic_root(root: Path, count: int, *, files: int = 50, drafts: int = 3) -> dict[str, Path]:
+    '''
+        Fills `root` with `count` packages (each with `files` files in its main part, and `drafts` drafts), returning their IDs and directories
+        The blueprints only have the fields that the stand-in reads, so this is only suitable for the stand-in;
+            benchmarks run against a real FlexiLynx should use a real root instead (see `root_packages()`)
+    '''
+    import FlexiLynx
+    from fmlib import packages
+    packer = FlexiLynx.core.util.pack.Packer()
+    found = {}
+    for i in range(count):
+        id = f'bench:pkg/{i}'
+        names = [f'sub{j % 5}/file{j}' for j in range(files)]
+        d = root/packages.id_to_name(id)
+        d.mkdir()
+        (d/'blueprint.json').write_text(json.dumps({'id': id, 'main': {'files': {n: f'{i:08x}{j:08x}' for j,n in enumerate(names)}},
+                                                    'drafts': {f'draft{k}': {'files': dict.fromkeys(names[k::drafts or 1], '0')} for k in range(drafts)}}))
+        (d/'package_db.pakd').write_bytes(packer.pack(names))
+        found[id] = d
+    return found
+def root_packages(root: Path) -> dict[str, Path]:
+    '''Returns the IDs and directories of the packages in an existing `root`'''
+    from fmlib import packages
+    return {id: root/n for n,id in sorted(packages.scan_root(root).items())}
+
+def timed(fn: typing.Callable[[], object], *, number: int = 1, repeat: int = 5, setup: typing.Callable[[], object] = lambda: None) -> float:
+    '''
+        Returns the best time, in seconds, of `repeat` runs of calling `fn` `number` times, divided by `number`
+        `setup` is called (untimed) before each run
+    '''
+    return min(timeit.repeat(fn, setup, number=number, repeat=repeat)) / number
+
+def written() -> int | None:
+    '''Returns how many bytes this process has written so far (from `/proc/self/io`), or `None` if that is not available'''
+    try:
+        with open('/proc/self/io') as f:
+            return next(int(l.split(':')[1]) for l in f if l.startswith('wchar:'))
+    except (OSError, StopIteration): return None
+
+def fmt_time(secs: float) -> str:
+    for unit,scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if secs >= scale: return f'{secs / scale:.2f}{unit}'
+    return f'{secs / 1e-9:.1f}ns'
+def fmt_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024: return f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}GiB'
+def table(header: typing.Sequence[str], rows: typing.Iterable[typing.Sequence[object]]):
+    '''Prints `rows` as a left-aligned table under `header`'''
+    rows = [tuple(map(str, r)) for r in rows]
+    widths = [max(map(len, col)) for col in zip(header, *rows)]
+    for r in (header, *rows): print('  '.join(c.ljust(w) for c,w in zip(r, widths)).rstrip())
@@ -0,0 +1,110 @@
+#!/bin/python3
+
+'''
+    A local stand-in for the parts of FlexiLynx that FlexiMan's benchmarks use,
+        so that they can be run without a FlexiLynx checkout
+    Its packer pickles rather than packing, so packed sizes and (un)packing times are only comparable to each other
+'''
+
+#> Imports
+import os
+import sys
+import enum
+import json
+import fcntl
+import types
+import pickle
+import base64
+import typing
+import threading
+from pathlib import Path
+#</Imports
+
+#> Header >/
+__all__ = ('install',)
+
+# Objects
+class ReduceNamedtuple(enum.Enum):
+    AS_DICT = 1
+def _reduce(o: object) -> object:
+    if isinstance(o, tuple) and hasattr(o, '_asdict'): return {k: _reduce(v) for k,v in o._asdict().items()}
+    if isinstance(o, types.MappingProxyType): return dict(o)
+    return o
+class Packer:
+    __slots__ = ()
+    def __init__(self, reduce_namedtuple: ReduceNamedtuple | None = None): pass
+    def pack(self, *objs: object) -> bytes:
+        return pickle.dumps(_reduce(objs[0]) if len(objs) == 1 else tuple(map(_reduce, objs)))
+    def unpack(self, data: bytes) -> tuple[object, int]:
+        return (pickle.loads(data), len(data))
+def pack(*objs: object) -> bytes:
+    return Packer().pack(objs)
+
+class FLock:
+    __slots__ = ('path', 'lock', 'held', '_fd')
+    def __init__(self, path: os.PathLike, lock: typing.ContextManager | None = None):
+        self.path = path
+        self.lock = threading.RLock() if lock is None else lock
+        self.held = False
+    def acquire(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self.held = True
+    def release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self.held = False
+
+class frozenorderedset(tuple):
+    __slots__ = ()
+    def __new__(cls, it: typing.Iterable = ()):
+        return super().__new__(cls, dict.fromkeys(it))
+    def __sub__(self, other: typing.Iterable) -> typing.Self:
+        return type(self)(x for x in self if x not in other)
+
+class Blueprint:
+    '''Parses only the parts of a blueprint that FlexiMan uses: its ID, and the files of its main part and of its drafts'''
+    __slots__ = ('id', 'data', 'main', 'drafts')
+    def __init__(self, data: dict):
+        self.id = data['id']
+        self.data = data
+        self.main = types.SimpleNamespace(files=dict(data.get('main', {}).get('files', {})))
+        self.drafts = {did: types.SimpleNamespace(files=dict(d.get('files', {}))) for did,d in data.get('drafts', {}).items()}
+    @classmethod
+    def deserialize(cls, text: str) -> typing.Self:
+        return cls(json.loads(text))
+    @classmethod
+    def deserialize_from_dict(cls, data: dict) -> typing.Self:
+        return cls(data)
+class Package:
+    '''A package, loaded from a directory (its `blueprint.json`, and its `package_db.pakd` of tracked files), or made from a `Blueprint`'''
+    __slots__ = ('at', 'blueprint', 'files')
+    def __init__(self, at: os.PathLike | Blueprint):
+        if isinstance(at, Blueprint):
+            self.at = None
+            self.blueprint = at
+            self.files = set(at.main.files)
+            return
+        self.at = Path(at)
+        self.blueprint = Blueprint.deserialize((self.at/'blueprint.json').read_text())
+        self.files = set(Packer().unpack((self.at/'package_db.pakd').read_bytes())[0])
+    def install(self, to: Path):
+        self.at = to
+        (to/'blueprint.json').write_text(json.dumps(self.blueprint.data))
+    def save(self):
+        (self.at/'package_db.pakd').write_bytes(Packer().pack(sorted(self.files)))
+
+# Installation
+def install() -> types.ModuleType:
+    '''Installs the stand-in as `FlexiLynx` in `sys.modules` (if no `FlexiLynx` is there already), and returns whichever is there'''
+    if (fl := sys.modules.get('FlexiLynx')) is not None: return fl
+    fl = sys.modules['FlexiLynx'] = types.ModuleType('FlexiLynx', __doc__)
+    fl.core = types.SimpleNamespace(util=types.SimpleNamespace(
+        pack=types.SimpleNamespace(Packer=Packer, pack=pack, ReduceNamedtuple=ReduceNamedtuple),
+        hashtools=types.SimpleNamespace(ALGORITHM_DEFAULT_LOW='sha1', ALGORITHM_DEFAULT_HIGH='sha512'),
+        parallel=types.SimpleNamespace(FLock=FLock),
+        frozenorderedset=frozenorderedset,
+        base85=types.SimpleNamespace(encode=lambda b: base64.b85encode(b).decode()),
+        maptools=types.SimpleNamespace(map_vals=lambda f,d: {k: f(v) for k,v in d.items()}),
+    ), frameworks=types.SimpleNamespace(blueprint=types.SimpleNamespace(Blueprint=Blueprint, Package=Package)))
+    return fl
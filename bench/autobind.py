@@ -0,0 +1,72 @@
+#!/bin/python3
+
+'''
+    Benchmarks `fmlib.total_autobind`: the overhead of calling bound functions and methods,
+        and the time taken to import it (and so bind its submodules) lazily and eagerly
+'''
+
+#> Imports
+import sys
+import time
+import importlib
+from pathlib import Path
+from functools import partial, partialmethod
+
+from . import _common
+#</Imports
+
+#> Main >/
+def _import_time(lazy: bool, access: tuple[str, ...] = ()) -> float:
+    import fmlib
+    sys.modules.pop('fmlib.total_autobind', None)
+    fmlib.TOTAL_AUTOBIND_LAZY = lazy
+    start = time.perf_counter()
+    ta = importlib.import_module('fmlib.total_autobind')
+    for modname in access: getattr(ta, modname)
+    return time.perf_counter() - start
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--number', type=int, default=200_000, help='How many calls to time each way (default: %(default)s)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    fl = sys.modules['FlexiLynx']
+    n = args.number
+    # call overhead
+    def func(fl, x): return x
+    def closure(*args, **kwargs): return func(fl, *args, **kwargs)
+    class Cls:
+        def meth(self, fl, x): return x
+    class ByPartialmethod(Cls):
+        meth = partialmethod(Cls.meth, fl)
+    class ByClosure(Cls):
+        def meth(self, *args, **kwargs): return Cls.meth(self, fl, *args, **kwargs)
+    bypartial = partial(func, fl)
+    pm,cl = ByPartialmethod(), ByClosure()
+    missing = Path('/nonexistent/fleximan-bench')
+    from_dir = ta.packages.package_from_dir
+    state = ta.db.State(expl={}, deps={}, mtime=0, chksum=None, edges={})
+    print(f'Call overhead (best of 5 runs of {n} calls)')
+    _common.table(('call', 'direct', 'bound', 'overhead'), (
+        (name, _common.fmt_time(d := _common.timed(direct, number=n)), _common.fmt_time(b := _common.timed(bound, number=n)), _common.fmt_time(b - d))
+        for name,direct,bound in (
+            ('no-op function, functools.partial', lambda: func(fl, 1), lambda: bypartial(1)),
+            ('no-op function, closure', lambda: func(fl, 1), lambda: closure(1)),
+            ('no-op method, partialmethod', lambda: Cls.meth(pm, fl, 1), lambda: pm.meth(1)),
+            ('no-op method, closure (as bound)', lambda: Cls.meth(cl, fl, 1), lambda: cl.meth(1)),
+            ('packages.package_from_dir', lambda: from_dir.unbound(fl, missing), lambda: from_dir(missing)),
+            ('db.State.mkchksum', lambda: ta.unbound.db.State.mkchksum(state, fl), lambda: state.mkchksum()),
+        )))
+    # import time
+    print('\nImport time of fmlib.total_autobind (best of 20)')
+    mods = tuple(ta._unboundmods)
+    _common.table(('mode', 'time'), (
+        (name, _common.fmt_time(_common.timed(partial(_import_time, lazy, access), repeat=20)))
+        for name,lazy,access in (
+            ('eager', False, ()),
+            ('lazy', True, ()),
+            ('lazy, then db', True, ('db',)),
+            (f'lazy, then all {len(mods)} bound modules', True, mods),
+        )))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,57 @@
+#!/bin/python3
+
+'''
+    Benchmarks compact `State`s (see `db.State.compacted()`) against plain `dict`-backed ones:
+        the memory used by their entries, and the time taken by common operations on them
+'''
+
+#> Imports
+import gc
+import random
+import typing
+import tracemalloc
+
+from . import _common
+#</Imports
+
+#> Main >/
+def _memory(build: typing.Callable[[], object]) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        obj = build()
+        gc.collect()
+        return (tracemalloc.get_traced_memory()[0] - before, obj)
+    finally: tracemalloc.stop()
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--sizes', type=int, nargs='+', default=[100_000, 1_000_000], help='Database sizes, in packages (default: %(default)s)')
+    ap.add_argument('-m', '--moves', type=int, default=1000, help='How many packages to move between explicit and dependency (default: %(default)s)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    rng = random.Random(0)
+    rows = []
+    for n in args.sizes:
+        ids = [f'bench:pkg/{i}' for i in range(n)]
+        flags = [rng.random() < 0.3 for _ in ids]
+        lookups = rng.sample(ids, min(n, 10_000)) + [f'bench:missing/{i}' for i in range(1000)]
+        moving = rng.sample(ids, min(n, args.moves))
+        plain_mem,plain = _memory(lambda: ta.db.State(expl={id: False for id,e in zip(ids, flags) if e},
+                                                      deps={id: False for id,e in zip(ids, flags) if not e}, mtime=0, chksum=None, edges={}))
+        compact_mem,compacted = _memory(plain.compacted)
+        for name,state,mem in (('dict', plain, plain_mem), ('compact', compacted, compact_mem)):
+            def copy_move():
+                state.copy().move(moving, True)
+            rows.append((n, name, _common.fmt_size(mem),
+                         _common.fmt_time(_common.timed(state.copy, repeat=3)),
+                         _common.fmt_time(_common.timed(copy_move, repeat=3)),
+                         _common.fmt_time(_common.timed(lambda: state.missing(lookups), repeat=3)),
+                         _common.fmt_time(_common.timed(state.mkchksum, repeat=1))))
+        rows.append((n, 'compacting', '-', _common.fmt_time(_common.timed(plain.compacted, repeat=1)), '-', '-', '-'))
+        del plain,compacted
+    print(f'Entry memory (tracemalloc, excluding the ID strings themselves) and operation times (best of 3; checksum and compacting: one run)')
+    _common.table(('packages', 'state', 'memory', 'copy()', f'copy() + move({args.moves})', f'missing({min(args.sizes[0], 10_000) + 1000})', 'mkchksum()'), rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,54 @@
+#!/bin/python3
+
+'''
+    Benchmarks the latency of database writes at each durability level (see `db.Controller.DURABILITY_LEVELS`),
+        for both single-package journaled writes and whole-snapshot writes
+'''
+
+#> Imports
+import time
+import shutil
+import tempfile
+import statistics
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def _latencies(db: 'fmlib.db.Controller', count: int, *, compact: bool) -> list[float]:
+    lats = []
+    for i in range(count):
+        state = db.read()
+        state.move(('bench:pkg/0',), bool(i % 2))
+        start = time.perf_counter()
+        db.write(state, compact=compact)
+        lats.append(time.perf_counter() - start)
+    return lats
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--packages', type=int, default=10_000, help='How many packages are in the database (default: %(default)s)')
+    ap.add_argument('-w', '--writes', type=int, default=200, help='How many journaled writes to time at each level (default: %(default)s)')
+    ap.add_argument('-W', '--full-writes', type=int, default=20, help='How many whole-snapshot writes to time at each level (default: %(default)s)')
+    ap.add_argument('-d', '--dir', type=Path, default=None, help='Where to put the database (default: a temporary directory), as fsync() cost depends on the filesystem')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    rows = []
+    for level in ta.db.Controller.DURABILITY_LEVELS:
+        tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-', dir=args.dir))
+        try:
+            db = ta.db.Controller(tmp, durability=level)
+            with db:
+                state = db.read(allow_nonexist_read=True)
+                state.expl.update({f'bench:pkg/{i}': False for i in range(args.packages)})
+                db.write(state, compact=True)
+                for name,count,compact in (('journaled', args.writes, False), ('whole snapshot', args.full_writes, True)):
+                    lats = sorted(_latencies(db, count, compact=compact))
+                    rows.append((level, name, _common.fmt_time(statistics.median(lats)),
+                                 _common.fmt_time(lats[min(len(lats) - 1, int(len(lats) * 0.95))]), _common.fmt_time(max(lats))))
+        finally: shutil.rmtree(tmp)
+    print(f'Write latency on a database of {args.packages} packages')
+    _common.table(('durability', 'write', 'median', 'p95', 'max'), rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,71 @@
+#!/bin/python3
+
+'''
+    Benchmarks the write amplification of the journaled database format:
+        the bytes written (and time taken) per single-package change when it is appended to the journal,
+        against rewriting the whole snapshot (as every write did before the journal)
+    Also times a cold `.read()` of the journaled database, against one of the freshly compacted snapshot
+'''
+
+#> Imports
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def _writes(db: 'fmlib.db.Controller', count: int, ids: list[str], *, compact: bool) -> tuple[float, float]:
+    before = _common.written()
+    start = time.perf_counter()
+    for i in range(count):
+        state = db.read()
+        state.move((ids[i % len(ids)],), bool(i % 2))
+        db.write(state, compact=compact)
+    secs = time.perf_counter() - start
+    return ((_common.written() - before) / count, secs / count)
+def _cold_read(db: 'fmlib.db.Controller') -> float:
+    def read():
+        db.clear_cache()
+        db.read(readonly=True)
+    return _common.timed(read, repeat=3)
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--sizes', type=int, nargs='+', default=[10_000, 100_000], help='Database sizes, in packages (default: %(default)s)')
+    ap.add_argument('-w', '--writes', type=int, default=1000, help='How many journaled writes to make at each size (default: %(default)s)')
+    ap.add_argument('-W', '--full-writes', type=int, default=20, help='How many whole-snapshot writes to make at each size (default: %(default)s)')
+    ap.add_argument('--durability', default='none', help='The durability level to write at (default: %(default)s, so that fsync() time is not measured)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    if _common.written() is None: print('Warning: /proc/self/io is not available, so bytes written cannot be measured')
+    rows = []
+    for n in args.sizes:
+        tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+        try:
+            db = ta.db.Controller(tmp, durability=args.durability)
+            ids = [f'bench:pkg/{i}' for i in range(n)]
+            with db:
+                state = db.read(allow_nonexist_read=True)
+                state.expl.update(dict.fromkeys(ids, False))
+                db.write(state, compact=True)
+                snapshot = db.PACKAGE_DB_FILENAME
+                size = (tmp/snapshot).stat().st_size
+                jbytes,jsecs = _writes(db, args.writes, ids, compact=False)
+                jread = _cold_read(db)
+                fbytes,fsecs = _writes(db, args.full_writes, ids, compact=True)
+                fread = _cold_read(db)
+            rows.append((n, _common.fmt_size(size),
+                         _common.fmt_size(jbytes), _common.fmt_time(jsecs), _common.fmt_time(jread),
+                         _common.fmt_size(fbytes), _common.fmt_time(fsecs), _common.fmt_time(fread),
+                         f'{fbytes / jbytes:.0f}x'))
+        finally: shutil.rmtree(tmp)
+    print(f'Per single-package write (journaled: mean of {args.writes}, including any compactions; whole snapshot: mean of {args.full_writes})')
+    _common.table(('packages', 'snapshot',
+                   'journaled: written', 'time', 'cold read',
+                   'whole snapshot: written', 'time', 'cold read',
+                   'written ratio'), rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,58 @@
+#!/bin/python3
+
+'''
+    Benchmarks loading packages serially and concurrently, as `files -J/--jobs N` does,
+        on a synthetic root of packages (or an existing root of packages, with `--root`)
+    The package cache is bypassed, so that every package is loaded from its files
+    With `--latency`, each package load is delayed, as by storage that is slower than the page cache (such as a network filesystem)
+'''
+
+#> Imports
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--packages', type=int, default=500, help='How many packages to put in the synthetic root (default: %(default)s)')
+    ap.add_argument('-f', '--files', type=int, default=50, help='How many files each synthetic package has (default: %(default)s)')
+    ap.add_argument('--root', type=Path, default=None, help='Load the packages in this existing root, rather than a synthetic one')
+    ap.add_argument('--latency', type=float, nargs='+', default=[0, 0.001], help='The per-package latencies to compare, in seconds (default: %(default)s)')
+    ap.add_argument('-J', '--jobs', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='The numbers of jobs to compare (default: %(default)s)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    from cli import postutil
+    from cli.operations import files
+    tmp = None
+    if args.root is None:
+        tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+        paths = _common.synthetic_root(tmp, args.packages, files=args.files)
+    else: paths = _common.root_packages(args.root)
+    try:
+        postutil.package_cache = ta.packages.PackageCache(max_entries=0)
+        load = files._load_package
+        rows = []
+        for latency in args.latency:
+            def delayed(path: Path):
+                time.sleep(latency)
+                return load(path)
+            files._load_package = delayed if latency else load
+            serial = None
+            for jobs in args.jobs:
+                loaded = []
+                secs = _common.timed(lambda: loaded.append([id for id,*_ in files._load_packages(jobs, paths)]), repeat=3)
+                assert all(ids == list(paths) for ids in loaded), 'packages were loaded out of order'
+                if serial is None: serial = secs
+                rows.append((_common.fmt_time(latency) if latency else '-', jobs, _common.fmt_time(secs), _common.fmt_time(secs / len(paths)), f'{serial / secs:.2f}x'))
+        files._load_package = load
+    finally:
+        if tmp is not None: shutil.rmtree(tmp)
+    print(f'Loading {len(paths)} packages (best of 3)')
+    _common.table(('added latency', 'jobs', 'time', 'per package', 'speedup'), rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,74 @@
+#!/bin/python3
+
+'''
+    Benchmarks database lock contention: many concurrent reader processes (as run by provisioning scripts),
+        each repeatedly taking the database's file-lock and reading the database,
+        either all exclusively (as every operation did before shared locking), or shared (as read-only operations now do),
+        and optionally alongside a process that repeatedly writes
+'''
+
+#> Imports
+import time
+import shutil
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def _reader(path: Path, shared: bool, iterations: int, hold: float) -> tuple[float, int]:
+    from fmlib import total_autobind as ta
+    db = ta.db.Controller(path)
+    for _ in range(iterations):
+        with db.shared() if shared else db:
+            db.read(readonly=True)
+            time.sleep(hold) # the rest of the operation
+    return (sum(db.flock.wait_time.values()), sum(db.flock.acquisitions.values()))
+def _writer(path: Path, iterations: int, hold: float) -> tuple[float, int]:
+    from fmlib import total_autobind as ta
+    db = ta.db.Controller(path)
+    for i in range(iterations):
+        with db:
+            state = db.read()
+            state.move(('bench:pkg/0',), bool(i % 2))
+            db.write(state)
+        time.sleep(hold)
+    return (sum(db.flock.wait_time.values()), sum(db.flock.acquisitions.values()))
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-p', '--processes', type=int, default=16, help='How many concurrent reader processes to run (default: %(default)s)')
+    ap.add_argument('-i', '--iterations', type=int, default=50, help='How many times each reader takes the lock (default: %(default)s)')
+    ap.add_argument('--hold', type=float, default=0.002, help='How long, in seconds, each reader holds the lock after reading (default: %(default)s)')
+    ap.add_argument('-n', '--packages', type=int, default=10_000, help='How many packages are in the database (default: %(default)s)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    ctx = multiprocessing.get_context('fork') # the workers inherit FlexiLynx (or the stand-in)
+    tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+    rows = []
+    try:
+        db = ta.db.Controller(tmp)
+        with db:
+            state = db.read(allow_nonexist_read=True)
+            state.expl.update({f'bench:pkg/{i}': False for i in range(args.packages)})
+            db.write(state, compact=True)
+        for name,shared,writer in (('exclusive readers', False, False), ('shared readers', True, False),
+                                   ('exclusive readers + writer', False, True), ('shared readers + writer', True, True)):
+            with ctx.Pool(args.processes + writer) as pool:
+                start = time.perf_counter()
+                results = [pool.apply_async(_reader, (tmp, shared, args.iterations, args.hold)) for _ in range(args.processes)]
+                if writer: wresult = pool.apply_async(_writer, (tmp, args.iterations, args.hold))
+                waits = [r.get() for r in results]
+                wall = time.perf_counter() - start
+                if writer: wwait,wacq = wresult.get()
+            wait,acq = map(sum, zip(*waits))
+            rows.append((name, _common.fmt_time(wall), _common.fmt_time(wait / acq), _common.fmt_time(max(w for w,_ in waits) / args.iterations),
+                         _common.fmt_time(wwait / wacq) if writer else '-'))
+    finally: shutil.rmtree(tmp)
+    print(f'{args.processes} reader processes x {args.iterations} lock acquisitions, each held for {_common.fmt_time(args.hold)} after reading,'
+          f' on a database of {args.packages} packages')
+    _common.table(('mode', 'wall time', 'mean reader wait', 'worst reader mean wait', 'mean writer wait'), rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,50 @@
+#!/bin/python3
+
+'''
+    Benchmarks cold and warm loads of many packages through `packages.PackageCache`:
+        without a cache, on a miss (as in a new process), and from the cache
+'''
+
+#> Imports
+import shutil
+import tempfile
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--packages', type=int, default=500, help='How many packages to put in the synthetic root (default: %(default)s)')
+    ap.add_argument('-f', '--files', type=int, default=50, help='How many files each synthetic package has (default: %(default)s)')
+    ap.add_argument('--root', type=Path, default=None, help='Load the packages in this existing root, rather than a synthetic one')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    import FlexiLynx
+    tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+    try:
+        paths = list((_common.synthetic_root(tmp, args.packages, files=args.files) if args.root is None
+                      else _common.root_packages(args.root)).values())
+        def uncached():
+            for p in paths: FlexiLynx.core.frameworks.blueprint.Package(p)
+        def missed():
+            cache = ta.packages.PackageCache(len(paths))
+            for p in paths: cache.load(p)
+            assert cache.misses == len(paths)
+        mem = ta.packages.PackageCache(len(paths))
+        for p in paths: mem.load(p)
+        def from_memory():
+            for p in paths: mem.load(p)
+        rows = []
+        base = None
+        for name,fn in (('no cache', uncached), ('miss', missed), ('hit', from_memory)):
+            secs = _common.timed(fn, repeat=3)
+            if base is None: base = secs
+            rows.append((name, _common.fmt_time(secs), _common.fmt_time(secs / len(paths)), f'{base / secs:.2f}x'))
+        assert mem.hits >= (3 * len(paths))
+    finally: shutil.rmtree(tmp)
+    print(f'Loading {len(paths)} packages (best of 3)')
+    _common.table(('load', 'time', 'per package', 'speedup'), rows)
+
+if __name__ == '__main__': main()
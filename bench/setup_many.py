@@ -0,0 +1,64 @@
+#!/bin/python3
+
+'''
+    Benchmarks bulk installation with `packages.setup_many()`, against setting packages up one at a time
+        (and recording each in the database with its own write), as was done before it
+    Blueprints are fetched from a local `fetchfn` stand-in, which injects a fixed latency into each fetch
+'''
+
+#> Imports
+import json
+import typing
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('-n', '--packages', type=int, default=100, help='How many packages to set up (default: %(default)s)')
+    ap.add_argument('--latency', type=float, nargs='+', default=[0, 0.01, 0.05], help='The per-fetch latencies to compare, in seconds (default: %(default)s)')
+    ap.add_argument('-J', '--jobs', type=int, nargs='+', default=[1, 8, 32], help='The numbers of jobs to compare (default: %(default)s)')
+    args = ap.parse_args()
+    ta = _common.setup(args)
+    blueprints = {f'bench://blueprints/{i}': json.dumps({'id': f'bench:pkg/{i}', 'main': {'files': {f'file{j}': '0' for j in range(20)}}}).encode()
+                  for i in range(args.packages)}
+    tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+    rows = []
+    try:
+        runs = 0
+        def run(fn: typing.Callable[[Path, ta.db.Controller, typing.Callable[[str], bytes]], None], latency: float) -> float:
+            nonlocal runs
+            def fetch(url: str) -> bytes:
+                time.sleep(latency)
+                return blueprints[url]
+            runs += 1
+            (root := tmp/str(runs)).mkdir()
+            db = ta.db.Controller(root)
+            with db:
+                start = time.perf_counter()
+                fn(root, db, fetch)
+                secs = time.perf_counter() - start
+                assert len(db.read(readonly=True).expl) == args.packages
+            return secs
+        def one_at_a_time(root: Path, db: ta.db.Controller, fetch: typing.Callable[[str], bytes]):
+            for i,url in enumerate(blueprints):
+                pkg = ta.packages.setup_from_url(url, root/ta.packages.id_to_name(f'bench:pkg/{i}'), fetchfn=fetch)
+                state = db.read(allow_nonexist_read=True)
+                state.expl[pkg.blueprint.id] = False
+                db.write(state)
+        for latency in args.latency:
+            serial = run(one_at_a_time, latency)
+            rows.append((_common.fmt_time(latency) if latency else '-', 'one at a time', _common.fmt_time(serial), '1.00x'))
+            for jobs in args.jobs:
+                secs = run(lambda root,db,fetch: ta.packages.setup_many(blueprints, root, jobs=jobs, fetchfn=fetch, db=db, explicit=True), latency)
+                rows.append(('', f'setup_many(jobs={jobs})', _common.fmt_time(secs), f'{serial / secs:.2f}x'))
+    finally: shutil.rmtree(tmp)
+    print(f'Setting up {args.packages} packages')
+    _common.table(('fetch latency', 'method', 'time', 'speedup'), rows)
+
+if __name__ == '__main__': main()
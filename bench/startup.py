@@ -0,0 +1,85 @@
+#!/bin/python3
+
+'''
+    Benchmarks FlexiMan's startup time for each operation, by running `fleximan.py --timings` in fresh processes
+    Against the stand-in, bringing FlexiLynx up costs next to nothing, so only FlexiMan's own startup is measured;
+        to include FlexiLynx's bring-up, run against a real FlexiLynx with `-e/--entrypoint` and `--root`
+'''
+
+#> Imports
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+from . import _common
+#</Imports
+
+#> Main >/
+_REPO = Path(__file__).resolve().parent.parent
+_STANDIN_ENTRYPOINT = f'''# a stand-in FlexiLynx entrypoint, written by bench.startup
+import sys
+sys.path.insert(0, {str(_REPO)!r})
+def __load__():
+    from bench import _standin
+    _standin.install()
+def __setup__(): pass
+'''
+
+def _run(argv: list[str], *, python: bool = False) -> tuple[float, dict[str, float]]:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *(argv if python else (str(_REPO/'fleximan.py'), '--timings', *argv))], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f'fleximan.py {" ".join(argv)} exited with {proc.returncode}:\n{proc.stderr}')
+    spans = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('{'): continue
+        span = json.loads(line)
+        spans[span['span']] = spans.get(span['span'], 0) + span['duration']
+    return (wall, spans)
+
+def main():
+    ap = _common.parser(__doc__)
+    ap.add_argument('--root', type=Path, default=None, help='The root to run operations on (required with -e/--entrypoint; otherwise a small synthetic root is made)')
+    ap.add_argument('-R', '--runs', type=int, default=10, help='How many times to run each operation each way (default: %(default)s)')
+    args = ap.parse_args()
+    tmp = None
+    if args.entrypoint is None:
+        _common.setup(args)
+        tmp = Path(tempfile.mkdtemp(prefix='fleximan-bench-'))
+        (tmp/'entrypoint').mkdir()
+        (tmp/'entrypoint'/'__init__.py').write_text(_STANDIN_ENTRYPOINT)
+        root,entrypoint = tmp/'root',tmp/'entrypoint'
+        root.mkdir()
+        from fmlib import total_autobind as ta
+        db = ta.db.Controller(root)
+        with db:
+            state = db.read(allow_nonexist_read=True)
+            state.expl.update(dict.fromkeys(_common.synthetic_root(root, 50), False))
+            db.write(state, compact=True)
+    elif args.root is None: ap.error('--root is required with -e/--entrypoint')
+    else: root,entrypoint = args.root,args.entrypoint
+    try:
+        target = next(iter(_common.root_packages(root)))
+        ops = (('database -k', ['-D', '-k']), ('database --orphans', ['-D', '--orphans']),
+               ('files -l', ['-F', '-l', target]), ('query -s', ['-Q', '-s', target[:4]]))
+        rows = [('python3 -c pass', _common.fmt_time(statistics.median(_run(['-c', 'pass'], python=True)[0] for _ in range(args.runs))), '-', '-', '-', '-')]
+        for name,argv in ops:
+            runs = [_run(['-r', str(root), '-e', str(entrypoint), *argv]) for _ in range(args.runs)]
+            rows.append((name,
+                         _common.fmt_time(statistics.median(w for w,_ in runs)),
+                         _common.fmt_time(statistics.median(s.get('fleximan.import_operation', 0) for _,s in runs)),
+                         _common.fmt_time(statistics.median(s.get('fleximan.fill', 0) for _,s in runs)),
+                         _common.fmt_time(statistics.median(s.get('fleximan.entrypoint', 0) for _,s in runs)),
+                         _common.fmt_time(statistics.median(s.get('fleximan.main', 0) for _,s in runs))))
+    finally:
+        if tmp is not None: shutil.rmtree(tmp)
+    print(f'Median of {args.runs} runs of each operation')
+    _common.table(('operation', 'process wall time', 'import operation', 'fill parser', 'FlexiLynx bring-up', 'operation'), rows)
+
+if __name__ == '__main__': main()
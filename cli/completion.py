@@ -0,0 +1,220 @@
+#!/bin/python3
+
+'''
+    Shell completion scripts, generated from `parsers.pre_parser` and each operation's `fill()`
+    The scripts complete options, their choices, and paths themselves,
+        and complete package IDs from the database's plain-text ID cache (see `fmlib.db.Controller`),
+        so completing never runs FlexiMan (nor brings FlexiLynx up)
+'''
+
+#> Imports
+import typing
+import argparse
+import importlib
+from pathlib import Path
+
+from . import parsers
+from fmlib import db
+#</Imports
+
+#> Header >/
+__all__ = ('SHELLS', 'COMMANDS', 'Option', 'Operation', 'spec', 'script')
+
+COMMANDS = ('fleximan.py', 'fleximanc.py')
+_CLIENT_OPTIONS = ('-S', '--socket') # only taken by `fleximanc.py`, before any other arguments
+_IDS_FILENAME = db.Controller.PACKAGE_DB_IDSNAME
+
+class Option(typing.NamedTuple):
+    '''An option of FlexiMan or of one of its operations, along with whether it takes a value, its choices (if any), and whether its value is a path'''
+    strings: tuple[str, ...]
+    takes_value: bool
+    choices: tuple[str, ...] | None
+    path: bool
+class Operation(typing.NamedTuple):
+    '''
+        An operation of FlexiMan, along with its options, the action selected by each of its action options,
+            and which of its actions target package IDs (`ID_ACTIONS`)
+    '''
+    name: str
+    short: str
+    options: tuple[Option, ...]
+    actions: dict[str, str]
+    id_actions: frozenset[str]
+
+def _options(ap: argparse.ArgumentParser) -> tuple[Option, ...]:
+    return tuple(Option(tuple(a.option_strings), a.nargs != 0, None if a.choices is None else tuple(map(str, a.choices)), a.type is Path)
+                 for a in ap._actions if a.option_strings and (a.help is not argparse.SUPPRESS))
+def spec() -> tuple[tuple[Option, ...], tuple[Operation, ...]]:
+    '''Returns FlexiMan's own options (from `parsers.pre_parser`) and its operations (filled as they would be for help)'''
+    ops = []
+    for name,short in parsers.operations.items():
+        op = importlib.import_module(f'cli.operations.{name}')
+        ap = argparse.ArgumentParser()
+        op.fill(ap, True)
+        ops.append(Operation(name, f'-{short}', _options(ap),
+                             {s: a.const for a in ap._actions if a.dest == 'action' for s in a.option_strings},
+                             op.ID_ACTIONS))
+    return (_options(parsers.pre_parser), tuple(ops))
+
+# Script pieces
+type _Pieces = dict[str, typing.Any]
+def _pieces() -> _Pieces:
+    pre,ops = spec()
+    selectors = {s for op in ops for s in (op.short, f'--{op.name}')}
+    values = [([f'*:{s}' for s in o.strings], o) for o in pre if o.takes_value]
+    values.append(([f'*:{s}' for s in _CLIENT_OPTIONS], Option(_CLIENT_OPTIONS, True, None, True)))
+    for op in ops: values.extend(([f'{op.name}:{s}' for s in o.strings], o) for o in op.options if o.takes_value)
+    actions = {}
+    for op in ops:
+        for s,a in op.actions.items(): actions.setdefault((op.name, a), []).append(f'{op.name}:{s}')
+    common = [s for o in pre for s in o.strings if s not in selectors]
+    return {
+        'ops': ops,
+        'values': values,
+        'actions': actions,
+        'options': {'': [s for o in pre for s in o.strings]} | {op.name: list(dict.fromkeys(common + [s for o in op.options for s in o.strings])) for op in ops},
+        'ids': [f'{op.name}:{a}' for op in ops for a in sorted(op.id_actions)],
+    }
+
+# Scripts
+def _bash(p: _Pieces) -> str:
+    nl = '\n'
+    return f'''# bash completion for FlexiMan, generated by `fleximan.py --completion bash`
+_fleximan() {{
+    local line="${{COMP_LINE:0:COMP_POINT}}" cur= prev= op= action= root=. dbpath= w i n
+    local -a words
+    read -ra words <<< "$line"
+    [[ $line == *[[:space:]] ]] || {{ cur="${{words[${{#words[@]}}-1]}}"; unset 'words[${{#words[@]}}-1]'; }}
+    n=${{#words[@]}}
+    (( n > 1 )) && prev="${{words[n-1]}}"
+    COMPREPLY=()
+    for (( i = 1; i < n; i++ )); do
+        w="${{words[i]}}"
+        case "$w" in
+            -r|--root) root="${{words[i+1]:-$root}}"; root="${{root/#\\~/$HOME}}";;
+            -b|--dbpath) dbpath="${{words[i+1]:-$dbpath}}"; dbpath="${{dbpath/#\\~/$HOME}}";;
+{nl.join(f"            --{op.name}|{op.short}) op={op.name}; continue;;{nl}            {op.short}?*) op={op.name}; w=\"-${{w:2}}\";;" for op in p['ops'])}
+        esac
+        case "$op:$w" in
+{nl.join(f"            {'|'.join(pats)}) action={a};;" for (_,a),pats in p['actions'].items())}
+        esac
+    done
+    case "$op:$prev" in
+{nl.join(f"        {'|'.join(pats)}) " + (f"COMPREPLY=($(compgen -W '{' '.join(o.choices)}' -- \"$cur\")); return;;" if o.choices is not None
+                                    else 'COMPREPLY=($(compgen -f -- "$cur")); compopt -o filenames 2>/dev/null; return;;' if o.path else 'return;;')
+         for pats,o in p['values'])}
+    esac
+    if [[ $cur == -* ]]; then
+        case "$op" in
+{nl.join(f"            {op or '*'}) w='{' '.join(opts)}';;" for op,opts in sorted(p['options'].items(), key=lambda kv: not kv[0]))}
+        esac
+        COMPREPLY=($(compgen -W "$w" -- "$cur"))
+        return
+    fi
+    case "$op:$action" in
+        {'|'.join(p['ids'])})
+            local f="${{dbpath:-$root}}/{_IDS_FILENAME}" strip=
+            [[ $COMP_WORDBREAKS == *:* ]] && strip="${{cur%"${{cur##*:}}"}}" # bash replaces only the text after the last colon
+            [[ -r $f ]] || return
+            while IFS= read -r w; do COMPREPLY+=("$w"); done < <(P="$cur" S="${{#strip}}" awk 'index($0, ENVIRON["P"]) == 1 {{ print substr($0, ENVIRON["S"] + 1) }}' "$f")
+            ;;
+        *) COMPREPLY=($(compgen -f -- "$cur")); compopt -o filenames 2>/dev/null;;
+    esac
+}}
+complete -F _fleximan {' '.join(COMMANDS)} {' '.join(f'./{c}' for c in COMMANDS)}'''
+def _zsh(p: _Pieces) -> str:
+    nl = '\n'
+    return f'''#compdef {' '.join(COMMANDS)}
+# zsh completion for FlexiMan, generated by `fleximan.py --completion zsh`
+_fleximan() {{
+    local cur="${{(Q)PREFIX}}" prev="${{(Q)words[CURRENT-1]}}" op= action= root=. dbpath= w i
+    for (( i = 2; i < CURRENT; i++ )); do
+        w="${{(Q)words[i]}}"
+        case "$w" in
+            (-r|--root) (( i + 1 < CURRENT )) && root="${{${{(Q)words[i+1]}}/#\\~/$HOME}}";;
+            (-b|--dbpath) (( i + 1 < CURRENT )) && dbpath="${{${{(Q)words[i+1]}}/#\\~/$HOME}}";;
+{nl.join(f"            (--{op.name}|{op.short}) op={op.name}; continue;;{nl}            ({op.short}?*) op={op.name}; w=\"-${{w:2}}\";;" for op in p['ops'])}
+        esac
+        case "$op:$w" in
+{nl.join(f"            ({'|'.join(pats)}) action={a};;" for (_,a),pats in p['actions'].items())}
+        esac
+    done
+    case "$op:$prev" in
+{nl.join(f"        ({'|'.join(pats)}) " + (f"compadd -- {' '.join(o.choices)}; return;;" if o.choices is not None
+                                     else '_files; return;;' if o.path else "_message 'value'; return;;")
+         for pats,o in p['values'])}
+    esac
+    if [[ $cur == -* ]]; then
+        case "$op" in
+{nl.join(f"            ({op or '*'}) compadd -- {' '.join(opts)};;" for op,opts in sorted(p['options'].items(), key=lambda kv: not kv[0]))}
+        esac
+        return
+    fi
+    case "$op:$action" in
+        ({'|'.join(p['ids'])})
+            local f="${{dbpath:-$root}}/{_IDS_FILENAME}"
+            [[ -r $f ]] && compadd -- ${{(f)"$(P="$cur" awk 'index($0, ENVIRON["P"]) == 1' "$f")"}}
+            ;;
+        (*) _files;;
+    esac
+}}
+if [[ $zsh_eval_context[-1] == loadautofunc ]]; then _fleximan "$@"
+else compdef _fleximan {' '.join(COMMANDS)}; fi'''
+def _fish(p: _Pieces) -> str:
+    nl = '\n'
+    q = lambda pats: ' '.join(f"'{pat}'" for pat in pats)
+    return f'''# fish completion for FlexiMan, generated by `fleximan.py --completion fish`
+function __fleximan_complete
+    set -l words (commandline -opc)
+    set -l cur (commandline -ct)
+    set -l prev $words[-1]
+    set -l n (count $words)
+    set -l op
+    set -l action
+    set -l root .
+    set -l dbpath
+    for i in (seq 2 $n)
+        test $i -le $n; or break
+        set -l w $words[$i]
+        # words are switched on with a leading colon, so that they are never mistaken for options
+        switch ":$w"
+            case ':-r' ':--root'
+                test $i -lt $n; and set root (string replace -r '^~' $HOME -- $words[(math $i + 1)])
+            case ':-b' ':--dbpath'
+                test $i -lt $n; and set dbpath (string replace -r '^~' $HOME -- $words[(math $i + 1)])
+        end
+        switch ":$w"
+{nl.join(f"            case ':--{op.name}' ':{op.short}'{nl}                set op {op.name}{nl}                continue{nl}            case ':{op.short}?*'{nl}                set op {op.name}{nl}                set w -(string sub -s 3 -- $w)" for op in p['ops'])}
+        end
+        switch "$op:$w"
+{nl.join(f"            case {q(pats)}{nl}                set action {a}" for (_,a),pats in p['actions'].items())}
+        end
+    end
+    switch "$op:$prev"
+{nl.join(f"        case {q(pats)}{nl}            " + (f"printf '%s\\n' {' '.join(o.choices)}; return" if o.choices is not None
+                                                 else '__fish_complete_path "$cur"; return' if o.path else 'return')
+         for pats,o in p['values'])}
+    end
+    if string match -q -- '-*' "$cur"
+        switch "$op"
+{nl.join(f"            case '{op or '*'}'{nl}                printf '%s\\n' {' '.join(opts)}" for op,opts in sorted(p['options'].items(), key=lambda kv: not kv[0]))}
+        end
+        return
+    end
+    switch "$op:$action"
+        case {q(p['ids'])}
+            test -n "$dbpath"; or set dbpath $root
+            test -r "$dbpath/{_IDS_FILENAME}"; and env P="$cur" awk 'index($0, ENVIRON["P"]) == 1' "$dbpath/{_IDS_FILENAME}"
+        case '*'
+            __fish_complete_path "$cur"
+    end
+end
+{nl.join(f"complete -c {c} -f -a '(__fleximan_complete)'" for c in COMMANDS)}'''
+
+SHELLS = {'bash': _bash, 'zsh': _zsh, 'fish': _fish}
+def script(shell: str) -> str:
+    '''
+        Returns the completion script for `shell` (one of `SHELLS`), which completes the commands in `COMMANDS`
+        The script is meant to be sourced (or, for zsh, it may also be placed in `$fpath` as `_fleximan`)
+    '''
+    return SHELLS[shell](_pieces())
@@ -0,0 +1,137 @@
+#!/bin/python3
+
+#> Imports
+import io
+import os
+import sys
+import json
+import types
+import socket
+import typing
+import threading
+import traceback
+import contextlib
+import socketserver
+from pathlib import Path
+
+from . import parsers
+from . import preutil
+#</Imports
+
+#> Header >/
+__all__ = ('SOCKET_ENV',
+           'serve', 'request')
+
+SOCKET_ENV = 'FLEXIMAN_SOCKET'
+
+# Protocol
+## The client sends a single JSON line of `{"argv": [...], "cwd": "..."}`,
+##  and the server replies with frames of a stream byte followed by a big-endian u32 length and the data
+##  the final frame is on the `_EXIT` stream, and its data is the exit code as a big-endian u32
+## If the operation reads stdin, the server first sends an empty frame on the `_STDIN` stream,
+##  to which the client replies with a big-endian u32 length and all of its own stdin
+_STDOUT = b'\x01'
+_STDERR = b'\x02'
+_STDIN = b'\x03'
+_EXIT = b'\x00'
+
+def _frame(stream: bytes, data: bytes) -> bytes:
+    return stream + len(data).to_bytes(4, 'big') + data
+
+# Server
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, ep: types.ModuleType, runner: typing.Callable[[typing.Sequence[str], types.ModuleType], int]):
+        self.ep = ep
+        self.runner = runner
+        # operations redirect the process-wide stdout/stderr and working directory,
+        #  so they are run one at a time; the database's file-lock still guards against other processes
+        self.oplock = threading.Lock()
+        super().__init__(str(path), _Handler)
+
+class _ClientStdin(io.RawIOBase):
+    '''The client's stdin, which is only requested from it (all at once) when it is first read'''
+    __slots__ = ('handler', 'data')
+    def __init__(self, handler: socketserver.StreamRequestHandler):
+        self.handler = handler
+        self.data = None
+    def readable(self) -> bool: return True
+    def readinto(self, buf: bytearray) -> int:
+        if self.data is None:
+            self.handler.wfile.write(_frame(_STDIN, b''))
+            size = int.from_bytes(self.handler.rfile.read(4), 'big')
+            if len(data := self.handler.rfile.read(size)) != size:
+                raise ConnectionError('Client closed the connection while sending stdin')
+            self.data = io.BytesIO(data)
+        return self.data.readinto(buf)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try: req = json.loads(self.rfile.readline())
+        except ValueError:
+            self.wfile.write(_frame(_STDERR, b'Error: malformed request\n'))
+            self.wfile.write(_frame(_EXIT, int(parsers.ExitCode.USAGE).to_bytes(4, 'big')))
+            return
+        out = io.TextIOWrapper(io.BytesIO(), write_through=True)
+        err = io.TextIOWrapper(io.BytesIO(), write_through=True)
+        with self.server.oplock:
+            cwd = os.getcwd()
+            stdin,sys.stdin = sys.stdin,io.TextIOWrapper(io.BufferedReader(_ClientStdin(self)))
+            try:
+                os.chdir(req['cwd'])
+                with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                    try: code = self.server.runner(req['argv'], self.server.ep)
+                    except SystemExit as e: # raised by argparse on usage errors
+                        code = e.code if isinstance(e.code, int) else (0 if e.code is None else parsers.ExitCode.USAGE)
+            except Exception:
+                err.write(traceback.format_exc())
+                code = parsers.ExitCode.GENERIC
+            finally:
+                os.chdir(cwd)
+                sys.stdin = stdin
+        self.wfile.write(_frame(_STDOUT, out.buffer.getvalue()))
+        self.wfile.write(_frame(_STDERR, err.buffer.getvalue()))
+        self.wfile.write(_frame(_EXIT, int(code).to_bytes(4, 'big')))
+
+def serve(path: Path, ep: types.ModuleType, runner: typing.Callable[[typing.Sequence[str], types.ModuleType], int]):
+    '''
+        Serves operations over a Unix socket at `path` until interrupted,
+            running each request's arguments through `runner` with the already brought-up entrypoint `ep`
+    '''
+    path.unlink(missing_ok=True)
+    with _Server(path, ep, runner) as server:
+        os.chmod(path, 0o600)
+        preutil.eprint(f'Serving on {path}')
+        try: server.serve_forever()
+        except KeyboardInterrupt: preutil.eprint('Interrupted, shutting down')
+        finally: path.unlink(missing_ok=True)
+
+# Client
+def _recvexact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        if not (chunk := sock.recv(size - len(buf))):
+            raise ConnectionError('Daemon closed the connection mid-response')
+        buf += chunk
+    return bytes(buf)
+def request(path: Path, argv: typing.Sequence[str]) -> int:
+    '''
+        Runs `argv` on the daemon listening at `path`, writing its output to this process's stdout and stderr, and returns its exit code
+        This process's stdin is only read (and sent to the daemon) if the operation reads it
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        sock.sendall(json.dumps({'argv': list(argv), 'cwd': os.getcwd()}).encode() + b'\n')
+        while True:
+            stream = _recvexact(sock, 1)
+            data = _recvexact(sock, int.from_bytes(_recvexact(sock, 4), 'big'))
+            if stream == _EXIT: return int.from_bytes(data, 'big')
+            if stream == _STDIN:
+                data = sys.stdin.buffer.read()
+                sock.sendall(len(data).to_bytes(4, 'big') + data)
+                continue
+            out = sys.stdout if stream == _STDOUT else sys.stderr
+            out.flush()
+            out.buffer.write(data)
+            out.buffer.flush()
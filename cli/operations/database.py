@@ -2,25 +2,45 @@
 
 #> Imports
 import sys
+import shlex
 import types
+import typing
 import argparse
 from functools import partial
+from pathlib import Path
 
 from .. import preutil
 from .. import parsers
+from fmlib import trace
 #</Imports
 
 #> Header >/
-__all__ = ('fill', 'main', 'actions')
+__all__ = ('CAPABILITIES', 'ID_ACTIONS', 'fill', 'main', 'actions', 'shared_actions', 'batch_actions')
+
+CAPABILITIES = ('core.util.pack', 'core.util.hashtools', 'core.util.parallel', 'core.util.base85')
+ID_ACTIONS = frozenset(('asdeps', 'asexplicit', 'link', 'unlink', 'rdeps')) # actions whose targets are package IDs (for shell completion)
 
 def fill(ap: argparse.ArgumentParser, for_help: bool):
     menu = ap.add_mutually_exclusive_group(required=True)
     menu = partial(preutil.menu_arg, menu, 'action')
-    menu('check', '-k', help='Test database checksum')
+    menu('check', '-k', help='Test database checksum (snapshots from database version 4.0 are streamed through the checksum a frame at a time; older databases are unpacked and repacked)')
     menu('asdeps', help='Mark packages as non-explicitly installed')
     menu('asexplicit', help='Mark packages as explicitly installed')
+    menu('link', help='Record that the first target package depends on each of the other target packages')
+    menu('unlink', help='Remove the recorded dependencies of the first target package on each of the other target packages (or on every package, if it is the only target)')
+    menu('orphans', help='List dependency packages that are not (indirectly) depended on by any explicitly installed package')
+    menu('rdeps', help='List packages that depend on any of the target packages')
+    menu('reconcile', help='Compare the package directories in the root against the database, reporting packages that are not in the database,'
+                           ' and database entries whose package directories are missing or invalid')
+    menu('batch', help='Run the operations in each target file (or stdin, if none are given) under one lock, writing the database once;'
+                       ' each line is an action (such as "asdeps" or "asexplicit") followed by its targets')
     ap.add_argument('--ignore-missing', help='Don\'t fail if any target packages are missing from the database', action='store_true')
-    ap.add_argument('targets', nargs='*', help='Package IDs to target')
+    ap.add_argument('--recursive', help='With --rdeps, also list packages that depend on the target packages indirectly', action='store_true')
+    ap.add_argument('--fix', help='With --reconcile, add untracked packages to the database (as explicitly installed) and remove entries whose packages are missing, in one write', action='store_true')
+    ap.add_argument('-J', '--jobs', type=int, help='With --reconcile, probe package directories on N threads (default: 8)', metavar='N', default=8)
+    ap.add_argument('--checkpoint', type=int, help='With --batch, also write the database after every N operations (on failure, only operations since the last checkpoint are rolled back)', metavar='N', default=0)
+    ap.add_argument('targets', nargs='*', help='Package IDs to target (or files, for --batch)')
+    preutil.database_args(ap)
     # LGTM way to transfer the returned function from `postutil.handle_database()` to `main()`
     if not for_help:
         from .. import postutil
@@ -28,9 +48,12 @@ def fill(ap: argparse.ArgumentParser, for_help: bool):
                         action=preutil.RaiseAction, const=TypeError(f'Why would you do this{"‽" if sys.getdefaultencoding() == "utf-8" else "?!"}'))
 def main(ep: types.ModuleType, args: argparse.Namespace):
     db = getattr(args, '%dbgetter%')(args)
-    preutil.eprint('Obtaining database lock...')
+    shared = (args.action in shared_actions) or ((args.action == 'reconcile') and not args.fix)
+    preutil.eprint(f'Obtaining {"shared" if shared else "exclusive"} database lock...')
     try:
-        with db: actions[args.action](args, db)
+        with db.shared() if shared else db:
+            preutil.eprint(f'Obtained database lock after {db.flock.last_wait:.3f}s')
+            with trace.span(f'database.{args.action}'): actions[args.action](args, db)
     finally:
         preutil.eprint('Database lock (should have) successfully released')
 
@@ -39,41 +62,188 @@ def _action_check(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
     if args.targets:
         preutil.eprint('Error: extraneous arguments ("targets" should not be supplied with -k/--check)')
         raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.DATABASE)
-    preutil.eprint('Reading database')
-    state = db.read()
-    preutil.eprint('Generating checksum')
-    chksum = state.mkchksum()
-    print(f'Reported:   {FlexiLynx.core.util.base85.encode(state.chksum)}')
-    print(f'Calculated: {FlexiLynx.core.util.base85.encode(chksum)}')
-    if state.chksum == chksum:
+    preutil.eprint('Checking database')
+    reported,calculated = db.check()
+    print(f'Reported:   {FlexiLynx.core.util.base85.encode(reported)}')
+    print(f'Calculated: {FlexiLynx.core.util.base85.encode(calculated)}')
+    if reported == calculated:
         print('Checksums match')
         return
     print('Checksums do not match')
-    raise parsers.DoExit(parsers.ExitCode.GENERIC | prasers.ErrorLocation.DATABASE)
+    raise parsers.DoExit(parsers.ExitCode.GENERIC | parsers.ErrorLocation.DATABASE)
 
+def _installed(state: 'postutil.fmlib.db.State', targets: typing.Iterable[str], ignore_missing: bool) -> set[str]:
+    targets = set(targets)
+    if missing := state.missing(targets):
+        preutil.eprint(f'Some targets are not installed:\n{", ".join(missing)}')
+        if not ignore_missing:
+            preutil.eprint('Error: some targets are not installed (pass --ignore-missing to ignore)')
+            raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.DATABASE)
+        targets -= missing
+    return targets
+def _mark(expl: bool, state: 'postutil.fmlib.db.State', targets: typing.Iterable[str], ignore_missing: bool,
+          graph: typing.ForwardRef('postutil.fmlib.graph.DepGraph') | None = None) -> bool:
+    return bool(state.move(_installed(state, targets, ignore_missing), expl))
 def _action_as_(expl: bool, args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
     if not args.targets:
         preutil.eprint('Nothing to do')
         return
-    targets = set(args.targets)
     preutil.eprint('Reading database')
     state = db.read()
-    missing = targets - (state.expl.keys() | state.deps.keys())
-    if missing:
-        preutil.eprint(f'Some targets are not installed:\n{", ".join(missing)}')
-        if not args.ignore_missing:
-            preutil.eprint('Error: some targets are not installed (pass --ignore-missing to ignore)')
-            raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.DATABASE)
-        targets -= missing
-    targets -= (state.expl.keys() if expl else state.deps.keys())
-    if not targets:
+    if not _mark(expl, state, args.targets, args.ignore_missing):
         preutil.eprint('Nothing to do')
         return
-    pop = (state.deps if expl else state.expl).pop
-    (state.expl if expl else state.deps).update(zip(targets, map(pop, targets)))
     preutil.eprint('Writing database')
     db.write(state)
 
+def _link(link: bool, state: 'postutil.fmlib.db.State', targets: typing.Sequence[str], ignore_missing: bool,
+          graph: typing.ForwardRef('postutil.fmlib.graph.DepGraph') | None = None) -> bool:
+    from .. import postutil
+    if not targets: return False
+    id,*deps = targets
+    if not _installed(state, (id,), ignore_missing): return False
+    old = frozenset(state.edges.get(id, ()))
+    if link:
+        deps = _installed(state, deps, ignore_missing)
+        if cyclic := deps & ((postutil.fmlib.graph.DepGraph(state.edges) if graph is None else graph).rdeps((id,), recursive=True) | {id}):
+            preutil.eprint(f'Error: {id} cannot depend on {", ".join(sorted(cyclic))}, as it would create a dependency cycle')
+            raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.DATABASE)
+        new = old | deps
+    else: new = (old - set(deps)) if deps else frozenset()
+    if new == old: return False
+    if new: state.edges[id] = tuple(sorted(new))
+    else: del state.edges[id]
+    if graph is not None: graph.update({id: new})
+    return True
+def _action_link(link: bool, args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    if not args.targets:
+        preutil.eprint('Nothing to do')
+        return
+    preutil.eprint('Reading database')
+    state = db.read()
+    if not _link(link, state, args.targets, args.ignore_missing):
+        preutil.eprint('Nothing to do')
+        return
+    preutil.eprint('Writing database')
+    db.write(state)
+
+def _action_orphans(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    if args.targets:
+        preutil.eprint('Error: extraneous arguments ("targets" should not be supplied with --orphans)')
+        raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.DATABASE)
+    preutil.eprint('Reading database')
+    state = db.read(readonly=True)
+    graph = db.graph()
+    orphans = graph.orphans(state.expl.keys(), state.deps.keys())
+    preutil.eprint(f'Found {len(orphans)} orphan(s), listed in removal order')
+    if orphans: print('\n'.join(graph.order(orphans, remove=True)))
+def _action_rdeps(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    if not args.targets:
+        preutil.eprint('Nothing to do')
+        return
+    preutil.eprint('Reading database')
+    state = db.read(readonly=True)
+    graph = db.graph()
+    rdeps = graph.rdeps(_installed(state, args.targets, args.ignore_missing), recursive=args.recursive)
+    preutil.eprint(f'Found {len(rdeps)} {"(indirect) " if args.recursive else ""}reverse-dependenc{"y" if len(rdeps) == 1 else "ies"}, listed in removal order')
+    if rdeps: print('\n'.join(graph.order(rdeps, remove=True)))
+
+def _action_reconcile(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    from .. import postutil
+    if args.targets:
+        preutil.eprint('Error: extraneous arguments ("targets" should not be supplied with --reconcile)')
+        raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.DATABASE)
+    preutil.eprint(f'Scanning {args.root} for packages')
+    with trace.span('database.reconcile.scan', jobs=args.jobs) as attrs:
+        found = postutil.fmlib.packages.scan_root(args.root, jobs=args.jobs)
+        attrs['packages'] = len(found)
+    preutil.eprint(f'Found {len(found)} package(s)')
+    preutil.eprint('Reading database')
+    state = db.read(readonly=not args.fix)
+    misplaced = {n: id for n,id in found.items() if postutil.fmlib.packages.id_to_name(id) != n}
+    present = {id for n,id in found.items() if n not in misplaced}
+    untracked = sorted(present - state.expl.keys() - state.deps.keys())
+    missing = sorted((state.expl.keys() | state.deps.keys()) - present - set(misplaced.values())) # misplaced packages are still installed, just not where they should be
+    for n,id in sorted(misplaced.items()):
+        print(f'? {id} ({args.root/n}, expected {args.root/postutil.fmlib.packages.id_to_name(id)})')
+    for id in untracked: print(f'+ {id} ({args.root/postutil.fmlib.packages.id_to_name(id)})')
+    for id in missing: print(f'- {id} ({args.root/postutil.fmlib.packages.id_to_name(id)})')
+    preutil.eprint(f'{len(untracked)} untracked package(s), {len(missing)} missing package(s), {len(misplaced)} misplaced package(s)')
+    if not (untracked or missing):
+        if misplaced:
+            preutil.eprint('Error: misplaced packages must be moved (or removed) by hand')
+            raise parsers.DoExit(parsers.ExitCode.INVALID | parsers.ErrorLocation.PACKAGE)
+        return
+    if not args.fix:
+        preutil.eprint('Error: the database does not match the root (pass --fix to fix it)')
+        raise parsers.DoExit(parsers.ExitCode.GENERIC | parsers.ErrorLocation.DATABASE)
+    for id in untracked: state.expl[id] = False
+    for id in missing:
+        state.expl.pop(id, None)
+        state.deps.pop(id, None)
+        state.edges.pop(id, None)
+    ## remove the edges that other packages have to missing ones
+    gone = set(missing)
+    for id,deps in tuple(state.edges.items()):
+        if gone.isdisjoint(deps): continue
+        if kept := tuple(dep for dep in deps if dep not in gone): state.edges[id] = kept
+        else: del state.edges[id]
+    preutil.eprint('Writing database')
+    db.write(state)
+
+def _action_batch(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    from .. import postutil
+    ops = []
+    for src in (args.targets or ('-',)):
+        try: lines = (sys.stdin.read() if src == '-' else Path(src).read_text()).splitlines()
+        except OSError as e:
+            preutil.eprint(f'Error: could not read batch file {src}: {e}')
+            raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.NONE)
+        for lineno,line in enumerate(lines, 1):
+            if not (line := line.strip()) or line.startswith('#'): continue
+            try: op,*targets = shlex.split(line)
+            except ValueError as e: # such as an unbalanced quote
+                preutil.eprint(f'Error: could not parse batch line at {src}:{lineno}: {e}')
+                raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.NONE)
+            if op not in batch_actions:
+                preutil.eprint(f'Error: unknown batch action {op!r} at {src}:{lineno} (expected one of: {", ".join(batch_actions)})')
+                raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.NONE)
+            ops.append((f'{src}:{lineno}', op, targets))
+    if not ops:
+        preutil.eprint('Nothing to do')
+        return
+    preutil.eprint('Reading database')
+    state = db.read()
+    # the dependency graph is built once, and kept up to date by each operation
+    graph = postutil.fmlib.graph.DepGraph(state.edges) if any(op in {'link', 'unlink'} for _,op,_ in ops) else None
+    dirty = 0
+    for n,(where,op,targets) in enumerate(ops, 1):
+        try: changed = batch_actions[op](state, targets, args.ignore_missing, graph)
+        except parsers.DoExit:
+            preutil.eprint(f'Error: batch failed at {where}, rolling back {dirty} uncommitted change(s)')
+            raise
+        dirty += changed
+        if dirty and args.checkpoint and not (n % args.checkpoint):
+            preutil.eprint(f'Writing database (checkpoint after {n} operation(s))')
+            db.write(state)
+            dirty = 0
+    if not dirty:
+        preutil.eprint(f'Ran {len(ops)} operation(s), nothing to write')
+        return
+    preutil.eprint(f'Writing database after {len(ops)} operation(s)')
+    db.write(state)
+
+shared_actions = {'check', 'orphans', 'rdeps'}
 actions = {'check': _action_check,
            'asdeps': partial(_action_as_, False),
-           'asexplicit': partial(_action_as_, True)}
+           'asexplicit': partial(_action_as_, True),
+           'link': partial(_action_link, True),
+           'unlink': partial(_action_link, False),
+           'orphans': _action_orphans,
+           'rdeps': _action_rdeps,
+           'reconcile': _action_reconcile,
+           'batch': _action_batch}
+batch_actions = {'asdeps': partial(_mark, False),
+                 'asexplicit': partial(_mark, True),
+                 'link': partial(_link, True),
+                 'unlink': partial(_link, False)}
@@ -1,32 +1,43 @@
 #!/bin/python3
 
 #> Imports
+import sys
 import json
 import types
 import typing
 import argparse
 import traceback
 import contextlib
+import collections
 
 from .. import preutil
 from .. import parsers
+from fmlib import trace
 #</Imports
 
 #> Header >/
-__all__ = ('fill', 'main', 'actions')
+__all__ = ('CAPABILITIES', 'ID_ACTIONS', 'fill', 'main', 'actions', 'ndjson_actions')
+
+CAPABILITIES = ('core.util.pack', 'core.util.hashtools', 'core.util.parallel', 'core.util.frozenorderedset', 'core.frameworks.blueprint')
+ID_ACTIONS = frozenset(('list', 'list-all', 'verify')) # actions whose targets are package IDs (for shell completion)
 
 def fill(ap: argparse.ArgumentParser, for_help: bool):
     menu = ap.add_mutually_exclusive_group(required=True)
     preutil.menu_arg(menu, 'action', 'list', '-l')
     preutil.menu_arg(menu, 'action', 'list-all', '-a', help='Like -l/--list, but output all files mentioned in the package\'s blueprint as well')
+    preutil.menu_arg(menu, 'action', 'verify', '-V', help='Check that the files tracked by each package match the hashes in its blueprint')
     # general
     ap.add_argument('-p', '--as-path', help='Treat targets as paths to packages, rather than package IDs (note that this will stop the loading of the packages database)')
     ap.add_argument('--ignore-missing', help='Ignore missing paths/packages--simply do not output', action='store_true')
-    ap.add_argument('--ignore-invalid', help='Ignore packages that fail to load')
+    ap.add_argument('--ignore-invalid', help='Ignore packages that fail to load', action='store_true')
+    ap.add_argument('-J', '--jobs', type=int, help='Load up to N packages concurrently, and hash files on N processes with -V/--verify (default: 1)', metavar='N', default=1)
     ap.add_argument('targets', nargs='*')
     #listg = ap.add_argument_group('List', 'Arguments specific to -l/--list') # left for possible need in the future
     ap.add_argument('-j', '--json', help='Output in JSON format', action='store_true')
+    ap.add_argument('--ndjson', help='Stream output in newline-delimited JSON format, one record per file, as packages are loaded (overrides -j/--json and --one-as-multi)', action='store_true')
+    ap.add_argument('--no-hash-cache', help='With -V/--verify, hash every file, rather than reusing the hashes of files that did not change since they were last hashed', action='store_true')
     ap.add_argument('--one-as-multi', help='Output a single package in the same format as when outputting multiple packages', action='store_true')
+    preutil.database_args(ap)
     # LGTM way to transfer the returned function from `postutil.handle_database()` to `main()`
     if not for_help:
         from .. import postutil
@@ -36,9 +47,11 @@ def main(ep: types.ModuleType, args: argparse.Namespace):
     if args.as_path: db = None
     else:
         db = getattr(args, '%dbgetter%')(args)
-        preutil.eprint('Obtaining database lock...')
+        preutil.eprint('Obtaining shared database lock...')
     try:
-        with contextlib.nullcontext() if (db is None) else db: main2(args, db)
+        with contextlib.nullcontext() if (db is None) else db.shared():
+            if db is not None: preutil.eprint(f'Obtained database lock after {db.flock.last_wait:.3f}s')
+            main2(args, db)
     finally:
         if db is not None: preutil.eprint('Database lock (should have) successfully released')
 def main2(args: argparse.Namespace, db: typing.ForwardRef('postutil.fmlib.db.Controller') | None):
@@ -50,9 +63,8 @@ def main2(args: argparse.Namespace, db: typing.ForwardRef('postutil.fmlib.db.Con
         return
     if args.as_path: targets = dict(zip(targets, map(Path, targets)))
     else:
-        preutil.eprint('Reading database...')
-        state = db.read()
-        missing = targets - (state.expl | state.deps)
+        preutil.eprint('Looking up targets in database...')
+        missing = targets - db.lookup(targets).keys()
         if missing:
             preutil.eprint(f'Some targets are missing from the database:\n{", ".join(missing)}')
             if not args.ignore_missing:
@@ -67,23 +79,54 @@ def main2(args: argparse.Namespace, db: typing.ForwardRef('postutil.fmlib.db.Con
         if not args.ignore_missing:
             preutil.eprint('Error: cannot continue when targeted package directories are missing (pass --ignore-missing to ignore')
             raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.PACKAGE)
-    packages = {}
-    for id,path in exists.items():
-        try:
-            packages[id] = FlexiLynx.core.frameworks.blueprint.Package(path)
-        except FileNotFoundError as fnfe:
+    loaded = _iter_loaded(args, exists)
+    if args.ndjson:
+        with trace.span(f'files.{args.action}', ndjson=True): ndjson_actions[args.action](args, db, loaded)
+        return
+    with trace.span('files.load', jobs=args.jobs) as attrs:
+        packages = dict(loaded)
+        attrs['packages'] = len(packages)
+    preutil.eprint(f'Loaded {len(packages)} package(s)')
+    with trace.span(f'files.{args.action}'): actions[args.action](args, db, packages)
+
+def _load_package(path: 'Path') -> tuple[typing.ForwardRef('FlexiLynx.core.frameworks.blueprint.Package') | None, Exception | None]:
+    from .. import postutil
+    try: return (postutil.package_cache.load(path), None)
+    except Exception as e: return (None, e)
+def _iter_loaded(args: argparse.Namespace, paths: dict[str, 'Path']) -> typing.Iterator[tuple[str, 'FlexiLynx.core.frameworks.blueprint.Package']]:
+    failed = 0
+    for id,path,pkg,e in _load_packages(args.jobs, paths):
+        if e is None:
+            yield (id, pkg)
+            continue
+        if isinstance(e, FileNotFoundError):
             preutil.eprint(f'Could not load package {id} (from {path}), as it does not have a blueprint:')
-            preutil.eprint((''.join(traceback.format_exc_only(e))).strip())
             ec = parsers.ExitCode.MISSING | parsers.ErrorLocation.BLUEPRINT
-        except Exception as e:
+        else:
             preutil.eprint(f'Could not load package {id} (from {path}):')
-            preutil.eprint((''.join(traceback.format_exc_only(e))).strip())
             ec = parsers.ExitCode.INVALID | parsers.ErrorLocation.PACKAGE
-        else: continue
-        preutil.eprint('Error: cannot continue after failing to load package (pass --ignore-invalid to ignore)')
-        raise parsers.DoExit(ec)
-    preutil.eprint(f'Loaded {len(packages)} package(s)')
-    actions[args.action](args, db, packages)
+        preutil.eprint((''.join(traceback.format_exception_only(e))).strip())
+        if not args.ignore_invalid:
+            preutil.eprint('Error: cannot continue after failing to load package (pass --ignore-invalid to ignore)')
+            raise parsers.DoExit(ec)
+        failed += 1
+    if failed: preutil.eprint(f'Ignored {failed} package(s) that failed to load')
+def _load_packages(jobs: int, paths: dict[str, 'Path']) -> typing.Iterator[tuple[str, 'Path', typing.ForwardRef('FlexiLynx.core.frameworks.blueprint.Package') | None, Exception | None]]:
+    '''Loads packages, on a pool of `jobs` threads if `jobs` is more than 1, yielding them in the order of `paths`'''
+    if jobs <= 1:
+        for id,path in paths.items(): yield (id, path, *_load_package(path))
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(jobs, thread_name_prefix='fleximan-load') as pool:
+        pending = collections.deque()
+        for id,path in paths.items():
+            pending.append((id, path, pool.submit(_load_package, path)))
+            if len(pending) < (jobs * 2): continue # keep a bounded window of packages in flight
+            id,path,fut = pending.popleft()
+            yield (id, path, *fut.result())
+        while pending:
+            id,path,fut = pending.popleft()
+            yield (id, path, *fut.result())
 
 def _action_list(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller', packages: dict[str, 'FlexiLynx.core.frameworks.blueprint.Package']):
     if not packages:
@@ -102,34 +145,80 @@ def _action_list_all(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller
     if not packages:
         print('{}' if args.json else 'No packages selected')
         return
-    def process(p: 'Package') -> dict:
-        files = set(p.blueprint.main.files.keys()) | p.files
-        if p.blueprint.drafts:
-            for d in p.blueprint.drafts.values():
-                files |= d.files.keys()
-        return {f: {
-            'full': str(p.at/f),
-            'installed': (p.at/f).exists(),
-            'tracked': (f in p.files),
-            'main': (f in p.blueprint.main.files),
-            'drafts': tuple(did for did,d in p.blueprint.drafts.items() if f in d),
-        } for f in sorted(files)}
-    def printp(prcd: dict):
-        if prcd: print('\n'.join(f'{f}: {p["full"]}\nIs installed: {p["installed"]}\nIs tracked: {p["tracked"]}\n'
-                                 f'Is main: {p["main"]}\nIn drafts: {", ".join(map(repr, p["drafts"])) if p["drafts"] else "N/A"}' for f,p in prcd.items()))
-        else: print('The package\'s blueprint does not mention any files')
+    from .. import postutil
+    report = postutil.fmlib.packages.iter_file_report
+    def printp(pkg: 'FlexiLynx.core.frameworks.blueprint.Package'):
+        empty = True
+        for f,p in report(pkg):
+            empty = False
+            print(f'{f}: {p["full"]}\nIs installed: {p["installed"]}\nIs tracked: {p["tracked"]}\n'
+                  f'Is main: {p["main"]}\nIn drafts: {", ".join(map(repr, p["drafts"])) if p["drafts"] else "N/A"}')
+        if empty: print('The package\'s blueprint does not mention any files')
     if (not args.one_as_multi) and (len(packages) == 1):
-        prcd = process(packages.popitem()[1])
-        if args.json: print(json.dumps(prcd))
-        else: printp(prcd)
+        pkg = packages.popitem()[1]
+        if args.json: print(json.dumps(dict(report(pkg))))
+        else: printp(pkg)
         return
-    from FlexiLynx.core.util.maptools import map_vals
-    prcd = map_vals(process, packages)
     if args.json:
-        print(json.dumps(prcd))
+        print(json.dumps({id: dict(report(pkg)) for id,pkg in packages.items()}))
         return
-    for pkg,prc in prcd.items():
-        print(f'{pkg}:')
-        printp(prc)
+    for id,pkg in packages.items():
+        print(f'{id}:')
+        printp(pkg)
+
+_VERIFY_PROBLEMS = frozenset(('modified', 'missing'))
+def _iter_verified(args: argparse.Namespace, packages: typing.Iterable[tuple[str, 'FlexiLynx.core.frameworks.blueprint.Package']]) -> typing.Iterator[tuple[str, dict[str, str]]]:
+    from .. import postutil
+    cache = None if args.no_hash_cache else postutil.fmlib.verify.HashCache(
+        args.root / postutil.fmlib.cache.BlueprintCache.DEFAULT_DIRNAME / postutil.fmlib.verify.HashCache.DEFAULT_FILENAME)
+    with postutil.fmlib.verify.Verifier(jobs=args.jobs, cache=cache) as verifier:
+        for id,pkg in packages: yield (id, verifier.check(pkg))
+    if cache is not None: cache.save()
+    preutil.eprint(f'Verified {verifier.files} file(s), hashing {verifier.hashed} ({verifier.bytes_hashed / 1_000_000:.1f} MB'
+                   f' in {verifier.hash_time:.3f}s, {verifier.throughput:.1f} MB/s) and reusing the hashes of {verifier.cached} unchanged file(s)')
+def _verify_failed(problems: int):
+    if not problems: return
+    preutil.eprint(f'Error: {problems} file(s) are modified or missing')
+    raise parsers.DoExit(parsers.ExitCode.INVALID | parsers.ErrorLocation.PACKAGE)
+def _action_verify(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller', packages: dict[str, 'FlexiLynx.core.frameworks.blueprint.Package']):
+    if not packages:
+        print('{}' if args.json else 'No packages selected')
+        return
+    results = dict(_iter_verified(args, packages.items()))
+    problems = sum(st in _VERIFY_PROBLEMS for statuses in results.values() for st in statuses.values())
+    if args.json:
+        print(json.dumps(next(iter(results.values())) if (not args.one_as_multi) and (len(results) == 1) else results))
+    else:
+        for id,statuses in results.items():
+            for f,st in statuses.items():
+                if st != 'ok': print(f'{id}: {f}: {st}')
+            print(f'{id}: {len(statuses)} file(s), {sum(st in _VERIFY_PROBLEMS for st in statuses.values())} modified or missing')
+    _verify_failed(problems)
+
+def _write_ndjson(records: typing.Iterable[dict]):
+    sys.stdout.flush()
+    out = sys.stdout.buffer
+    for rec in records:
+        out.write(json.dumps(rec).encode())
+        out.write(b'\n')
+    out.flush()
+def _ndjson_list(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller', packages: typing.Iterable[tuple[str, 'FlexiLynx.core.frameworks.blueprint.Package']]):
+    _write_ndjson({'id': id, 'file': str(f)} for id,pkg in packages for f in pkg.files)
+def _ndjson_list_all(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller', packages: typing.Iterable[tuple[str, 'FlexiLynx.core.frameworks.blueprint.Package']]):
+    from .. import postutil
+    _write_ndjson({'id': id, 'file': str(f)} | rep for id,pkg in packages
+                  for f,rep in postutil.fmlib.packages.iter_file_report(pkg))
+
+def _ndjson_verify(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller', packages: typing.Iterable[tuple[str, 'FlexiLynx.core.frameworks.blueprint.Package']]):
+    problems = 0
+    def records() -> typing.Iterator[dict]:
+        nonlocal problems
+        for id,statuses in _iter_verified(args, packages):
+            for f,st in statuses.items():
+                problems += st in _VERIFY_PROBLEMS
+                yield {'id': id, 'file': f, 'status': st}
+    _write_ndjson(records())
+    _verify_failed(problems)
 
-actions = {'list': _action_list, 'list-all': _action_list_all}
+actions = {'list': _action_list, 'list-all': _action_list_all, 'verify': _action_verify}
+ndjson_actions = {'list': _ndjson_list, 'list-all': _ndjson_list_all, 'verify': _ndjson_verify}
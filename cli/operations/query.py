@@ -0,0 +1,113 @@
+#!/bin/python3
+
+#> Imports
+import re
+import sys
+import json
+import types
+import typing
+import argparse
+import fnmatch
+
+from .. import preutil
+from .. import parsers
+from fmlib import trace
+#</Imports
+
+#> Header >/
+__all__ = ('CAPABILITIES', 'ID_ACTIONS', 'fill', 'main', 'actions')
+
+CAPABILITIES = ('core.util.pack', 'core.util.hashtools', 'core.util.parallel', 'core.frameworks.blueprint')
+ID_ACTIONS = frozenset(('search',)) # actions whose targets are package IDs (for shell completion)
+
+def fill(ap: argparse.ArgumentParser, for_help: bool):
+    menu = ap.add_mutually_exclusive_group(required=True)
+    preutil.menu_arg(menu, 'action', 'owns', '-o', help='Find which package owns each target path')
+    preutil.menu_arg(menu, 'action', 'search', '-s', help='List the packages whose IDs start with any of the target prefixes (or every package, if none are given)')
+    ap.add_argument('--ignore-missing', help='Don\'t fail if any target paths are not owned by a package', action='store_true')
+    # search
+    match = ap.add_mutually_exclusive_group()
+    match.add_argument('--glob', help='With -s/--search, treat targets as glob patterns that must match the whole ID, rather than prefixes', action='store_true')
+    match.add_argument('--regex', help='With -s/--search, treat targets as regular expressions that must match part of the ID, rather than prefixes', action='store_true')
+    kind = ap.add_mutually_exclusive_group()
+    kind.add_argument('--explicit', help='With -s/--search, only list explicitly installed packages', action='store_true')
+    kind.add_argument('--deps', help='With -s/--search, only list packages installed as dependencies', action='store_true')
+    plugin = ap.add_mutually_exclusive_group()
+    plugin.add_argument('--plugins', help='With -s/--search, only list plugins', action='store_true')
+    plugin.add_argument('--no-plugins', help='With -s/--search, only list packages that are not plugins', action='store_true')
+    # output
+    ap.add_argument('-j', '--json', help='Output in JSON format', action='store_true')
+    ap.add_argument('--ndjson', help='With -s/--search, stream output in newline-delimited JSON format, one record per package (overrides -j/--json)', action='store_true')
+    ap.add_argument('targets', nargs='*')
+    preutil.database_args(ap)
+    # LGTM way to transfer the returned function from `postutil.handle_database()` to `main()`
+    if not for_help:
+        from .. import postutil
+        ap.add_argument('--%dbgetter%', help=argparse.SUPPRESS, default=postutil.handle_database(ap, False),
+                        action=preutil.RaiseAction, const=LookupError('Not here'))
+def main(ep: types.ModuleType, args: argparse.Namespace):
+    db = getattr(args, '%dbgetter%')(args)
+    preutil.eprint('Obtaining shared database lock...')
+    try:
+        with db.shared():
+            preutil.eprint(f'Obtained database lock after {db.flock.last_wait:.3f}s')
+            with trace.span(f'query.{args.action}'): actions[args.action](args, db)
+    finally:
+        preutil.eprint('Database lock (should have) successfully released')
+
+def _action_owns(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    from .. import postutil
+    if not args.targets:
+        preutil.eprint('Nothing to do')
+        return
+    preutil.eprint('Reading database')
+    state = db.read(readonly=True)
+    preutil.eprint('Refreshing file owner index')
+    index = postutil.fmlib.owners.OwnerIndex(db.path, args.root)
+    if index.refresh(state.expl.keys() | state.deps.keys()):
+        preutil.eprint('Saving file owner index')
+        index.save()
+    owners = {t: index.owner(t) for t in args.targets}
+    if args.json: print(json.dumps(owners))
+    else: print('\n'.join(f'{t}: {"not owned by any package" if o is None else o}' for t,o in owners.items()))
+    if (unowned := sum(o is None for o in owners.values())) and not args.ignore_missing:
+        preutil.eprint(f'Error: {unowned} target(s) are not owned by any package (pass --ignore-missing to ignore)')
+        raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.PACKAGE)
+
+def _prefixes(args: argparse.Namespace) -> tuple[set[str], typing.Callable[[str], bool] | None]:
+    if not args.targets: return ({''}, None)
+    if args.regex:
+        try: pattern = re.compile('|'.join(f'(?:{t})' for t in args.targets))
+        except re.error as e:
+            preutil.eprint(f'Error: invalid regular expression: {e}')
+            raise parsers.DoExit(parsers.ExitCode.USAGE | parsers.ErrorLocation.NONE)
+        return ({''}, pattern.search)
+    if args.glob: # only the IDs starting with each pattern's literal prefix need to be matched
+        pattern = re.compile('|'.join(f'(?:{fnmatch.translate(t)})' for t in args.targets))
+        return ({re.split(r'[*?[]', t, maxsplit=1)[0] for t in args.targets}, pattern.match)
+    return (set(args.targets), None)
+def _iter_search(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller') -> typing.Iterator[tuple[str, bool, bool]]:
+    prefixes,match = _prefixes(args)
+    prefixes = sorted(prefixes)
+    prefixes = [p for i,p in enumerate(prefixes) if not any(p.startswith(q) for q in prefixes[:i])] # overlapping prefixes would be searched twice
+    found = {}
+    for prefix in prefixes: found.update(db.search(prefix))
+    for id,(expl,plugin) in sorted(found.items()):
+        if (args.explicit and not expl) or (args.deps and expl) \
+           or (args.plugins and not plugin) or (args.no_plugins and plugin): continue
+        if (match is None) or match(id): yield (id, expl, plugin)
+def _action_search(args: argparse.Namespace, db: 'postutil.fmlib.db.Controller'):
+    if args.ndjson:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+        for id,expl,plugin in _iter_search(args, db):
+            out.write(json.dumps({'id': id, 'explicit': expl, 'plugin': plugin}).encode())
+            out.write(b'\n')
+        out.flush()
+        return
+    found = tuple(_iter_search(args, db))
+    preutil.eprint(f'Found {len(found)} package(s)')
+    if args.json: print(json.dumps({id: {'explicit': expl, 'plugin': plugin} for id,expl,plugin in found}))
+    elif found: print('\n'.join(id for id,_,_ in found))
+
+actions = {'owns': _action_owns, 'search': _action_search}
@@ -40,7 +40,7 @@ ErrorLocation = IntEnum('ErrorLocation', {
 })
 
 # Parser
-operations = {'database': 'D', 'files': 'F'}
+operations = {'database': 'D', 'files': 'F', 'query': 'Q'}
 pre_parser = argparse.ArgumentParser(add_help=False)
 ## Options
 fl_apgroup = pre_parser.add_argument_group('FlexiLynx', 'Configuration for FlexiLynx and its entrypoint')
@@ -53,6 +53,13 @@ _menu = functools.partial(preutil.menu_arg, _menu, 'op')
 for long,short in operations.items():
     _menu(long, f'-{short}')
 del _menu
+## Daemon
+pre_parser.add_argument('--serve', type=Path, help='Keep FlexiLynx up and serve operations from fleximanc.py over a Unix socket at PATH', metavar='PATH', default=None)
+## Instrumentation
+pre_parser.add_argument('--timings', help='Write a JSON object to stderr for each timed phase (span) of the run, as it finishes', action='store_true')
+pre_parser.add_argument('--profile', type=Path, help='Profile the whole run with cProfile, writing the pstats output to PATH', metavar='PATH', default=None)
+## Completion
+pre_parser.add_argument('--completion', choices=('bash', 'zsh', 'fish'), help='Print a completion script for SHELL, which completes package IDs without bringing FlexiLynx up', metavar='SHELL', default=None)
 ## Help
 pre_parser.add_argument('-h', '--help', action='store_true')
 
@@ -14,14 +14,14 @@ import FlexiLynx
 
 #> Header >/
 __all__ = ('fmlib',
-           'handle_database')
+           'handle_database', 'controller',
+           'package_cache')
 
 from fmlib import total_autobind as fmlib
 
 # Argparse
 def handle_database(ap: argparse.ArgumentParser, ensure_exists: bool = True) -> typing.Callable[[argparse.Namespace], fmlib.db.Controller]:
-    # add arguments
-    ap.add_argument('-b', '--dbpath', type=Path, help='Set an alternative database directory', metavar='PATH', default=None)
+    '''Returns a function that gets the `fmlib.db.Controller` selected by the arguments that `preutil.database_args()` added to `ap`'''
     # create and return handler
     def database_handler(args: argparse.Namespace) -> fmlib.db.Controller:
         dbpath = args.root if args.dbpath is None else args.dbpath
@@ -34,5 +34,23 @@ def handle_database(ap: argparse.ArgumentParser, ensure_exists: bool = True) ->
                 preutil.eprint('Error: an existing database file is required')
                 raise parsers.DoExit(parsers.ExitCode.MISSING | parsers.ErrorLocation.DATABASE)
             preutil.eprint('It will be created if modifications are made')
-        return fmlib.db.Controller(dbpath)
+        ctl = controller(dbpath, compact_state=args.compact_state)
+        ctl.durability = args.durability
+        ctl.verify_reads = args.verify_reads
+        return ctl
     return database_handler
+
+# Database
+_controllers = {}
+def controller(dbpath: Path, *, compact_state: bool = False) -> fmlib.db.Controller:
+    '''
+        Returns the `fmlib.db.Controller` for `dbpath` (see `help(fmlib.db.Controller)` for `compact_state`),
+            reusing it (and its cache) across operations run within the same process, such as by the daemon
+    '''
+    key = (dbpath.resolve(), compact_state)
+    if key not in _controllers:
+        _controllers[key] = fmlib.db.Controller(key[0], compact_state=compact_state)
+    return _controllers[key]
+
+# Packages
+package_cache = fmlib.packages.PackageCache()
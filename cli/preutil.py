@@ -2,23 +2,29 @@
 
 #> Imports
 import sys
+import json
 import types
+import typing
 import argparse
 import functools
+import contextlib
+from pathlib import Path
 from importlib import util as iutil
 #</Imports
 
 #> Header >/
 __all__ = ('eprint',
-           'menu_arg', 'RaiseAction',
-           'exec_entrypoint')
+           'menu_arg', 'RaiseAction', 'database_args',
+           'timings', 'profile',
+           'exec_entrypoint', 'check_capabilities')
 
 # IO
-eprint = functools.partial(print, file=sys.stderr)
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs) # `sys.stderr` is looked up on each call, so that it may be redirected
 
 # Argparse
-def menu_arg(ap: argparse.ArgumentParser, dest: str, name: str, short: str, **kwargs):
-    ap.add_argument(short, f'--{name}', dest=dest, action='store_const', const=name, **kwargs)
+def menu_arg(ap: argparse.ArgumentParser, dest: str, name: str, short: str | None = None, **kwargs):
+    ap.add_argument(*(() if short is None else (short,)), f'--{name}', dest=dest, action='store_const', const=name, **kwargs)
 
 class RaiseAction(argparse.Action):
     __slots__ = ('_exc',)
@@ -28,6 +34,33 @@ class RaiseAction(argparse.Action):
     def __call__(self, *args):
         raise self._exc
 
+def database_args(ap: argparse.ArgumentParser):
+    '''Adds the arguments that select and configure the database (see `postutil.handle_database()`) to `ap`'''
+    from fmlib import db
+    ap.add_argument('-b', '--dbpath', type=Path, help='Set an alternative database directory', metavar='PATH', default=None)
+    ap.add_argument('--durability', choices=db.Controller.DURABILITY_LEVELS, help='Which database writes to fsync: none, the written files, or the written files and the database directory (default)',
+                    default=db.Controller.DURABILITY_FULL)
+    ap.add_argument('--compact-state', help='Hold the database in a compact representation, which is faster and smaller for very large databases', action='store_true')
+    ap.add_argument('--verify-reads', help='Check each database snapshot against its checksum when it is read (hashing every entry), and recover from the backup if it does not match', action='store_true')
+
+# Instrumentation
+@contextlib.contextmanager
+def timings() -> typing.Iterator[None]:
+    '''Writes each `fmlib.trace.Span` that finishes within the context to stderr, as a line of JSON'''
+    from fmlib import trace
+    with trace.hooked(lambda s: eprint(json.dumps(s.asdict(), default=str))): yield
+@contextlib.contextmanager
+def profile(path: Path) -> typing.Iterator[None]:
+    '''Profiles the context with `cProfile`, writing the statistics to `path` (in the format read by `pstats`)'''
+    import cProfile
+    prof = cProfile.Profile()
+    prof.enable()
+    try: yield
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
+        eprint(f'Wrote profile to {path} (view it with: {sys.executable} -m pstats {path})')
+
 # FlexiLynx
 runlevels = ('__load__', '__setup__')
 def exec_entrypoint(args: argparse.Namespace) -> types.ModuleType | None:
@@ -37,9 +70,19 @@ def exec_entrypoint(args: argparse.Namespace) -> types.ModuleType | None:
     if args.runlevel < 2:
         eprint(f'Warning: runlevel {args.runlevel} will {"probably " if args.runlevel == 1 else ""}not work and is purely allowed for semantics')
     if args.runlevel == -1: return None
+    from fmlib import trace
     ep = iutil.spec_from_file_location('<FlexiLynx entrypoint>', ep,
                                        submodule_search_locations=(ep.parent,)).loader.load_module()
     for r in range(0, args.runlevel):
         eprint(f'Calling: <entrypoint>.{runlevels[r]}()')
-        getattr(ep, runlevels[r])()
+        with trace.span('entrypoint.runlevel', runlevel=r, call=runlevels[r]): getattr(ep, runlevels[r])()
     return ep
+def check_capabilities(caps: typing.Iterable[str]) -> tuple[str, ...]:
+    '''Returns which of `caps` (dotted submodule names, such as `core.util.pack`) are not available from FlexiLynx'''
+    try: import FlexiLynx
+    except ModuleNotFoundError: return tuple(caps)
+    missing = []
+    for cap in caps:
+        try: functools.reduce(getattr, cap.split('.'), FlexiLynx)
+        except AttributeError: missing.append(cap)
+    return tuple(missing)
@@ -2,12 +2,15 @@
 
 #> Imports
 import sys
+import types
 import typing
 import argparse
 import importlib
+import contextlib
 
 from cli import parsers
 from cli import preutil
+from fmlib import trace
 #</Imports
 
 #> Header
@@ -15,32 +18,65 @@ from cli import preutil
 
 #> Main >/
 def main(args: typing.Sequence[str]):
+    if code := run(args): sys.exit(code)
+def run(args: typing.Sequence[str], ep: types.ModuleType | None = None) -> int:
+    '''
+        Runs FlexiMan with the command-line `args`, returning the exit code
+        If `ep` is supplied, it is used as the (already brought-up) FlexiLynx entrypoint
+    '''
     # preprocess args in case of short operation
-    args = parsers.fix_short_operation(args)
+    args = parsers.fix_short_operation(list(args))
     # execute initial preparser
     pre,args = parsers.pre_parser.parse_known_args(args)
+    # instrument the rest of the run if needed
+    with contextlib.ExitStack() as stack:
+        if pre.profile is not None: stack.enter_context(preutil.profile(pre.profile))
+        if pre.timings: stack.enter_context(preutil.timings())
+        with trace.span('fleximan.run', op=pre.op): return _run(pre, args, ep)
+def _run(pre: argparse.Namespace, args: list[str], ep: types.ModuleType | None) -> int:
+    # dispatch completion script if needed
+    if pre.completion is not None:
+        from cli import completion
+        print(completion.script(pre.completion))
+        return 0
     # dispatch main help if needed
-    if pre.help:
-        if pre.op is None:
-            parsers.pre_parser.print_help()
-            return
-    # bring FlexiLynx to the desired runlevel
-    else: ep = preutil.exec_entrypoint(pre)
+    if pre.help and (pre.op is None):
+        parsers.pre_parser.print_help()
+        return 0
+    # dispatch to the daemon if needed
+    if pre.serve is not None:
+        if ep is not None:
+            preutil.eprint('Error: --serve cannot be used from within a daemon')
+            return parsers.ExitCode.USAGE
+        from cli import daemon
+        daemon.serve(pre.serve, preutil.exec_entrypoint(pre), run)
+        return 0
     # dispatch the operation
     ## fetch its module
-    op = importlib.import_module(f'cli.operations.{pre.op}')
+    with trace.span('fleximan.import_operation'): op = importlib.import_module(f'cli.operations.{pre.op}')
+    ## bring FlexiLynx to the desired runlevel
+    if not (pre.help or (ep is not None)):
+        with trace.span('fleximan.entrypoint', runlevel=pre.runlevel): ep = preutil.exec_entrypoint(pre)
+    if (not pre.help) and (missing := preutil.check_capabilities(op.CAPABILITIES)):
+        preutil.eprint(f'Error: FlexiLynx is missing capabilities required by this operation: {", ".join(missing)}')
+        return parsers.ExitCode.GENERIC | parsers.ErrorLocation.ENTRYPOINT
     ## create and fill its parser
-    parser = argparse.ArgumentParser(f'{sys.argv[0]} -{parsers.operations[pre.op]}/--{pre.op}')
-    op.fill(parser, pre.help)
+    with trace.span('fleximan.fill'):
+        parser = argparse.ArgumentParser(f'{sys.argv[0]} -{parsers.operations[pre.op]}/--{pre.op}')
+        op.fill(parser, pre.help)
     ## dispatch operator's help if needed
     if pre.help:
         parser.print_help()
-        return
+        return 0
     ## dispatch to its parser
     args = parser.parse_args(args)
     args.__dict__.update(pre.__dict__)
     ## dispatch to its main
-    try: op.main(ep, args)
-    except parsers.DoExit as e: sys.exit(e.code)
+    with trace.span('fleximan.main', op=pre.op, action=getattr(args, 'action', None)) as attrs:
+        try: op.main(ep, args)
+        except parsers.DoExit as e:
+            attrs['exit'] = e.code
+            return e.code
+    return 0
 
 if __name__ == '__main__': main(sys.argv[1:])
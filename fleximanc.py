@@ -0,0 +1,32 @@
+#!/bin/python3
+
+#> Imports
+import os
+import sys
+import typing
+from pathlib import Path
+
+from cli import daemon
+from cli import parsers
+#</Imports
+
+#> Header
+#</Header
+
+#> Main >/
+def main(args: typing.Sequence[str]):
+    args = list(args)
+    if args[:1] in (['-S'], ['--socket']):
+        path = args[1:2]
+        args = args[2:]
+    else: path = [os.environ[daemon.SOCKET_ENV]] if daemon.SOCKET_ENV in os.environ else []
+    if not path:
+        print(f'Error: a socket must be supplied with -S/--socket PATH (as the first argument), or through ${daemon.SOCKET_ENV}', file=sys.stderr)
+        sys.exit(parsers.ExitCode.USAGE)
+    try: code = daemon.request(Path(path[0]), args)
+    except (ConnectionError, FileNotFoundError) as e:
+        print(f'Error: could not communicate with the daemon at {path[0]}: {e}', file=sys.stderr)
+        sys.exit(parsers.ExitCode.GENERIC)
+    if code: sys.exit(code)
+
+if __name__ == '__main__': main(sys.argv[1:])
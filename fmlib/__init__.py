@@ -4,16 +4,20 @@
 
 VERSION = '1.0.0'
 
+# Whether `total_autobind` builds its bound submodules on first access, rather than on import
+TOTAL_AUTOBIND_LAZY = True
+
 #> Imports
 import sys
 import typing
 import inspect
 import functools
+import importlib
 from types import ModuleType
 #</Imports
 
 #> Package >/
-__all__ = ('VERSION', 'FLType', 'db', 'packages')
+__all__ = ('VERSION', 'FLType', 'cache', 'compact', 'db', 'graph', 'lock', 'owners', 'packages', 'session', 'trace', 'verify')
 
 # Objects
 type FLType = typing.Annotated[ModuleType, 'FlexiLynx']
@@ -41,5 +45,11 @@ class _TotalAutobindStore:
 _total_autobind_store = _TotalAutobindStore()
 
 # Submodules
-from . import db
-from . import packages
+## Imported on first access, so that importing one submodule (such as `trace`, by the CLI) does not import every other
+_SUBMODULES = frozenset(__all__[2:])
+def __getattr__(name: str) -> ModuleType:
+    if name not in _SUBMODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return importlib.import_module(f'.{name}', __name__)
+def __dir__() -> list[str]:
+    return sorted(globals().keys() | _SUBMODULES)
@@ -0,0 +1,161 @@
+#!/bin/python3
+
+'''On-disk cache of fetched blueprints'''
+
+#> Imports
+import os
+import json
+import time
+import typing
+import hashlib
+import threading
+from pathlib import Path
+
+from . import FLType
+from . import _total_autobind_store
+from . import lock
+#</Imports
+
+#> Header >/
+__all__ = ('BlueprintCache',)
+
+@_total_autobind_store.bindable_cls('cache')
+class BlueprintCache:
+    '''
+        A content-addressed, on-disk cache of fetched blueprints, which may be shared between processes (and nodes)
+        Blueprint data is stored under `blobs/` by the hash of its content (and checked against it whenever it is read, being re-fetched if it does not match),
+            and `index.json` maps each URL to the hash of its content, and when it was fetched and last used
+        Cache hits only append to an access log (`access.log`) under a shared file-lock,
+            which is folded into the index whenever it is written (or once the log grows past `ACCESS_LOG_COMPACT_BYTES`)
+        Once the total size of the cached data exceeds `max_size`, the least-recently used entries are evicted
+        If the index cannot be read, the cache is treated as empty, and the index is rebuilt (removing any blobs that it no longer refers to) on the next fetch
+        Access is guarded by a file-lock (`cache.lock`) between processes and `.rlock` between threads,
+            though fetching itself is done without holding either; in-process statistics are kept in `.hits`, `.misses`, and `.evictions`
+    '''
+    __slots__ = ('bound', 'path', 'max_size', 'max_age',
+                 'rlock', 'flock',
+                 'hits', 'misses', 'evictions',
+                 '_parsed')
+
+    DEFAULT_DIRNAME = '.fleximan_cache'
+    INDEX_FILENAME = 'index.json'
+    LOCK_FILENAME = 'cache.lock'
+    BLOB_DIRNAME = 'blobs'
+    ACCESS_LOG_FILENAME = 'access.log'
+    ACCESS_LOG_COMPACT_BYTES = 256 * 1024
+
+    @_total_autobind_store.bindable_meth
+    def __init__(self, fl: FLType, path: Path, *, max_size: int = 64 * 1024 * 1024, max_age: float | None = None):
+        '''
+            Opens (creating if necessary) the cache at `path`, which is conventionally `<root>/.fleximan_cache`
+            If `max_age` is not `None`, then entries older than `max_age` seconds are re-fetched
+        '''
+        self.bound = fl
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        (self.path / self.BLOB_DIRNAME).mkdir(parents=True, exist_ok=True)
+        self.rlock = threading.RLock()
+        self.flock = lock.RWFLock(path/self.LOCK_FILENAME, self.rlock, fallback=self.bound.core.util.parallel.FLock)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._parsed = {}
+
+    # Index
+    def _read_index(self) -> dict[str, dict] | None:
+        '''Returns the index, or `None` if it is unreadable'''
+        try: index = json.loads((self.path / self.INDEX_FILENAME).read_text())
+        except FileNotFoundError: return {}
+        except ValueError: return None
+        return index if isinstance(index, dict) else None
+    def _load_index(self) -> tuple[dict[str, dict], bool]:
+        '''
+            Returns the index with the access log folded into it (which requires the file-lock to be held exclusively),
+                and whether it was unreadable (in which case it is returned empty)
+        '''
+        if damaged := (index := self._read_index()) is None: index = {}
+        try: lines = (self.path / self.ACCESS_LOG_FILENAME).read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError: lines = ()
+        for line in lines:
+            try:
+                url,used = json.loads(line)
+                if url in index: index[url]['used'] = max(index[url]['used'], used)
+            except (ValueError, TypeError): continue # torn append
+        return (index, damaged)
+    def _write_index(self, index: dict[str, dict]):
+        tmp = self.path / f'{self.INDEX_FILENAME}.{os.getpid()}.{threading.get_ident()}.tmp'
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self.path / self.INDEX_FILENAME)
+        (self.path / self.ACCESS_LOG_FILENAME).unlink(missing_ok=True) # now folded into the index
+    def _log_access(self, url: str) -> int:
+        '''Appends an access of `url` to the access log, returning the size of the log'''
+        with (self.path / self.ACCESS_LOG_FILENAME).open('a', encoding='utf-8') as f:
+            f.write(f'{json.dumps([url, time.time()])}\n')
+            return f.tell()
+    def _blob(self, digest: str) -> Path:
+        return self.path / self.BLOB_DIRNAME / digest
+    def _read_blob(self, digest: str) -> bytes | None:
+        '''Returns the data of the blob `digest`, or `None` if it is missing or corrupt (in which case it is removed)'''
+        try: data = self._blob(digest).read_bytes()
+        except FileNotFoundError: return None
+        if hashlib.new(self.bound.core.util.hashtools.ALGORITHM_DEFAULT_LOW, data).hexdigest() == digest: return data
+        self._blob(digest).unlink(missing_ok=True)
+        return None
+    def _sweep(self, index: dict[str, dict]):
+        digests = {e['digest'] for e in index.values()}
+        for blob in (self.path / self.BLOB_DIRNAME).iterdir():
+            if blob.name not in digests: blob.unlink(missing_ok=True)
+    def _evict(self, index: dict[str, dict]):
+        sizes = {e['digest']: e['size'] for e in index.values()}
+        total = sum(sizes.values())
+        for url,entry in sorted(index.items(), key=lambda ue: ue[1]['used']):
+            if total <= self.max_size: break
+            del index[url]
+            self.evictions += 1
+            if any(e['digest'] == entry['digest'] for e in index.values()): continue # blob still referenced by another URL
+            self._blob(entry['digest']).unlink(missing_ok=True)
+            total -= sizes[entry['digest']]
+
+    # Access
+    def fetch(self, url: str, fetchfn: typing.Callable[[str], bytes] | None = None, *, refresh: bool = False) -> tuple[str, bytes]:
+        '''
+            Returns the content hash and data of the blueprint at `url`,
+                only calling `fetchfn` (defaulting to `FlexiLynx.core.util.net.fetch1`) if it is not cached,
+                if it has expired, or if `refresh` is true
+        '''
+        if not refresh:
+            with self.rlock, self.flock.shared():
+                entry = (self._read_index() or {}).get(url)
+                if (entry is not None) and ((self.max_age is None) or ((time.time() - entry['fetched']) <= self.max_age)) \
+                   and ((data := self._read_blob(entry['digest'])) is not None):
+                    self.hits += 1
+                    if self._log_access(url) > self.ACCESS_LOG_COMPACT_BYTES:
+                        self.flock.upgrade()
+                        self._write_index(self._load_index()[0])
+                    return (entry['digest'], data)
+        self.misses += 1
+        data = (self.bound.core.util.net.fetch1 if fetchfn is None else fetchfn)(url)
+        digest = hashlib.new(self.bound.core.util.hashtools.ALGORITHM_DEFAULT_LOW, data).hexdigest()
+        with self.rlock, self.flock:
+            if not (blob := self._blob(digest)).exists():
+                tmp = blob.with_name(f'{digest}.{os.getpid()}.{threading.get_ident()}.tmp')
+                tmp.write_bytes(data)
+                os.replace(tmp, blob)
+            index,damaged = self._load_index()
+            now = time.time()
+            index[url] = {'digest': digest, 'size': len(data), 'fetched': now, 'used': now}
+            self._evict(index)
+            if damaged: self._sweep(index)
+            self._write_index(index)
+        return (digest, data)
+    def blueprint(self, url: str, fetchfn: typing.Callable[[str], bytes] | None = None, *, refresh: bool = False) -> 'Blueprint':
+        '''
+            Returns the deserialized blueprint at `url`, fetching it through `.fetch()`
+            Blueprints are only deserialized once per content hash within each process
+        '''
+        digest,data = self.fetch(url, fetchfn, refresh=refresh)
+        with self.rlock:
+            if digest not in self._parsed:
+                self._parsed[digest] = self.bound.core.frameworks.blueprint.Blueprint.deserialize(data.decode())
+            return self._parsed[digest]
@@ -0,0 +1,165 @@
+#!/bin/python3
+
+'''Compact storage for the entries of large databases'''
+
+#> Imports
+import bisect
+import typing
+import itertools
+from collections.abc import MutableMapping
+#</Imports
+
+#> Header >/
+__all__ = ('CompactEntries', 'EntriesView')
+
+def _selector(mask: int, value: int) -> bytes:
+    '''Returns a table for `bytes.translate()` that maps each flags byte to whether `flags & mask == value`'''
+    return bytes((f & mask) == value for f in range(256))
+
+class CompactEntries:
+    '''
+        Stores database entries as IDs in one sorted list, alongside a `bytearray` of flags
+        `.expl` and `.deps` are `dict`-like views (`EntriesView`s) of the explicitly installed and dependency entries
+        Removed entries are left as tombstones (and revived if they are re-added) until more than half of the entries are dead,
+            so moving entries between `.expl` and `.deps` (even through `.pop()`) never shifts the arrays
+        `.copy()` returns a copy-on-write snapshot that shares storage until either side is modified
+    '''
+    __slots__ = ('_ids', '_flags', '_counts', '_dead', '_shared', 'expl', 'deps')
+
+    FLAG_EXPLICIT = 0b001
+    FLAG_PLUGIN   = 0b010
+    FLAG_DEAD     = 0b100
+
+    _SELECT = {True: _selector(FLAG_DEAD | FLAG_EXPLICIT, FLAG_EXPLICIT),
+               False: _selector(FLAG_DEAD | FLAG_EXPLICIT, 0)}
+    _SELECT_LIVE = _selector(FLAG_DEAD, 0)
+    _BULK_RATIO = 16 # bulk operations on more than 1/16th as many IDs as there are entries scan every entry
+
+    def __init__(self, expl: typing.Mapping[str, bool] = {}, deps: typing.Mapping[str, bool] = {}):
+        entries = sorted(itertools.chain(((id, self.FLAG_EXPLICIT | (self.FLAG_PLUGIN if p else 0)) for id,p in expl.items()),
+                                         ((id, self.FLAG_PLUGIN if p else 0) for id,p in deps.items() if id not in expl)))
+        self._ids = [id for id,_ in entries]
+        self._flags = bytearray(f for _,f in entries)
+        self._counts = {True: len(expl), False: len(entries) - len(expl)}
+        self._dead = 0
+        self._shared = False
+        self.expl = EntriesView(self, True)
+        self.deps = EntriesView(self, False)
+
+    def copy(self) -> typing.Self:
+        '''Returns a copy-on-write snapshot of these entries'''
+        new = object.__new__(type(self))
+        new._ids = self._ids
+        new._flags = self._flags
+        new._counts = self._counts.copy()
+        new._dead = self._dead
+        new._shared = self._shared = True
+        new.expl = EntriesView(new, True)
+        new.deps = EntriesView(new, False)
+        return new
+    def _own(self):
+        if self._dead > (len(self._ids) // 2): self._vacuum()
+        elif self._shared:
+            self._ids = self._ids.copy()
+            self._flags = self._flags.copy()
+        self._shared = False
+    def _vacuum(self):
+        live = self._flags.translate(self._SELECT_LIVE)
+        self._ids = list(itertools.compress(self._ids, live))
+        self._flags = bytearray(itertools.compress(self._flags, live))
+        self._dead = 0
+
+    # Single entries
+    def _find(self, id: str) -> int:
+        i = bisect.bisect_left(self._ids, id)
+        return i if (i < len(self._ids)) and (self._ids[i] == id) else -1
+    def get(self, id: str) -> tuple[bool, bool] | None:
+        '''Returns a tuple of whether the entry `id` is explicitly installed, and whether it is a plugin, or `None` if it is not present'''
+        if ((i := self._find(id)) < 0) or (self._flags[i] & self.FLAG_DEAD): return None
+        return (bool(self._flags[i] & self.FLAG_EXPLICIT), bool(self._flags[i] & self.FLAG_PLUGIN))
+    def add(self, id: str, explicit: bool, plugin: bool):
+        '''Adds or replaces the entry `id`'''
+        self._own()
+        flags = (self.FLAG_EXPLICIT if explicit else 0) | (self.FLAG_PLUGIN if plugin else 0)
+        if (i := self._find(id)) < 0:
+            i = bisect.bisect_left(self._ids, id)
+            self._ids.insert(i, id)
+            self._flags.insert(i, flags)
+        elif self._flags[i] & self.FLAG_DEAD:
+            self._dead -= 1
+            self._flags[i] = flags
+        else:
+            self._counts[bool(self._flags[i] & self.FLAG_EXPLICIT)] -= 1
+            self._flags[i] = flags
+        self._counts[bool(explicit)] += 1
+    def remove(self, id: str) -> tuple[bool, bool]:
+        '''Removes the entry `id`, returning what `.get()` would have, or raises `KeyError` if it is not present'''
+        if (ent := self.get(id)) is None: raise KeyError(id)
+        self._own()
+        i = self._find(id) # may have moved if vacuumed
+        self._flags[i] |= self.FLAG_DEAD
+        self._dead += 1
+        self._counts[ent[0]] -= 1
+        return ent
+
+    # Many entries
+    def _present(self, ids: typing.Iterable[str], explicit: bool | None = None) -> tuple[set[str], set[str]]:
+        '''
+            Returns `ids` as a `set`, and which of them are present (in `.expl` if `explicit` is true, in `.deps` if it is false)
+            Small sets of `ids` are looked up one-by-one, larger ones are intersected with all of the selected IDs at once
+        '''
+        ids = set(ids)
+        if (len(ids) * self._BULK_RATIO) < len(self._ids):
+            return (ids, {id for id in ids if ((ent := self.get(id)) is not None) and ((explicit is None) or (ent[0] == explicit))})
+        return (ids, ids.intersection(itertools.compress(self._ids, self._flags.translate(self._SELECT_LIVE if explicit is None else self._SELECT[explicit]))))
+    def contains_many(self, ids: typing.Iterable[str]) -> set[str]:
+        '''Returns which of `ids` are present'''
+        return self._present(ids)[1]
+    def difference(self, ids: typing.Iterable[str]) -> set[str]:
+        '''Returns which of `ids` are not present'''
+        ids,present = self._present(ids)
+        return ids - present
+    def move(self, ids: typing.Iterable[str], explicit: bool) -> set[str]:
+        '''
+            Moves each of `ids` that are present into `.expl` if `explicit` is true, otherwise into `.deps`,
+                returning the IDs that were actually moved
+        '''
+        if not (moved := self._present(ids, not explicit)[1]): return moved
+        self._own() # before finding any entries, as vacuuming moves them
+        for id in moved: self._flags[self._find(id)] ^= self.FLAG_EXPLICIT
+        self._counts[explicit] += len(moved)
+        self._counts[not explicit] -= len(moved)
+        return moved
+
+    # Iteration
+    def _select(self, explicit: bool) -> typing.Iterator[str]:
+        return itertools.compress(self._ids, self._flags.translate(self._SELECT[explicit]))
+
+class EntriesView(MutableMapping):
+    '''A `dict`-like view of either the explicitly installed or the dependency entries in a `CompactEntries`'''
+    __slots__ = ('entries', 'explicit')
+
+    def __init__(self, entries: CompactEntries, explicit: bool):
+        self.entries = entries
+        self.explicit = explicit
+
+    def __getitem__(self, id: str) -> bool:
+        if ((ent := self.entries.get(id)) is None) or (ent[0] != self.explicit): raise KeyError(id)
+        return ent[1]
+    def __setitem__(self, id: str, plugin: bool):
+        self.entries.add(id, self.explicit, plugin)
+    def __delitem__(self, id: str):
+        if ((ent := self.entries.get(id)) is None) or (ent[0] != self.explicit): raise KeyError(id)
+        self.entries.remove(id)
+    def __contains__(self, id: object) -> bool:
+        return ((ent := self.entries.get(id)) is not None) and (ent[0] == self.explicit)
+    def __iter__(self) -> typing.Iterator[str]:
+        return self.entries._select(self.explicit)
+    def __len__(self) -> int:
+        return self.entries._counts[self.explicit]
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+    def copy(self) -> dict[str, bool]:
+        '''Returns a plain `dict` copy of this view (see `CompactEntries.copy()` for copy-on-write snapshots)'''
+        return dict(self.items())
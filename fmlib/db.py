@@ -1,9 +1,15 @@
 #!/bin/python3
 
 #> Imports
+import os
+import mmap
 import time
 import types
+import bisect
+import struct
 import typing
+import shutil
+import itertools
 import hashlib
 import threading
 import contextlib
@@ -11,10 +17,58 @@ from pathlib import Path
 
 from . import FLType
 from . import _total_autobind_store
+from . import lock
+from . import trace
+from . import compact
+from . import graph
 #</Imports
 
 #> Header >/
-__all__ = ('Controller', 'State')
+__all__ = ('Controller', 'State', 'EntryChecksum')
+
+class EntryChecksum:
+    '''
+        An order-independent checksum over the entries of a `State`,
+            calculated as the sum of the hashes of each entry (and of the version), modulo the size of the hash
+        As the hash of each entry is independent of the others, it can be updated incrementally
+            as entries are added, removed, or moved between `.expl` and `.deps`
+        From version 5.0, each dependency edge (see `State.edges`) is hashed in as well
+    '''
+    __slots__ = ('algorithm', 'value', '_modulus')
+
+    def __init__(self, algorithm: str, vers: float, chksum: bytes | None = None):
+        self.algorithm = algorithm
+        self._modulus = 1 << (hashlib.new(algorithm).digest_size * 8)
+        self.value = self._hash(f'\0{vers!r}'.encode()) if chksum is None else int.from_bytes(chksum, 'big')
+
+    def _hash(self, data: bytes) -> int:
+        return int.from_bytes(hashlib.new(self.algorithm, data).digest(), 'big')
+    def entry(self, id: str, explicit: bool, plugin: bool) -> int:
+        '''Returns the hash of a single entry'''
+        return self._hash(id.encode() + b'\0' + bytes(((explicit << 1) | plugin,)))
+    def edge(self, id: str, dep: str) -> int:
+        '''Returns the hash of a single dependency edge, from `id` to `dep`'''
+        return self._hash(b'\1' + id.encode() + b'\0' + dep.encode())
+
+    def add(self, id: str, explicit: bool, plugin: bool):
+        '''Adds an entry to the checksum'''
+        self.value = (self.value + self.entry(id, explicit, plugin)) % self._modulus
+    def remove(self, id: str, explicit: bool, plugin: bool):
+        '''Removes an entry from the checksum'''
+        self.value = (self.value - self.entry(id, explicit, plugin)) % self._modulus
+    def move(self, id: str, explicit: bool, plugin: bool):
+        '''Moves an entry from `.deps` to `.expl` if `explicit`, otherwise from `.expl` to `.deps`'''
+        self.remove(id, not explicit, plugin)
+        self.add(id, explicit, plugin)
+    def add_edges(self, id: str, deps: typing.Iterable[str]):
+        '''Adds the dependency edges from `id` to each of `deps` to the checksum'''
+        self.value = (self.value + sum(self.edge(id, dep) for dep in deps)) % self._modulus
+    def remove_edges(self, id: str, deps: typing.Iterable[str]):
+        '''Removes the dependency edges from `id` to each of `deps` from the checksum'''
+        self.value = (self.value - sum(self.edge(id, dep) for dep in deps)) % self._modulus
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(self._modulus.bit_length() // 8, 'big')
 
 @_total_autobind_store.bindable_cls('db')
 class State(typing.NamedTuple):
@@ -22,8 +76,10 @@ class State(typing.NamedTuple):
         A result of a database read, or a state to write to a database
         `expl` are explicitly installed packages, `deps` are dependencies,
             and the values are a boolean corresponding to whether the entry is a module (`False`) or a plugin (`True`)
+        `edges` (from version 5.0) maps package IDs to a tuple of the IDs of the packages that they depend on;
+            it is `None` in `State`s unpacked from older databases, but `Controller.read()` always supplies a `dict`
     '''
-    LATEST_VERSION = 2.0
+    LATEST_VERSION = 5.0
 
     expl: dict[str, bool]
     deps: dict[str, bool]
@@ -31,17 +87,33 @@ class State(typing.NamedTuple):
     mtime: int
     chksum: bytes | None
     vers: float = LATEST_VERSION
+    edges: dict[str, tuple[str, ...]] | None = None
 
     _TOTAL_AUTOBOUND = False
 
     @_total_autobind_store.bindable_meth
+    @trace.traced('db.checksum')
     def mkchksum(self, fl: FLType) -> bytes:
         '''
             Returns the checksum of this `State`
             Note that `.mtime` is not included in the checksum (neither is `.chksum`)
+            In version 3.0, entries are checksummed in sorted order,
+                so that states folded from a journal match the states they were written from
+            From version 4.0, the checksum is an `EntryChecksum`, which is calculated entry-by-entry,
+                without packing the `State`, and from version 5.0 it includes `.edges`
         '''
-        return hashlib.new(fl.core.util.hashtools.ALGORITHM_DEFAULT_LOW,
-                           fl.core.util.pack.pack(self.vers, self.expl, self.deps)).digest()
+        if self.vers < 3.0: # packed as plain `dict`s in insertion order, as `.expl` and `.deps` may be read-only views (see `.readonly()`)
+            return hashlib.new(fl.core.util.hashtools.ALGORITHM_DEFAULT_LOW,
+                               fl.core.util.pack.pack(self.vers, dict(self.expl.items()), dict(self.deps.items()))).digest()
+        if self.vers < 4.0:
+            return hashlib.new(fl.core.util.hashtools.ALGORITHM_DEFAULT_LOW,
+                               fl.core.util.pack.pack(self.vers, dict(sorted(self.expl.items())), dict(sorted(self.deps.items())))).digest()
+        chk = EntryChecksum(fl.core.util.hashtools.ALGORITHM_DEFAULT_LOW, self.vers)
+        for id,plugin in self.expl.items(): chk.add(id, True, plugin)
+        for id,plugin in self.deps.items(): chk.add(id, False, plugin)
+        if self.vers >= 5.0:
+            for id,deps in (self.edges or {}).items(): chk.add_edges(id, deps)
+        return chk.digest()
 
     @_total_autobind_store.bindable_meth
     def update(self, fl: FLType, *, lazy: bool = False) -> typing.Self:
@@ -50,63 +122,645 @@ class State(typing.NamedTuple):
             If `lazy` is true, then changing values in `.expl` or `.deps` will be reflected
                 in both `State`s, but this will save construction of copy of both
         '''
-        return self._replace(expl=self.expl if lazy else self.expl.copy(), deps=self.deps if lazy else self.deps.copy(),
-                             mtime=int(time.time()), chksum=(self.mkchksum() if self._TOTAL_AUTOBOUND else self.mkchksum(fl)))
+        return (self if lazy else self.copy())._replace(mtime=int(time.time()), chksum=(self.mkchksum() if self._TOTAL_AUTOBOUND else self.mkchksum(fl)))
+    @_total_autobind_store.bindable_meth
+    @trace.traced('db.checksum_incremental')
+    def update_from(self, fl: FLType, prev: typing.Self, changes: dict[str, tuple[bool, bool] | None],
+                    edges: dict[str, tuple[str, ...] | None] | None = None, *, lazy: bool = False) -> typing.Self:
+        '''
+            Like `.update()`, but derives the checksum incrementally from `prev`'s,
+                given the `changes` (a `dict` mapping changed IDs to a tuple of whether they are explicit and whether they are plugins,
+                or to `None` if they were removed) and `edges` (a `dict` mapping IDs whose dependency edges changed to their new edges,
+                or to `None` if they were removed) that turn `prev` into this `State`
+            Both `State`s must be at least version 4.0 (or 5.0, if `edges` is given), and `prev.chksum` must be correct
+        '''
+        chk = EntryChecksum(fl.core.util.hashtools.ALGORITHM_DEFAULT_LOW, self.vers, prev.chksum)
+        for id,change in changes.items():
+            if id in prev.expl: chk.remove(id, True, prev.expl[id])
+            elif id in prev.deps: chk.remove(id, False, prev.deps[id])
+            if change is not None: chk.add(id, *change)
+        for id,deps in (edges or {}).items():
+            chk.remove_edges(id, (prev.edges or {}).get(id, ()))
+            if deps is not None: chk.add_edges(id, deps)
+        return (self if lazy else self.copy())._replace(mtime=int(time.time()), chksum=chk.digest())
+
+    def copy(self) -> typing.Self:
+        '''
+            Returns a copy of this `State` with its own (mutable) `.expl` and `.deps`
+            Compact `State`s (see `.compacted()`) are copied as copy-on-write snapshots
+        '''
+        edges = {} if self.edges is None else self.edges.copy()
+        if (entries := self.entries()) is not None:
+            entries = entries.copy()
+            return self._replace(expl=entries.expl, deps=entries.deps, edges=edges)
+        return self._replace(expl=self.expl.copy(), deps=self.deps.copy(), edges=edges)
+    def readonly(self) -> typing.Self:
+        '''Returns a view of this `State` whose `.expl`, `.deps`, and `.edges` cannot be modified'''
+        return self._replace(expl=types.MappingProxyType(self.expl), deps=types.MappingProxyType(self.deps),
+                             edges=types.MappingProxyType({} if self.edges is None else self.edges))
+
+    # Representations
+    def entries(self) -> compact.CompactEntries | None:
+        '''Returns the `compact.CompactEntries` backing `.expl` and `.deps`, or `None` if this `State` is not compact'''
+        if isinstance(self.expl, compact.EntriesView) and isinstance(self.deps, compact.EntriesView) \
+           and (self.expl.entries is self.deps.entries): return self.expl.entries
+        return None
+    def compacted(self) -> typing.Self:
+        '''
+            Returns a compact copy of this `State`, whose `.expl` and `.deps` are views over one `compact.CompactEntries`
+            Compact `State`s use much less memory for large databases, and are copied in constant time
+        '''
+        if self.entries() is not None: return self.copy()
+        entries = compact.CompactEntries(self.expl, self.deps)
+        return self._replace(expl=entries.expl, deps=entries.deps)
+    def plain(self) -> typing.Self:
+        '''Returns this `State` with `.expl` and `.deps` as plain `dict`s, copying them if they are not already'''
+        if (type(self.expl) is dict) and (type(self.deps) is dict) and (type(self.edges) is dict): return self
+        return self._replace(expl=dict(self.expl.items()), deps=dict(self.deps.items()), edges=dict((self.edges or {}).items()))
+
+    # Bulk operations
+    def missing(self, ids: typing.Iterable[str]) -> set[str]:
+        '''Returns which of `ids` are in neither `.expl` nor `.deps`'''
+        if (entries := self.entries()) is not None: return entries.difference(ids)
+        return {id for id in ids if (id not in self.expl) and (id not in self.deps)}
+    def move(self, ids: typing.Iterable[str], explicit: bool) -> set[str]:
+        '''
+            Moves each of `ids` into `.expl` if `explicit` is true, otherwise into `.deps`,
+                returning the IDs that were actually moved (those that were present on the other side)
+        '''
+        if (entries := self.entries()) is not None: return entries.move(ids, explicit)
+        src,dst = (self.deps, self.expl) if explicit else (self.expl, self.deps)
+        moved = {id for id in ids if id in src}
+        for id in moved: dst[id] = src.pop(id)
+        return moved
 
 @_total_autobind_store.bindable_cls('db')
 class Controller(contextlib.AbstractContextManager):
-    '''Acts as an interface to a database file, handling locking and returning of states'''
-    __slots__ = ('bound', 'path',
+    '''
+        Acts as an interface to a database file, handling locking and returning of states
+        From version 3.0, changes are appended to a journal (`packages_db.pakd.journal`) as per-package records,
+            which are folded into the base snapshot (`packages_db.pakd`) on read;
+            the journal is compacted into a new snapshot once it grows past `JOURNAL_COMPACT_BYTES`,
+            or past `JOURNAL_COMPACT_RATIO` times the size of the snapshot;
+            each record is checked against the checksum it carries as it is folded, and the first record that is torn
+            (such as by an interrupted append), cannot be unpacked, or does not match its checksum, and every record after it,
+            are ignored on read (and counted in `.recoveries`), and truncated away before the next append
+        If `compact_state` is true, then read `State`s are compact (see `State.compacted()`),
+            which is recommended for very large databases;
+            `State`s read from databases older than version 3.0 are left as they are, as their checksums depend on the order of their entries
+        The dependency graph (see `.graph()`) is cached alongside the last `State`, and kept up-to-date incrementally by `.write()`
+        Snapshots are written as frames of entries, so that `.check()` can verify them without unpacking them whole
+        Snapshots and indexes are written to a temporary file that then replaces the original,
+            and `durability` selects which writes are `fsync()`ed before they are relied upon:
+            nothing (`DURABILITY_NONE`), the written files (`DURABILITY_FILE`),
+            or the written files and the database directory (`DURABILITY_FULL`, the default)
+        Each snapshot is also copied to a backup (`packages_db.pakd.bak`); if a snapshot cannot be unpacked (such as if it is torn)
+            or, if `verify_reads` is true, does not match its checksum (which requires hashing every entry),
+            then the backup is read instead (and counted in `.recoveries`), the journal is folded into it as usual,
+            and the next `.write()` writes a full snapshot
+        The sorted IDs of all packages are also kept in plain text (`packages_db.pakd.ids`, one per line) for shell completion,
+            which is rewritten with each snapshot, and whenever a package is added or removed
+    '''
+    __slots__ = ('bound', 'path', 'compact_state', 'durability', 'verify_reads',
                  'rlock', 'flock',
-                 '_dbfp', '_packer', '_db_state_null_chksum')
+                 'cache_hits', 'cache_misses', 'recoveries',
+                 '_dbfp', '_jfp', '_ifp', '_bfp', '_idfp', '_packer', '_db_state_null_chksum', '_cache', '_graph', '_recovered', '_jvalid')
 
     PACKAGE_DB_FILENAME = 'packages_db.pakd'
     PACKAGE_DB_LOCKNAME = f'{PACKAGE_DB_FILENAME}.lock'
+    PACKAGE_DB_JOURNALNAME = f'{PACKAGE_DB_FILENAME}.journal'
+    PACKAGE_DB_INDEXNAME = f'{PACKAGE_DB_FILENAME}.idx'
+    PACKAGE_DB_BACKUPNAME = f'{PACKAGE_DB_FILENAME}.bak'
+    PACKAGE_DB_IDSNAME = f'{PACKAGE_DB_FILENAME}.ids'
+
+    DURABILITY_NONE = 'none'
+    DURABILITY_FILE = 'file'
+    DURABILITY_FULL = 'file+dir'
+    DURABILITY_LEVELS = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_FULL)
+
+    JOURNAL_COMPACT_BYTES = 1024 * 1024
+    JOURNAL_COMPACT_RATIO = 0.5
 
     _STATE_OBJECT = State
     _TOTAL_AUTOBOUND = False
 
     @_total_autobind_store.bindable_meth
-    def __init__(self, fl: FLType, path: Path):
+    def __init__(self, fl: FLType, path: Path, *, compact_state: bool = False, durability: str = DURABILITY_FULL, verify_reads: bool = False):
+        if durability not in self.DURABILITY_LEVELS:
+            raise ValueError(f'Unknown durability {durability!r}, expected one of: {", ".join(self.DURABILITY_LEVELS)}')
         self.bound = fl
         self.path = path
+        self.compact_state = compact_state
+        self.durability = durability
+        self.verify_reads = verify_reads
         self.rlock = threading.RLock()
-        self.flock = self.bound.core.util.parallel.FLock(path/self.PACKAGE_DB_LOCKNAME, self.rlock)
+        self.flock = lock.RWFLock(path/self.PACKAGE_DB_LOCKNAME, self.rlock, fallback=self.bound.core.util.parallel.FLock)
         self._dbfp = self.path / self.PACKAGE_DB_FILENAME
+        self._jfp = self.path / self.PACKAGE_DB_JOURNALNAME
+        self._ifp = self.path / self.PACKAGE_DB_INDEXNAME
+        self._bfp = self.path / self.PACKAGE_DB_BACKUPNAME
+        self._idfp = self.path / self.PACKAGE_DB_IDSNAME
         self._packer = self.bound.core.util.pack.Packer(reduce_namedtuple=self.bound.core.util.pack.ReduceNamedtuple.AS_DICT)
 
         state_null = self._STATE_OBJECT(expl={}, deps={}, mtime=-1, chksum=None)
         self._db_state_null_chksum = state_null.mkchksum() if self._TOTAL_AUTOBOUND else state_null.mkchksum(fl)
 
+        self._cache = None
+        self._graph = None
+        self._recovered = False
+        self._jvalid = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.recoveries = 0
+
     def __enter__(self):
         self.flock.acquire()
     def __exit__(self, exc_type: type[Exception] | None, exc_value: typing.Any, traceback: types.TracebackType | None):
         self.flock.release()
 
-    def read(self, *, allow_unlocked_read: bool = False, allow_nonexist_read: bool = True) -> State:
+    def shared(self) -> typing.ContextManager[lock.RWFLock]:
+        '''
+            Holds the file-lock shared, rather than exclusively, for the duration of the context,
+                allowing other readers to hold it concurrently
+            This is sufficient for `.read()` and `.lookup()`, but not `.write()`; see `.upgrade()`
+        '''
+        return self.flock.shared()
+    def upgrade(self) -> bool:
+        '''
+            Upgrades a shared file-lock to an exclusive one, allowing `.write()`
+            As the upgrade is not atomic, the database may be changed by another writer in-between;
+                returns `False` if this happened, in which case any `State` that was previously read should be discarded and re-read
+        '''
+        with self.rlock:
+            before = self._identity()
+            self.flock.upgrade()
+            return self._identity() == before
+
+    # Cache
+    @staticmethod
+    def _file_identity(p: Path) -> tuple[int, int, int] | None:
+        try: st = p.stat()
+        except FileNotFoundError: return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    def _identity(self) -> tuple[tuple[int, int, int], tuple[int, int, int] | None] | None:
+        if (base := self._file_identity(self._dbfp)) is None: return None
+        return (base, self._file_identity(self._jfp))
+    def clear_cache(self):
+        '''Drops the cached `State` (and dependency graph), forcing the next `.read()` to unpack the database file'''
+        with self.rlock: self._cache = self._graph = None
+
+    # Journal
+    @staticmethod
+    def _frame(data: bytes) -> bytes:
+        return len(data).to_bytes(4, 'big') + data
+    def _journal_records(self, data: bytes) -> typing.Iterator[tuple[int, typing.Any]]:
+        '''Yields each complete record in `data`, along with the offset at which it ends'''
+        view = memoryview(data)
+        off = 0
+        while (off + 4) <= len(view):
+            size = int.from_bytes(view[off:off+4], 'big')
+            if (off + 4 + size) > len(view): return # torn record from an interrupted append
+            try: rec = self._packer.unpack(bytes(view[off+4:off+4+size]))[0]
+            except Exception: return # corrupt record
+            off += 4 + size
+            yield (off, rec)
+    def _read_journal(self, base_chksum: bytes) -> tuple[int, int, list[tuple[int, typing.Any]]]:
+        '''
+            Returns the size of the journal, the offset at which its header ends, and its complete records (see `._journal_records()`),
+                or `(0, 0, [])` if there is no journal, or it is stale (left over from before a compaction)
         '''
-            Reads a `State` from the database
+        try: data = self._jfp.read_bytes()
+        except FileNotFoundError: return (0, 0, [])
+        records = self._journal_records(data)
+        if ((first := next(records, None)) is None) or (first[1] != base_chksum): return (0, 0, [])
+        return (len(data), first[0], list(records))
+    def _fold_records(self, base: State, records: typing.Iterable[tuple[int, typing.Any]]) -> tuple[State, int | None]:
+        '''
+            Folds journal `records` into `base` (modifying it in-place), stopping at the first record that does not match its checksum,
+                and returns the folded `State`, and the offset at which the last folded record ends (or `None` if none were)
+            `base` only needs to hold the entries and edges that `records` change, as a record\'s checksum is derived from only those
+        '''
+        end = None
+        for rend,rec in records:
+            changes = rec['changes']
+            edges = rec.get('edges') or {}
+            if base.vers >= 4.0:
+                folded = base.update_from(base, changes, edges, lazy=True) if self._TOTAL_AUTOBOUND else base.update_from(self.bound, base, changes, edges, lazy=True)
+                if folded.chksum != rec['chksum']: break
+            for id,change in changes.items():
+                base.expl.pop(id, None)
+                base.deps.pop(id, None)
+                if change is None: continue
+                (base.expl if change[0] else base.deps)[id] = change[1]
+            for id,deps in edges.items():
+                if deps is None: base.edges.pop(id, None)
+                else: base.edges[id] = tuple(deps)
+            base = base._replace(mtime=rec['mtime'], chksum=rec['chksum'])
+            end = rend
+        return (base, end)
+    @trace.traced('db.fold_journal')
+    def _fold_journal(self, base: State) -> State:
+        size,self._jvalid,records = self._read_journal(base.chksum)
+        base,end = self._fold_records(base, records)
+        if end is not None: self._jvalid = end
+        if self._jvalid != size: self.recoveries += 1
+        return base
+    @staticmethod
+    def _diff(old: State, new: State) -> dict[str, tuple[bool, bool] | None]:
+        changes = dict.fromkeys((old.expl.keys() | old.deps.keys()) - (new.expl.keys() | new.deps.keys()))
+        for expl,entries,prev in ((True, new.expl, old.expl), (False, new.deps, old.deps)):
+            changes.update((id, (expl, plugin)) for id,plugin in entries.items() if prev.get(id) != plugin)
+        return changes
+    @staticmethod
+    def _diff_edges(old: State, new: State) -> dict[str, tuple[str, ...] | None]:
+        changes = dict.fromkeys(old.edges.keys() - new.edges.keys())
+        changes.update((id, tuple(deps)) for id,deps in new.edges.items() if old.edges.get(id) != tuple(deps))
+        return changes
+    # Snapshots
+    ## Layout: `SNAPSHOT_MAGIC`, then frames (each a big-endian u32 length and packed data, as in the journal) of:
+    ##  a header (`vers`, `mtime`, `chksum`, and the number of `frames` that follow),
+    ##  then up to `SNAPSHOT_FRAME_ENTRIES` entries of one of `expl`, `deps`, or `edges` (keyed by which) per frame
+    ## Snapshots written before this layout are a single packed `State`, which is still read (but cannot be streamed)
+    SNAPSHOT_MAGIC = b'FMSN'
+    SNAPSHOT_FRAME_ENTRIES = 4096
+    def _snapshot_frames(self, s: State) -> typing.Iterator[bytes]:
+        parts = (('expl', s.expl), ('deps', s.deps), ('edges', s.edges or {}))
+        yield self.SNAPSHOT_MAGIC
+        yield self._frame(self._packer.pack({'vers': s.vers, 'mtime': s.mtime, 'chksum': s.chksum,
+                                             'frames': sum(-(-len(entries) // self.SNAPSHOT_FRAME_ENTRIES) for _,entries in parts)}))
+        for key,entries in parts:
+            for chunk in itertools.batched(entries.items(), self.SNAPSHOT_FRAME_ENTRIES):
+                yield self._frame(self._packer.pack({key: dict(chunk)}))
+    def _read_frame(self, f: typing.BinaryIO) -> typing.Any:
+        if (len(size := f.read(4)) != 4) or (len(data := f.read(size := int.from_bytes(size, 'big'))) != size):
+            raise ValueError('Torn snapshot frame')
+        return self._packer.unpack(data)[0]
+    def _snapshot_header(self, f: typing.BinaryIO) -> dict[str, typing.Any] | None:
+        '''Reads the header of the snapshot in `f`, or returns `None` (leaving `f` at its start) if it is a single packed `State`'''
+        if f.read(len(self.SNAPSHOT_MAGIC)) != self.SNAPSHOT_MAGIC:
+            f.seek(0)
+            return None
+        return self._read_frame(f)
+    def _snapshot_parts(self, f: typing.BinaryIO, head: dict[str, typing.Any]) -> typing.Iterator[dict[str, dict]]:
+        '''Yields each frame of entries of the snapshot in `f` after its header (`head`), one at a time'''
+        for _ in range(head['frames']): yield self._read_frame(f)
+        if f.read(1): raise ValueError('Trailing data after the last snapshot frame')
+    @trace.traced('db.write_snapshot')
+    def _write_snapshot(self, s: State):
+        self._atomic_write(self._dbfp, self._snapshot_frames(s))
+        self._backup()
+        self._write_index(s)
+        self._write_ids(s)
+        self._jfp.unlink(missing_ok=True)
+        self._jvalid = 0
+        self._sync_dir()
+        self._recovered = False
+
+    # Durability
+    def _sync_dir(self):
+        if (self.durability != self.DURABILITY_FULL) or not hasattr(os, 'O_DIRECTORY'): return
+        fd = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+        try: os.fsync(fd)
+        finally: os.close(fd)
+    def _atomic_write(self, p: Path, data: bytes | typing.Iterable[bytes]):
+        tmp = p.with_name(f'{p.name}.{os.getpid()}.tmp')
+        with tmp.open('wb') as f:
+            if isinstance(data, bytes): f.write(data)
+            else: f.writelines(data)
+            if self.durability != self.DURABILITY_NONE:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, p)
+    def _backup(self):
+        tmp = self._bfp.with_name(f'{self._bfp.name}.{os.getpid()}.tmp')
+        shutil.copyfile(self._dbfp, tmp) # not linked, so that damage to the snapshot in-place does not reach its backup
+        if self.durability != self.DURABILITY_NONE:
+            with tmp.open('rb') as f: os.fsync(f.fileno())
+        os.replace(tmp, self._bfp)
+    def _unpack(self, p: Path) -> State | None:
+        try:
+            with p.open('rb') as f:
+                if (head := self._snapshot_header(f)) is None: fields = self._packer.unpack(f.read())[0]
+                else:
+                    fields = {'vers': head['vers'], 'mtime': head['mtime'], 'chksum': head['chksum'], 'expl': {}, 'deps': {}, 'edges': {}}
+                    for part in self._snapshot_parts(f, head):
+                        for key,entries in part.items(): fields[key].update(entries)
+            state = self._STATE_OBJECT(**fields)
+        except FileNotFoundError: return None
+        except Exception: return None # torn or otherwise corrupt
+        state = state._replace(edges={} if state.edges is None else {id: tuple(deps) for id,deps in state.edges.items()})
+        if self.verify_reads and (state.chksum != (state.mkchksum() if self._TOTAL_AUTOBOUND else state.mkchksum(self.bound))): return None
+        return state
+
+    # Index
+    ## Layout (all integers are big-endian):
+    ##  header: magic, snapshot inode, size, and mtime_ns (u64 each), snapshot version (f64), entry count (u32), edge count (u32),
+    ##   snapshot checksum length (u16), snapshot checksum
+    ##  table: absolute offset (u32) of each entry, then of each package's edges, each in order of their UTF-8 encoded IDs
+    ##  entries: flags (u8, `INDEX_FLAG_*`), ID length (u16), UTF-8 encoded ID
+    ##  edges: dependency count (u16), ID length (u16), UTF-8 encoded ID, then each dependency's length (u16) and UTF-8 encoded ID
+    _INDEX_HEADER = struct.Struct('>4sQQQdIIH')
+    _INDEX_ENTRY = struct.Struct('>BH')
+    _INDEX_EDGES = struct.Struct('>HH')
+    _INDEX_DEP = struct.Struct('>H')
+    INDEX_MAGIC = b'FMI2'
+    INDEX_FLAG_EXPLICIT = 0b01
+    INDEX_FLAG_PLUGIN = 0b10
+    def _write_index(self, s: State):
+        entries = sorted([(id.encode(), self.INDEX_FLAG_EXPLICIT | (self.INDEX_FLAG_PLUGIN if plugin else 0)) for id,plugin in s.expl.items()]
+                         + [(id.encode(), self.INDEX_FLAG_PLUGIN if plugin else 0) for id,plugin in s.deps.items()])
+        edges = sorted((id.encode(), tuple(dep.encode() for dep in deps)) for id,deps in (s.edges or {}).items())
+        header = self._INDEX_HEADER.pack(self.INDEX_MAGIC, *self._file_identity(self._dbfp), s.vers, len(entries), len(edges), len(s.chksum)) + s.chksum
+        off = len(header) + (4 * (len(entries) + len(edges)))
+        table = bytearray()
+        body = bytearray()
+        for id,flags in entries:
+            table += (off + len(body)).to_bytes(4, 'big')
+            body += self._INDEX_ENTRY.pack(flags, len(id)) + id
+        for id,deps in edges:
+            table += (off + len(body)).to_bytes(4, 'big')
+            body += self._INDEX_EDGES.pack(len(deps), len(id)) + id + b''.join(self._INDEX_DEP.pack(len(dep)) + dep for dep in deps)
+        self._atomic_write(self._ifp, header + table + body)
+    def _write_ids(self, s: State):
+        # only a cache for shell completion, so it is never `fsync()`ed
+        tmp = self._idfp.with_name(f'{self._idfp.name}.{os.getpid()}.tmp')
+        tmp.write_text(''.join(f'{id}\n' for id in sorted(id for ids in (s.expl.keys(), s.deps.keys()) for id in ids)), encoding='utf-8')
+        os.replace(tmp, self._idfp)
+    @classmethod
+    def _index_entry(cls, mm: mmap.mmap, table: int, i: int) -> tuple[bytes, int]:
+        off = int.from_bytes(mm[table+(4*i):table+(4*i)+4], 'big')
+        flags,size = cls._INDEX_ENTRY.unpack_from(mm, off)
+        off += cls._INDEX_ENTRY.size
+        return (mm[off:off+size], flags)
+    @classmethod
+    def _index_edges(cls, mm: mmap.mmap, table: int, i: int) -> tuple[bytes, tuple[bytes, ...]]:
+        off = int.from_bytes(mm[table+(4*i):table+(4*i)+4], 'big')
+        count,size = cls._INDEX_EDGES.unpack_from(mm, off)
+        off += cls._INDEX_EDGES.size + size
+        id = mm[off-size:off]
+        deps = []
+        for _ in range(count):
+            (size,) = cls._INDEX_DEP.unpack_from(mm, off)
+            off += cls._INDEX_DEP.size + size
+            deps.append(mm[off-size:off])
+        return (id, tuple(deps))
+    @staticmethod
+    def _index_get(mm: mmap.mmap, table: int, count: int, eid: bytes, read: typing.Callable[[mmap.mmap, int, int], tuple[bytes, typing.Any]]) -> typing.Any | None:
+        '''Binary searches the `count` records of `table` (read with `read`) for the ID `eid`, returning the rest of its record, or `None` if it is not present'''
+        i = bisect.bisect_left(range(count), eid, key=lambda i: read(mm, table, i)[0])
+        if (i < count) and ((found := read(mm, table, i))[0] == eid): return found[1]
+        return None
+    def _journal_changes(self, mm: mmap.mmap, table: int, count: int, ecount: int, vers: float, base_chksum: bytes) -> dict[str, tuple[bool, bool] | None]:
+        '''
+            Returns the entries that the journal changes, mapped to `None` if they are not present after its changes
+            The snapshot\'s entries (and edges) that the journal changes are looked up in the index (see `._open_index()`),
+                so that its records are checked as they are folded, exactly as by `.read()`
+        '''
+        _,_,records = self._read_journal(base_chksum)
+        if not records: return {}
+        touched = {id for _,rec in records for id in rec['changes']}
+        base = self._STATE_OBJECT(expl={}, deps={}, mtime=-1, chksum=base_chksum, vers=vers, edges={})
+        for id in touched:
+            if (flags := self._index_get(mm, table, count, id.encode(), self._index_entry)) is not None:
+                (base.expl if flags & self.INDEX_FLAG_EXPLICIT else base.deps)[id] = bool(flags & self.INDEX_FLAG_PLUGIN)
+        for id in {id for _,rec in records for id in (rec.get('edges') or {})}:
+            if (deps := self._index_get(mm, table + (4 * count), ecount, id.encode(), self._index_edges)) is not None:
+                base.edges[id] = tuple(dep.decode() for dep in deps)
+        base,_ = self._fold_records(base, records)
+        return {id: ((True, base.expl[id]) if id in base.expl else (False, base.deps[id]) if id in base.deps else None) for id in touched}
+    @contextlib.contextmanager
+    def _open_index(self) -> typing.Iterator[tuple[mmap.mmap, int, int, dict[str, tuple[bool, bool] | None]] | None]:
+        try: f = self._ifp.open('rb')
+        except FileNotFoundError:
+            yield None
+            return
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if (len(mm) < self._INDEX_HEADER.size) or (mm[:len(self.INDEX_MAGIC)] != self.INDEX_MAGIC): # from before the current layout
+                yield None
+                return
+            _,*ident,vers,count,ecount,chklen = self._INDEX_HEADER.unpack_from(mm)
+            if tuple(ident) != self._file_identity(self._dbfp): # stale index
+                yield None
+                return
+            table = self._INDEX_HEADER.size + chklen
+            yield (mm, table, count, self._journal_changes(mm, table, count, ecount, vers, mm[self._INDEX_HEADER.size:table]))
+    @trace.traced('db.index_lookup')
+    def _index_lookup(self, ids: typing.Iterable[str]) -> dict[str, tuple[bool, bool]] | None:
+        with self._open_index() as index:
+            if index is None: return None
+            mm,table,count,changes = index
+            found = {}
+            for id in ids:
+                if id in changes:
+                    if changes[id] is not None: found[id] = changes[id]
+                    continue
+                if (flags := self._index_get(mm, table, count, id.encode(), self._index_entry)) is not None:
+                    found[id] = (bool(flags & self.INDEX_FLAG_EXPLICIT), bool(flags & self.INDEX_FLAG_PLUGIN))
+            return found
+    @trace.traced('db.index_search')
+    def _index_search(self, prefix: str) -> dict[str, tuple[bool, bool]] | None:
+        with self._open_index() as index:
+            if index is None: return None
+            mm,table,count,changes = index
+            eprefix = prefix.encode() # UTF-8 preserves the ordering of code points, so IDs with the prefix are contiguous
+            found = {}
+            for i in range(bisect.bisect_left(range(count), eprefix, key=lambda i: self._index_entry(mm, table, i)[0]), count):
+                fid,flags = self._index_entry(mm, table, i)
+                if not fid.startswith(eprefix): break
+                found[fid.decode()] = (bool(flags & self.INDEX_FLAG_EXPLICIT), bool(flags & self.INDEX_FLAG_PLUGIN))
+            for id,ent in changes.items():
+                if not id.startswith(prefix): continue
+                if ent is None: found.pop(id, None)
+                else: found[id] = tuple(ent)
+            return dict(sorted(found.items()))
+    def lookup(self, ids: typing.Iterable[str], *, allow_unlocked_read: bool = False) -> dict[str, tuple[bool, bool]]:
+        '''
+            Looks up the entries of `ids` in the database without unpacking it,
+                returning a `dict` that maps each ID that is present to a tuple of whether it is explicitly installed, and whether it is a plugin
+            The sorted index (`packages_db.pakd.idx`) that is written alongside each snapshot is searched through `mmap`,
+                and any journalled changes take precedence over it;
+                if the index is missing or stale, this falls back to a (cached) `.read()`
+            See `help(Controller.read)` for the meaning of `allow_unlocked_read`
+        '''
+        with self.rlock:
+            if not (allow_unlocked_read or self.flock.held):
+                raise RuntimeError('Refusing to read from the database without holding the file-lock when allow_unlocked_read is false')
+            if (ident := self._identity()) is None: return {}
+            if ((self._cache is None) or (self._cache[0] != ident)) and ((found := self._index_lookup(ids)) is not None):
+                return found
+            state = self.read(allow_unlocked_read=True, readonly=True)
+            return {id: (id in state.expl, (state.expl[id] if id in state.expl else state.deps[id]))
+                    for id in ids if (id in state.expl) or (id in state.deps)}
+    def search(self, prefix: str = '', *, allow_unlocked_read: bool = False) -> dict[str, tuple[bool, bool]]:
+        '''
+            Returns a `dict` that maps each ID in the database that starts with `prefix`, in sorted order,
+                to a tuple of whether it is explicitly installed, and whether it is a plugin
+            Like `.lookup()`, the sorted index is searched (by binary search for the first matching ID) if the `State` is not cached,
+                and any journalled changes take precedence over it
+            See `help(Controller.read)` for the meaning of `allow_unlocked_read`
+        '''
+        with self.rlock:
+            if not (allow_unlocked_read or self.flock.held):
+                raise RuntimeError('Refusing to read from the database without holding the file-lock when allow_unlocked_read is false')
+            if (ident := self._identity()) is None: return {}
+            if ((self._cache is None) or (self._cache[0] != ident)) and ((found := self._index_search(prefix)) is not None):
+                return found
+            state = self.read(allow_unlocked_read=True, readonly=True)
+            return {id: (id in state.expl, (state.expl[id] if id in state.expl else state.deps[id]))
+                    for id in sorted(id for ids in (state.expl.keys(), state.deps.keys()) for id in ids if id.startswith(prefix))}
+    @trace.traced('db.write_journal')
+    def _write_journal(self, prev: State, s: State, changes: dict[str, tuple[bool, bool] | None], edges: dict[str, tuple[str, ...] | None]):
+        with self._jfp.open('ab') as jf:
+            if jf.tell() != self._jvalid: # drop anything after the last complete record (a torn append, or a stale journal)
+                jf.truncate(self._jvalid)
+                jf.seek(self._jvalid)
+            if created := not jf.tell(): jf.write(self._frame(self._packer.pack(prev.chksum)))
+            jf.write(self._frame(self._packer.pack({'mtime': s.mtime, 'chksum': s.chksum, 'changes': changes, 'edges': edges})))
+            if self.durability != self.DURABILITY_NONE:
+                jf.flush()
+                os.fsync(jf.fileno())
+            self._jvalid = jsize = jf.tell()
+        if created: self._sync_dir()
+        if (jsize > self.JOURNAL_COMPACT_BYTES) or (jsize > (self._dbfp.stat().st_size * self.JOURNAL_COMPACT_RATIO)):
+            self._write_snapshot(s)
+    def compact(self):
+        '''
+            Folds the journal into a new base snapshot, upgrading the database to `State.LATEST_VERSION` if necessary
+            Raises `RuntimeError` if the file-lock (`.flock`, `packages_db.pakd.lock`) is not obtained exclusively
+        '''
+        with self.rlock:
+            if not self.flock.exclusive:
+                raise RuntimeError('Refusing to compact the database without holding the file-lock exclusively')
+            if self._identity() is None: return
+            self.write(self.read(), compact=True)
+
+    # Reading and writing
+    @trace.traced('db.read')
+    def read(self, *, allow_unlocked_read: bool = False, allow_nonexist_read: bool = True, readonly: bool = False) -> State:
+        '''
+            Reads a `State` from the database, folding in any journalled changes
+            The last unpacked `State` is cached, and reused for as long as the database and journal files\'
+                inode, size, and modification time (in nanoseconds) are unchanged;
+                `.cache_hits` and `.cache_misses` count how often this happens
+            If `readonly` is true, then the cached `State` is returned as-is through `State.readonly()`,
+                otherwise a copy is returned that may be freely modified
             If `allow_unlocked_read` is false, and the file-lock (`.flock`, `packages_db.pakd.lock`) is not obtained,
                 then a `RuntimeError` is raised
                 Note that the normal lock (`.rlock`) is still obtained for reading,
                     which in turn blocks the file-lock; even if `allow_unlocked_read` is true
             If `allow_nonexist_read` is false, and the database file (`packages_db.pakd`) doesn't exist,
                 a `FileNotFoundError` is raised; otherwise, an empty `State` is returned with an `mtime` of `-1`
+            If the snapshot cannot be unpacked, or does not match its checksum (when `.verify_reads` is true),
+                then the backup is read instead, or a `ValueError` is raised if the backup is unusable too
+            Journal records are folded only up to the first record that is torn, cannot be unpacked, or does not match its checksum
         '''
         with self.rlock:
             if not (allow_unlocked_read or self.flock.held):
                 raise RuntimeError('Refusing to read from the database without holding the file-lock when allow_unlocked_read is false')
-            if not self._dbfp.exists():
-                if allow_nonexist_read: return self._STATE_OBJECT(expl={}, deps={}, mtime=-1, chksum=self._db_state_null_chksum)
+            if (ident := self._identity()) is None:
+                if allow_nonexist_read:
+                    state = self._STATE_OBJECT(expl={}, deps={}, mtime=-1, chksum=self._db_state_null_chksum, edges={})
+                    return state.compacted() if self.compact_state else state
                 raise FileNotFoundError('Refusing to read from the database when it doesn\'t exist and allow_nonexist_read is false')
-            return self._STATE_OBJECT(**self._packer.unpack(self._dbfp.read_bytes())[0])
-    def write(self, s: State):
+            if (self._cache is not None) and (self._cache[0] == ident):
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                with trace.span('db.unpack'): state = self._unpack(self._dbfp)
+                self._recovered = state is None
+                if self._recovered:
+                    with trace.span('db.recover'): state = self._unpack(self._bfp)
+                    if state is None:
+                        raise ValueError(f'The database snapshot ({self._dbfp}) is torn or corrupt, and there is no intact backup ({self._bfp}) to recover from')
+                    self.recoveries += 1
+                if self.compact_state and (state.vers >= 3.0): state = state.compacted() # older checksums depend on the order of the entries
+                self._cache = (ident, state if state.vers < 3.0 else self._fold_journal(state))
+            return self._cache[1].readonly() if readonly else self._cache[1].copy()
+    @trace.traced('db.write')
+    def write(self, s: State, *, compact: bool = False):
         '''
             Writes a `State` to the database, automatically calculating its checksum in the process
-            Raises `RuntimeError` if the file-lock (`.flock`, `packages_db.pakd.lock`) is not obtained
+            Only the entries that changed since the last `.read()` are appended to the journal,
+                and the checksum is updated from only those entries,
+                unless `compact` is true, or the database is older than `State.LATEST_VERSION` (in which case it is upgraded),
+                or the database was changed since the last `.read()`;
+                in these cases, a full snapshot is written instead
+            The written `State` replaces the cached `State` (see `help(Controller.read)`),
+                and the cached dependency graph (if any) is updated with only the edges that changed
+            Raises `RuntimeError` if the file-lock (`.flock`, `packages_db.pakd.lock`) is not obtained exclusively
+        '''
+        with self.rlock:
+            if not self.flock.exclusive:
+                raise RuntimeError('Refusing to write a state to the database without holding the file-lock exclusively')
+            prev = self._cache
+            dgraph = self._graph
+            self._cache = self._graph = None
+            s = s._replace(vers=self._STATE_OBJECT.LATEST_VERSION, edges={} if s.edges is None else s.edges)
+            fresh = (prev is not None) and (prev[0] == self._identity()) and not self._recovered
+            edges = self._diff_edges(prev[1], s) if fresh else None
+            if compact or not fresh or (prev[1].vers < s.vers):
+                s = s.update() if self._TOTAL_AUTOBOUND else s.update(self.bound)
+                self._write_snapshot(s)
+            else:
+                changes = self._diff(prev[1], s)
+                s = s.update_from(prev[1], changes, edges) if self._TOTAL_AUTOBOUND else s.update_from(self.bound, prev[1], changes, edges)
+                self._write_journal(prev[1], s, changes, edges)
+                was_missing = prev[1].missing(changes.keys())
+                if any((ent is None) != (id in was_missing) for id,ent in changes.items()) or not self._idfp.exists(): self._write_ids(s)
+            if self.compact_state and (s.entries() is None): s = s.compacted()
+            self._cache = (self._identity(), s)
+            if fresh and (dgraph is not None) and (dgraph[0] == prev[0]):
+                dgraph[1].update(edges)
+                self._graph = (self._cache[0], dgraph[1])
+
+    # Verification
+    @trace.traced('db.check')
+    def check(self, *, allow_unlocked_read: bool = False) -> tuple[bytes, bytes]:
+        '''
+            Returns the checksum that the database reports, and the checksum calculated from its entries (including any journalled changes)
+            Snapshots from version 4.0 are streamed through an `EntryChecksum` one frame at a time, keeping only the entries that the journal changes,
+                whose records are then checked as they are folded (see `help(Controller.read)`);
+                older snapshots, and snapshots that are a single packed `State`, torn, or corrupt, are instead `.read()` and checksummed in full
+            See `help(Controller.read)` for the meaning of `allow_unlocked_read`
+        '''
+        with self.rlock:
+            if not (allow_unlocked_read or self.flock.held):
+                raise RuntimeError('Refusing to read from the database without holding the file-lock when allow_unlocked_read is false')
+            try:
+                with self._dbfp.open('rb') as f:
+                    if ((head := self._snapshot_header(f)) is not None) and (head['vers'] >= 4.0):
+                        return self._check_stream(f, head)
+            except FileNotFoundError: pass
+            except Exception: pass # torn or corrupt, so `.read()` recovers from the backup
+            state = self.read(allow_unlocked_read=True, readonly=True)
+            return (state.chksum, state.mkchksum() if self._TOTAL_AUTOBOUND else state.mkchksum(self.bound))
+    def _check_stream(self, f: typing.BinaryIO, head: dict[str, typing.Any]) -> tuple[bytes, bytes]:
+        _,_,records = self._read_journal(head['chksum'])
+        touched = {id for _,rec in records for id in rec['changes']}
+        touched_edges = {id for _,rec in records for id in (rec.get('edges') or {})}
+        base = self._STATE_OBJECT(expl={}, deps={}, mtime=head['mtime'], chksum=head['chksum'], vers=head['vers'], edges={})
+        chk = EntryChecksum(self.bound.core.util.hashtools.ALGORITHM_DEFAULT_LOW, head['vers'])
+        for part in self._snapshot_parts(f, head):
+            for key,explicit,entries in (('expl', True, base.expl), ('deps', False, base.deps)):
+                for id,plugin in part.get(key, {}).items():
+                    chk.add(id, explicit, plugin)
+                    if id in touched: entries[id] = plugin
+            for id,deps in part.get('edges', {}).items():
+                if head['vers'] >= 5.0: chk.add_edges(id, deps)
+                if id in touched_edges: base.edges[id] = tuple(deps)
+        if (calculated := chk.digest()) != head['chksum']: return (head['chksum'], calculated)
+        base,_ = self._fold_records(base, records)
+        return (base.chksum, base.chksum)
+
+    # Dependencies
+    def graph(self, *, allow_unlocked_read: bool = False) -> graph.DepGraph:
+        '''
+            Returns the dependency graph of the database (see `graph.DepGraph`), built from `State.edges`
+            The graph is cached alongside the cached `State`, and should not be modified
+            See `help(Controller.read)` for the meaning of `allow_unlocked_read`
         '''
         with self.rlock:
-            if not self.flock.held:
-                raise RuntimeError('Refusing to write a state to the database without holding the file-lock')
-            self._dbfp.write_bytes(self._packer.pack(s.update(lazy=True) if self._TOTAL_AUTOBOUND
-                                                     else s.update(self.bound, lazy=True)))
+            state = self.read(allow_unlocked_read=allow_unlocked_read, readonly=True)
+            if (self._cache is None) or (self._graph is None) or (self._graph[0] != self._cache[0]):
+                self._graph = (None if self._cache is None else self._cache[0], graph.DepGraph(state.edges))
+            return self._graph[1]
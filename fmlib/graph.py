@@ -0,0 +1,77 @@
+#!/bin/python3
+
+'''Dependency graph queries over the edges recorded in the database'''
+
+#> Imports
+import typing
+import graphlib
+from collections import deque
+#</Imports
+
+#> Header >/
+__all__ = ('DepGraph',)
+
+class DepGraph:
+    '''
+        Adjacency indexes over dependency edges (see `db.State.edges`):
+            `.fwd` maps each package ID to the IDs it depends on, and `.rev` maps each package ID to the IDs that depend on it
+        `.update()` applies changed edges incrementally, without rebuilding either index
+        All traversals are breadth-first, and visit each package and edge at most once (O(V+E))
+    '''
+    __slots__ = ('fwd', 'rev')
+
+    def __init__(self, edges: typing.Mapping[str, typing.Iterable[str]] = {}):
+        self.fwd = {}
+        self.rev = {}
+        for id,deps in edges.items(): self._link(id, deps)
+
+    # Updating
+    def _link(self, id: str, deps: typing.Iterable[str]):
+        self.fwd[id] = deps = frozenset(deps)
+        for dep in deps: self.rev.setdefault(dep, set()).add(id)
+    def _unlink(self, id: str):
+        for dep in self.fwd.pop(id, ()):
+            self.rev[dep].discard(id)
+            if not self.rev[dep]: del self.rev[dep]
+    def update(self, changes: typing.Mapping[str, typing.Iterable[str] | None]):
+        '''Replaces the edges of each ID in `changes` with its new edges, or removes them if they are `None`'''
+        for id,deps in changes.items():
+            self._unlink(id)
+            if deps: self._link(id, deps)
+
+    # Traversal
+    @staticmethod
+    def _reach(adj: dict[str, typing.Collection[str]], ids: typing.Iterable[str], recursive: bool) -> set[str]:
+        ids = set(ids)
+        if not recursive: return {n for id in ids for n in adj.get(id, ())}
+        seen = set(ids)
+        queue = deque(ids)
+        while queue:
+            for n in adj.get(queue.popleft(), ()):
+                if n in seen: continue
+                seen.add(n)
+                queue.append(n)
+        return seen - ids
+    def depends(self, ids: typing.Iterable[str], *, recursive: bool = False) -> set[str]:
+        '''Returns the IDs that any of `ids` depend on (directly, unless `recursive` is true), excluding `ids` themselves'''
+        return self._reach(self.fwd, ids, recursive) - set(ids)
+    def rdeps(self, ids: typing.Iterable[str], *, recursive: bool = False) -> set[str]:
+        '''Returns the IDs that depend on any of `ids` (directly, unless `recursive` is true), excluding `ids` themselves'''
+        return self._reach(self.rev, ids, recursive) - set(ids)
+    def orphans(self, expl: typing.Iterable[str], deps: typing.Iterable[str]) -> set[str]:
+        '''Returns which of the dependency packages `deps` are not depended on, directly or indirectly, by any of the explicit packages `expl`'''
+        expl = set(expl)
+        return set(deps) - expl - self._reach(self.fwd, expl, True)
+
+    # Ordering
+    def order(self, ids: typing.Iterable[str] | None = None, *, remove: bool = False) -> list[str]:
+        '''
+            Returns `ids` (or every package in the graph, if `ids` is `None`) topologically sorted,
+                such that each package comes after the packages it depends on (for installation),
+                or before them if `remove` is true (for removal)
+            Only edges between packages in `ids` are considered
+            Raises `graphlib.CycleError` if the packages' dependencies are cyclic
+        '''
+        ids = (self.fwd.keys() | self.rev.keys()) if ids is None else set(ids)
+        order = list(graphlib.TopologicalSorter({id: sorted(self.fwd.get(id, frozenset()) & ids) for id in sorted(ids)}).static_order())
+        return order[::-1] if remove else order
@@ -0,0 +1,169 @@
+#!/bin/python3
+
+'''Reader/writer file-locking'''
+
+#> Imports
+import os
+import time
+import typing
+import threading
+import contextlib
+from pathlib import Path
+
+try: import fcntl
+except ModuleNotFoundError: fcntl = None
+
+from . import trace
+#</Imports
+
+#> Header >/
+__all__ = ('HAVE_SHARED', 'RWFLock')
+
+HAVE_SHARED = fcntl is not None
+
+class RWFLock:
+    '''
+        A file-lock that can either be shared by many readers, or held exclusively by one writer
+        If shared locks are unsupported on this platform (`HAVE_SHARED` is false),
+            then an instance of `fallback` (constructed with the same arguments) is used in their place,
+            making every acquisition exclusive
+        Using the lock as a context manager holds it exclusively, see `.shared()` for holding it shared
+        Within this process, the lock is owned per-thread: acquisitions by the same thread nest,
+            whilst other threads wait (through a condition on `lock`) for it to be released,
+            unless both they and the threads holding it want it shared
+        `.held` and `.exclusive` report whether any thread in this process holds the lock,
+            so that work done on behalf of the owning thread (such as by a timer) may rely on it
+        Time spent waiting for the lock is recorded in `.last_wait` (in seconds),
+            and accumulated per-mode in `.wait_time` and `.acquisitions`
+    '''
+    __slots__ = ('path', 'lock', 'mode',
+                 'last_wait', 'wait_time', 'acquisitions',
+                 '_fd', '_owners', '_writers', '_cond', '_fallback')
+
+    SHARED = 'shared'
+    EXCLUSIVE = 'exclusive'
+
+    def __init__(self, path: Path, lock: threading.RLock, *, fallback: typing.Callable[[Path, threading.RLock], typing.Any] | None = None):
+        self.path = path
+        self.lock = lock
+        self.mode = None
+        self.last_wait = 0.
+        self.wait_time = {self.SHARED: 0., self.EXCLUSIVE: 0.}
+        self.acquisitions = {self.SHARED: 0, self.EXCLUSIVE: 0}
+        self._fd = None
+        self._owners = {} # thread identifier -> depth
+        self._writers = 0 # threads waiting to hold the lock exclusively
+        self._cond = threading.Condition(lock)
+        if HAVE_SHARED: self._fallback = None
+        elif fallback is None:
+            raise TypeError('A fallback lock is required on platforms without shared file-locks')
+        else: self._fallback = fallback(path, lock)
+
+    @property
+    def held(self) -> bool:
+        return self.mode is not None
+    @property
+    def exclusive(self) -> bool:
+        return self.mode == self.EXCLUSIVE
+
+    def _lock(self, mode: str, start: float):
+        with trace.span('lock.wait', path=str(self.path), mode=mode):
+            if self._fallback is not None:
+                if not self._fallback.held: self._fallback.acquire()
+            else:
+                if opened := self._fd is None: self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try: fcntl.flock(self._fd, fcntl.LOCK_SH if mode == self.SHARED else fcntl.LOCK_EX)
+                except BaseException:
+                    if opened:
+                        os.close(self._fd)
+                        self._fd = None
+                    raise
+        self.mode = mode
+        self._waited(mode, start)
+    def _unlock(self):
+        if self._fallback is not None: self._fallback.release()
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.mode = None
+    def _waited(self, mode: str, start: float):
+        self.last_wait = time.perf_counter() - start
+        self.wait_time[mode] += self.last_wait
+        self.acquisitions[mode] += 1
+    def _wait_exclusive(self):
+        self._writers += 1
+        try: self._cond.wait_for(lambda: not self._owners)
+        finally: self._writers -= 1
+
+    def acquire(self, *, shared: bool = False):
+        '''
+            Acquires the lock, either shared or exclusively, waiting for any other threads to release it first
+            Acquiring a lock already held by this thread nests, but an exclusive acquisition whilst it is held shared
+                raises a `RuntimeError`, see `.upgrade()`
+        '''
+        mode = self.SHARED if shared else self.EXCLUSIVE
+        me = threading.get_ident()
+        start = time.perf_counter()
+        with self._cond:
+            if me in self._owners:
+                if (mode == self.EXCLUSIVE) and not self.exclusive:
+                    raise RuntimeError('Cannot acquire a shared lock exclusively, use .upgrade() instead')
+                self._owners[me] += 1
+                return
+            if mode == self.EXCLUSIVE: self._wait_exclusive()
+            else: self._cond.wait_for(lambda: (not self._owners) or ((self.mode == self.SHARED) and not self._writers))
+            if self._owners: self._waited(mode, start) # joining other threads' shared lock
+            else: self._lock(mode, start)
+            self._owners[me] = 1
+    def release(self):
+        '''Releases one level of this thread's hold on the lock, unlocking it when the last thread's outermost acquisition is released'''
+        me = threading.get_ident()
+        with self._cond:
+            if me not in self._owners:
+                raise RuntimeError('Cannot release a lock that this thread does not hold')
+            self._owners[me] -= 1
+            if self._owners[me]: return
+            del self._owners[me]
+            if not self._owners: self._unlock()
+            self._cond.notify_all()
+
+    def upgrade(self):
+        '''
+            Converts a shared lock held by this thread to an exclusive lock,
+                waiting for any other threads that share it to release it
+            Note that this is not atomic: another writer (in this or another process) may obtain the lock in-between
+        '''
+        me = threading.get_ident()
+        start = time.perf_counter()
+        with self._cond:
+            if me not in self._owners:
+                raise RuntimeError('Cannot upgrade a lock that this thread does not hold')
+            if self.exclusive: return
+            depth = self._owners.pop(me)
+            if self._owners: # let the other readers (or another upgrading thread) finish first
+                self._cond.notify_all()
+                self._wait_exclusive()
+            self._lock(self.EXCLUSIVE, start)
+            self._owners[me] = depth
+    def downgrade(self):
+        '''Converts an exclusive lock held by this thread to a shared lock'''
+        with self._cond:
+            if threading.get_ident() not in self._owners:
+                raise RuntimeError('Cannot downgrade a lock that this thread does not hold')
+            if not self.exclusive: return
+            if self._fallback is None: fcntl.flock(self._fd, fcntl.LOCK_SH)
+            self.mode = self.SHARED
+            self._cond.notify_all()
+
+    def __enter__(self) -> typing.Self:
+        self.acquire()
+        return self
+    def __exit__(self, *exc):
+        self.release()
+    @contextlib.contextmanager
+    def shared(self) -> typing.Iterator[typing.Self]:
+        '''Holds the lock shared for the duration of the context'''
+        self.acquire(shared=True)
+        try: yield self
+        finally: self.release()
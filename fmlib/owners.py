@@ -0,0 +1,108 @@
+#!/bin/python3
+
+'''Persisted reverse index of which package owns each file'''
+
+#> Imports
+import os
+import typing
+import threading
+from pathlib import Path
+
+from . import FLType
+from . import _total_autobind_store
+from . import packages
+from . import trace
+#</Imports
+
+#> Header >/
+__all__ = ('OwnerIndex',)
+
+@_total_autobind_store.bindable_cls('owners')
+class OwnerIndex:
+    '''
+        A reverse index of the files tracked by each package, persisted next to the database (`packages_db.pakd.owners`)
+        Each package's entry is keyed on the modification times and sizes of its `blueprint.json` and `package_db.pakd` (see `packages.package_stamp()`),
+            so `.refresh()` only reloads packages that changed
+        Paths are stored relative to `root` where possible (and absolute otherwise),
+            and each lookup is a single `dict` access
+        Note that the index is not locked by itself; it is expected to be used whilst holding the database's file-lock
+    '''
+    __slots__ = ('bound', 'path', 'root',
+                 'packages', 'files',
+                 '_fp', '_packer', '_lock', '_dirty')
+
+    OWNERS_FILENAME = 'packages_db.pakd.owners'
+    OWNERS_VERSION = 2
+
+    @_total_autobind_store.bindable_meth
+    def __init__(self, fl: FLType, dbpath: Path, root: Path):
+        self.bound = fl
+        self.path = dbpath
+        self.root = root.resolve()
+        self._fp = self.path / self.OWNERS_FILENAME
+        self._packer = self.bound.core.util.pack.Packer()
+        self._lock = threading.Lock()
+        self._dirty = False
+        try: packed = self._packer.unpack(self._fp.read_bytes())[0]
+        except FileNotFoundError: packed = {}
+        if packed.get('vers') != self.OWNERS_VERSION: packed = {} # index from an older version, rebuilt by `.refresh()`
+        self.packages = {id: (None if stamp is None else tuple(map(tuple, stamp)), tuple(files))
+                         for id,(stamp,files) in packed.get('packages', {}).items()}
+        self.files = {f: id for id,(_,fs) in self.packages.items() for f in fs}
+
+    # Paths
+    def _key(self, p: Path) -> str:
+        p = Path(os.path.abspath(p))
+        return p.relative_to(self.root).as_posix() if p.is_relative_to(self.root) else p.as_posix()
+
+    # Updating
+    def record(self, id: str, pkg: packages.PackageType, at: Path):
+        '''Records (or replaces) the files tracked by the package `pkg` with ID `id`, installed at `at`'''
+        files = tuple(self._key(at/f) for f in pkg.files)
+        with self._lock:
+            self._forget(id)
+            self.packages[id] = (packages.package_stamp(at), files)
+            self.files.update(dict.fromkeys(files, id))
+            self._dirty = True
+    def _forget(self, id: str):
+        if id not in self.packages: return
+        for f in self.packages.pop(id)[1]:
+            if self.files.get(f) == id: del self.files[f]
+        self._dirty = True
+    def forget(self, id: str):
+        '''Removes the package with ID `id` from the index'''
+        with self._lock: self._forget(id)
+    @trace.traced('owners.refresh')
+    def refresh(self, ids: typing.Iterable[str]) -> bool:
+        '''
+            Brings the index up-to-date with the installed packages `ids` (under `root`),
+                reloading only those whose `blueprint.json` or `package_db.pakd` changed,
+                and forgetting any packages not in `ids`
+            Returns whether the index changed
+        '''
+        ids = set(ids)
+        for id in self.packages.keys() - ids: self.forget(id)
+        for id in ids:
+            at = self.root / packages.id_to_name(id)
+            stamp = packages.package_stamp(at)
+            if (id in self.packages) and (self.packages[id][0] == stamp): continue
+            if stamp is None:
+                self.forget(id)
+                continue
+            try: pkg = self.bound.core.frameworks.blueprint.Package(at)
+            except Exception: self.forget(id)
+            else: self.record(id, pkg, at)
+        return self._dirty
+    def save(self):
+        '''Writes the index to disk if it was changed'''
+        with self._lock:
+            if not self._dirty: return
+            tmp = self._fp.with_name(f'{self.OWNERS_FILENAME}.{os.getpid()}.tmp')
+            tmp.write_bytes(self._packer.pack({'vers': self.OWNERS_VERSION, 'packages': self.packages}))
+            os.replace(tmp, self._fp)
+            self._dirty = False
+
+    # Querying
+    def owner(self, path: Path | str) -> str | None:
+        '''Returns the ID of the package that owns `path`, or `None` if no package owns it'''
+        return self.files.get(self._key(Path(path)))
@@ -3,29 +3,40 @@
 '''Utilities for manipulating FlexiLynx/blueprint packages'''
 
 #> Imports
+import os
+import json
 import typing
+import threading
+import collections
 from pathlib import Path
 
 from . import FLType
 from . import _total_autobind_store
+from . import trace
 #</Imports
 
 #> Header >/
 __all__ = ('PackageType',
            'setup_from_url', 'setup_from_bytes', 'setup_from_dict', 'setup_from_blueprint',
+           'setup_many',
            'id_to_name',
-           'package_from_dir')
+           'PACKAGE_FILENAMES', 'package_stamp', 'package_from_dir', 'PackageCache',
+           'probe_id', 'scan_root',
+           'draft_index', 'scan_installed', 'iter_file_report')
 
 # Package typehint
 type PackageType = object
 
 # Setup functions
 @_total_autobind_store.bindable_func('packages')
-def setup_from_url(fl: FLType, url: str, to: Path, *, fetchfn: typing.Callable[[str], bytes] | None = None) -> PackageType:
+def setup_from_url(fl: FLType, url: str, to: Path, *, fetchfn: typing.Callable[[str], bytes] | None = None,
+                   cache: typing.ForwardRef('cache.BlueprintCache') | None = None) -> PackageType:
     '''
         Sets up and returns the package with a blueprint from `url` to the path `to`
+        If `cache` is given, the blueprint is fetched and deserialized through it
         See `help(setup_from_blueprint)` for more information
     '''
+    if cache is not None: return setup_from_blueprint(fl, cache.blueprint(url, fetchfn), to)
     return setup_from_bytes(fl, (fl.core.util.net.fetch1 if fetchfn is None else fetchfn)(url), to)
 @_total_autobind_store.bindable_func('packages')
 def setup_from_bytes(fl: FLType, data: bytes, to: Path) -> PackageType:
@@ -42,32 +53,235 @@ def setup_from_dict(fl: FLType, d: dict, to: Path) -> PackageType:
     '''
     return setup_from_blueprint(fl, fl.core.frameworks.blueprint.Blueprint.deserialize_from_dict(d), to)
 @_total_autobind_store.bindable_func('packages')
-def setup_from_blueprint(fl: FLType, bp: 'Blueprint', to: Path) -> PackageType:
+def setup_from_blueprint(fl: FLType, bp: 'Blueprint', to: Path, *, owners: typing.ForwardRef('owners.OwnerIndex') | None = None) -> PackageType:
     '''
         Sets up and returns the package with blueprint `bp` to the path `to`
         Note that this only `.install()`s the `blueprint.json` and `package_db.pakd`,
             executing `.sync()` on the package may be necessary
         If the directory `to` doesn't exist, it is created
+        If `owners` is given, the package's files are recorded in it (though it is not saved)
     '''
     to.mkdir(exist_ok=True, parents=True)
     pkg = fl.core.frameworks.blueprint.Package(bp)
     pkg.install(to)
     pkg.save()
+    if owners is not None: owners.record(bp.id, pkg, to)
     return pkg
 
+@_total_autobind_store.bindable_func('packages')
+def setup_many(fl: FLType, urls: typing.Iterable[str], root: Path, *, jobs: int = 8, fetchfn: typing.Callable[[str], bytes] | None = None,
+               db: typing.ForwardRef('db.Controller') | None = None, cache: typing.ForwardRef('cache.BlueprintCache') | None = None,
+               owners: typing.ForwardRef('owners.OwnerIndex') | None = None, explicit: bool = True, plugin: bool = False) -> dict[str, PackageType]:
+    '''
+        Sets up and returns the packages with blueprints from each of `urls`,
+            each to the directory `root/id_to_name(<blueprint ID>)`, as a `dict` mapping each URL to its package
+        Blueprints are fetched and deserialized concurrently on a pool of `jobs` threads (through `cache`, if it is given),
+            and packages are set up concurrently, except that set ups to the same directory are serialized
+        If `db` (a `db.Controller` whose file-lock is held exclusively) is given,
+            all of the packages that were set up are recorded in it in a single write,
+            as explicitly installed if `explicit` is true (otherwise as dependencies), and as plugins if `plugin` is true
+        If `owners` is given, the packages' files are recorded in it, and it is saved once all packages are set up
+        If any package fails to be set up, the rest are still set up (and recorded),
+            then an `ExceptionGroup` of the failures is raised
+        See `help(setup_from_blueprint)` for more information
+    '''
+    fetch = fl.core.util.net.fetch1 if fetchfn is None else fetchfn
+    locks = {}
+    locks_lock = threading.Lock()
+    def setup(url: str) -> tuple[str, PackageType]:
+        bp = (fl.core.frameworks.blueprint.Blueprint.deserialize(fetch(url).decode()) if cache is None
+              else cache.blueprint(url, fetch))
+        to = root / id_to_name(bp.id)
+        with locks_lock: lock = locks.setdefault(to, threading.Lock())
+        with lock: return (bp.id, setup_from_blueprint(fl, bp, to, owners=owners))
+    from concurrent.futures import ThreadPoolExecutor
+    urls = tuple(dict.fromkeys(urls))
+    pkgs = {}
+    ids = {}
+    errors = []
+    with ThreadPoolExecutor(jobs, thread_name_prefix='fleximan-setup') as pool:
+        for url,fut in zip(urls, [pool.submit(setup, u) for u in urls]):
+            try: ids[url],pkgs[url] = fut.result()
+            except Exception as e:
+                e.add_note(f'Whilst setting up package from {url}')
+                errors.append(e)
+    if (db is not None) and ids:
+        state = db.read()
+        for id in ids.values():
+            (state.deps if explicit else state.expl).pop(id, None)
+            (state.expl if explicit else state.deps)[id] = plugin
+        db.write(state)
+    if owners is not None: owners.save()
+    if errors: raise ExceptionGroup(f'Failed to set up {len(errors)} of {len(urls)} package(s)', errors)
+    return pkgs
+
 # String functions
 def id_to_name(id: str) -> str:
     '''Converts an ID to its corresponding standard folder name'''
     return id.replace(':', '-').replace('/', '_')
 
 # Directory functions
+PACKAGE_FILENAMES = ('blueprint.json', 'package_db.pakd')
+def package_stamp(d: Path) -> tuple[tuple[int, int], ...] | None:
+    '''
+        Returns the modification times (in nanoseconds) and sizes of the package files (`PACKAGE_FILENAMES`) in `d`,
+            or `None` if any of them are missing
+    '''
+    try: return tuple((st.st_mtime_ns, st.st_size) for st in ((d/f).stat() for f in PACKAGE_FILENAMES))
+    except FileNotFoundError: return None
+
 @_total_autobind_store.bindable_func('packages')
-def package_from_dir(fl: FLType, d: Path) -> PackageType | None:
+def package_from_dir(fl: FLType, d: Path, *, cache: typing.ForwardRef('PackageCache') | None = None) -> PackageType | None:
     '''
-        Gets a package from a directory
+        Gets a package from a directory, through `cache` if it is given
         Returns `None` if the directory doesn't exist or is not a package
     '''
     if not d.exists(): return None
     try:
-        return fl.core.frameworks.blueprint.Package(d)
+        return fl.core.frameworks.blueprint.Package(d) if cache is None else cache.load(d)
     except Exception: return None
+
+@_total_autobind_store.bindable_cls('packages')
+class PackageCache:
+    '''
+        An in-memory cache of packages loaded from directories, keyed on the modification times and sizes of their package files (see `package_stamp()`)
+        Up to `max_entries` packages are kept, evicting the least-recently used
+        Note that cached packages are shared between callers, and so should not be modified
+        `.hits` and `.misses` count how packages were loaded
+    '''
+    __slots__ = ('bound', 'max_entries',
+                 'hits', 'misses',
+                 '_mem', '_lock')
+
+    @_total_autobind_store.bindable_meth
+    def __init__(self, fl: FLType, max_entries: int = 256):
+        self.bound = fl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._mem = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, d: Path, stamp: tuple, pkg: PackageType):
+        with self._lock:
+            self._mem[d] = (stamp, pkg)
+            self._mem.move_to_end(d)
+            while len(self._mem) > self.max_entries: self._mem.popitem(last=False)
+
+    @trace.traced('packages.load')
+    def load(self, d: Path) -> PackageType:
+        '''Loads the package in `d`, raising any exceptions that constructing it would'''
+        d = Path(os.path.abspath(d))
+        if (stamp := package_stamp(d)) is None: # let the package report what is missing
+            return self.bound.core.frameworks.blueprint.Package(d)
+        with self._lock:
+            if (ent := self._mem.get(d)) is not None and (ent[0] == stamp):
+                self._mem.move_to_end(d)
+                self.hits += 1
+                return ent[1]
+        self.misses += 1
+        pkg = self.bound.core.frameworks.blueprint.Package(d)
+        self._remember(d, stamp, pkg)
+        return pkg
+
+# Root scanning
+def probe_id(d: str) -> str | None:
+    '''
+        Returns the ID in the blueprint of the package in the directory `d`, without constructing the package,
+            or `None` if `d` is missing any of its package files (`PACKAGE_FILENAMES`) or its blueprint has no ID
+    '''
+    try:
+        with open(os.path.join(d, PACKAGE_FILENAMES[0]), 'rb') as f: bp = json.load(f)
+        if not all(os.path.isfile(os.path.join(d, pf)) for pf in PACKAGE_FILENAMES[1:]): return None
+    except (OSError, ValueError): return None
+    return id if isinstance(bp, dict) and isinstance(id := bp.get('id'), str) else None
+def _probe_ids(ds: typing.Sequence[str]) -> list[str | None]:
+    return [probe_id(d) for d in ds]
+@trace.traced('packages.scan_root')
+def scan_root(root: Path, *, jobs: int = 8) -> dict[str, str]:
+    '''
+        Returns a mapping of the name of each package directory directly within `root` to the ID in its blueprint (see `probe_id()`)
+        `root` is listed in a single `os.scandir()`, and its directories are probed on a pool of `jobs` threads (if `jobs` is more than 1);
+            hidden directories (such as `.fleximan_cache`) are skipped
+    '''
+    with os.scandir(root) as it:
+        dirs = sorted(e.name for e in it if (not e.name.startswith('.')) and e.is_dir())
+    paths = [os.path.join(root, n) for n in dirs]
+    if (jobs <= 1) or (len(paths) < 2): ids = _probe_ids(paths)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        size = -(-len(paths) // (jobs * 4)) # a few batches per thread, to amortize scheduling
+        with ThreadPoolExecutor(jobs, thread_name_prefix='fleximan-scan') as pool:
+            ids = [id for batch in pool.map(_probe_ids, (paths[i:i+size] for i in range(0, len(paths), size))) for id in batch]
+    return {n: id for n,id in zip(dirs, ids) if id is not None}
+
+# File reports
+def draft_index(bp: 'Blueprint') -> dict[str, tuple[str, ...]]:
+    '''Returns a mapping of each file mentioned by `bp`'s drafts to the IDs of the drafts that mention it'''
+    index = {}
+    for did,d in (bp.drafts or {}).items():
+        for f in d.files.keys():
+            index.setdefault(f, []).append(did)
+    return {f: tuple(dids) for f,dids in index.items()}
+_SCAN_MIN_PER_DIR = 12 # directories are only scanned if they hold at least this many of the files looked for on average, otherwise each file is `stat()`ed
+def scan_installed(d: Path, files: typing.Collection[str] | None = None) -> frozenset[str]:
+    '''
+        Returns the relative (POSIX-style) paths of the entries within `d` that exist (broken symbolic links do not count)
+        If `files` is given, only they are looked for: each directory that they are in is scanned with one `os.scandir()`,
+            unless there are only a few of them per directory, in which case each is `stat()`ed instead
+        Otherwise, every entry is found in one `os.scandir()` walk, which follows symbolic links to directories,
+            but not into directories that contain them (so symbolic link loops are not walked)
+    '''
+    if files is None: return _walk_installed(d)
+    parents = {}
+    for f in files:
+        parent,_,name = str(f).rpartition('/')
+        parents.setdefault(parent, set()).add(name)
+    if len(files) < (len(parents) * _SCAN_MIN_PER_DIR):
+        return frozenset(str(f) for f in files if os.path.exists(os.path.join(d, f)))
+    found = set()
+    for parent,names in parents.items():
+        try: it = os.scandir(os.path.join(d, parent))
+        except (FileNotFoundError, NotADirectoryError): continue
+        prefix = f'{parent}/' if parent else ''
+        with it:
+            for e in it:
+                if (e.name not in names) or (e.is_symlink() and not os.path.exists(e.path)): continue
+                found.add(f'{prefix}{e.name}')
+    return frozenset(found)
+def _walk_installed(d: Path) -> frozenset[str]:
+    found = set()
+    stack = [(d, '', frozenset())]
+    while stack:
+        at,prefix,above = stack.pop()
+        try:
+            st = os.stat(at)
+            if (ident := (st.st_dev, st.st_ino)) in above: continue # symbolic link loop
+            it = os.scandir(at)
+        except (FileNotFoundError, NotADirectoryError): continue
+        above |= {ident}
+        with it:
+            for e in it:
+                rel = f'{prefix}{e.name}'
+                if e.is_dir(): stack.append((e.path, f'{rel}/', above))
+                elif e.is_symlink() and not os.path.exists(e.path): continue
+                found.add(rel)
+    return frozenset(found)
+def iter_file_report(pkg: PackageType) -> typing.Iterator[tuple[str, dict]]:
+    '''
+        Yields, in sorted order, each file mentioned by `pkg` or its blueprint (in its main part or any of its drafts),
+            along with a `dict` of its full path (`full`), and whether it is installed (`installed`), tracked (`tracked`),
+            in the main part (`main`), and which drafts mention it (`drafts`)
+    '''
+    drafts = draft_index(pkg.blueprint)
+    main = pkg.blueprint.main.files
+    files = main.keys() | pkg.files | drafts.keys()
+    installed = scan_installed(pkg.at, files)
+    for f in sorted(files):
+        yield (f, {
+            'full': str(pkg.at/f),
+            'installed': str(f) in installed,
+            'tracked': f in pkg.files,
+            'main': f in main,
+            'drafts': drafts.get(f, ()),
+        })
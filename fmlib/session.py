@@ -0,0 +1,186 @@
+#!/bin/python3
+
+'''Units of work over a database, with coalesced writes'''
+
+#> Imports
+import typing
+import threading
+import contextlib
+
+from . import db
+#</Imports
+
+#> Header >/
+__all__ = ('Session',)
+
+type Entry = tuple[bool, bool] | None
+
+class Session(contextlib.AbstractContextManager):
+    '''
+        A unit of work over a `db.Controller`, made through `.mark_explicit()`, `.mark_dependency()`, `.add()`, `.remove()`, `.link()`, and `.unlink()`
+        Entering the session holds the controller's file-lock exclusively (and reads the database);
+            exiting it flushes any pending changes (unless an exception was raised, in which case they are discarded) and releases the lock
+        Each entry (and each entry's dependency edges) is tracked from its first mutation since the last flush,
+            so `.flush()` only writes the net changes, in a single `Controller.write()`;
+            if the changes cancel out, the checksum would be unchanged, and so the write is skipped entirely
+        If `debounce` is given, then a flush is also made `debounce` seconds after the first mutation that has not yet been flushed,
+            coalescing any further mutations made in-between; an exception raised by such a flush is re-raised by the next `.flush()`
+        `.flushes` and `.skipped` count how many flushes wrote to the database, and how many were skipped
+    '''
+    __slots__ = ('controller', 'debounce',
+                 'flushes', 'skipped',
+                 '_state', '_dirty', '_dirty_edges', '_lock', '_timer', '_error')
+
+    def __init__(self, controller: db.Controller, *, debounce: float | None = None):
+        self.controller = controller
+        self.debounce = debounce
+        self.flushes = 0
+        self.skipped = 0
+        self._state = None
+        self._dirty = {}
+        self._dirty_edges = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._error = None
+
+    def __enter__(self) -> typing.Self:
+        self.controller.flock.acquire()
+        try: self._state = self.controller.read()
+        except BaseException:
+            self.controller.flock.release()
+            raise
+        return self
+    def __exit__(self, exc_type: type[BaseException] | None, *exc):
+        try:
+            if exc_type is None: self.flush()
+            else: self.discard()
+        finally:
+            self._state = None
+            self.controller.flock.release()
+
+    @property
+    def state(self) -> db.State:
+        '''A read-only view of the session's `State`, including any pending changes'''
+        if self._state is None:
+            raise RuntimeError('Session is not active; use it as a context manager')
+        return self._state.readonly()
+    @property
+    def dirty(self) -> bool:
+        '''Whether there are any mutations that have not yet been flushed (even if they would cancel out)'''
+        return bool(self._dirty or self._dirty_edges)
+
+    # Entries
+    def _entry(self, id: str) -> Entry:
+        if id in self._state.expl: return (True, self._state.expl[id])
+        if id in self._state.deps: return (False, self._state.deps[id])
+        return None
+    def _touch(self, id: str):
+        if self._state is None:
+            raise RuntimeError('Session is not active; use it as a context manager')
+        self._dirty.setdefault(id, self._entry(id))
+        self._schedule()
+    def _touch_edges(self, id: str):
+        if self._state is None:
+            raise RuntimeError('Session is not active; use it as a context manager')
+        self._dirty_edges.setdefault(id, self._state.edges.get(id))
+        self._schedule()
+
+    # Mutations
+    def add(self, id: str, *, explicit: bool = True, plugin: bool = False):
+        '''Adds (or replaces) the entry `id`, as explicitly installed if `explicit` is true, otherwise as a dependency'''
+        with self._lock:
+            self._touch(id)
+            (self._state.deps if explicit else self._state.expl).pop(id, None)
+            (self._state.expl if explicit else self._state.deps)[id] = plugin
+    def remove(self, id: str, *, missing_ok: bool = False):
+        '''Removes the entry `id` (and its dependency edges), raising `KeyError` if it is not present, unless `missing_ok` is true'''
+        with self._lock:
+            if self._entry(id) is None:
+                if missing_ok: return
+                raise KeyError(id)
+            self._touch(id)
+            self._state.expl.pop(id, None)
+            self._state.deps.pop(id, None)
+            if id in self._state.edges:
+                self._touch_edges(id)
+                del self._state.edges[id]
+    def _mark(self, ids: typing.Iterable[str], explicit: bool) -> set[str]:
+        ids = set(ids)
+        with self._lock:
+            if missing := self._state.missing(ids): raise KeyError(', '.join(sorted(missing)))
+            for id in ids: self._touch(id)
+            return self._state.move(ids, explicit)
+    def mark_explicit(self, ids: typing.Iterable[str]) -> set[str]:
+        '''
+            Marks the entries `ids` as explicitly installed, returning those that were not already
+            Raises `KeyError` (without changing any entries) if any of `ids` are not present
+        '''
+        return self._mark(ids, True)
+    def mark_dependency(self, ids: typing.Iterable[str]) -> set[str]:
+        '''
+            Marks the entries `ids` as dependencies, returning those that were not already
+            Raises `KeyError` (without changing any entries) if any of `ids` are not present
+        '''
+        return self._mark(ids, False)
+
+    # Edges
+    def link(self, id: str, deps: typing.Iterable[str]):
+        '''Records that `id` depends on each of `deps` (see `db.State.edges`)'''
+        with self._lock:
+            self._touch_edges(id)
+            self._state.edges[id] = tuple(sorted(set(self._state.edges.get(id, ())) | set(deps)))
+    def unlink(self, id: str, deps: typing.Iterable[str] | None = None):
+        '''Removes the record of `id` depending on each of `deps`, or on any package if `deps` is `None`'''
+        drop = None if deps is None else set(deps)
+        with self._lock:
+            if id not in self._state.edges: return
+            self._touch_edges(id)
+            if (drop is not None) and (edges := tuple(d for d in self._state.edges[id] if d not in drop)):
+                self._state.edges[id] = edges
+            else: del self._state.edges[id]
+
+    # Flushing
+    def _schedule(self):
+        if (self.debounce is None) or (self._timer is not None): return
+        self._timer = threading.Timer(self.debounce, self._timed_flush)
+        self._timer.daemon = True
+        self._timer.start()
+    def _timed_flush(self):
+        try: self._flush()
+        except Exception as e: self._error = e
+    def _cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+    def _flush(self) -> bool:
+        with self._lock:
+            self._cancel()
+            if (self._state is None) or not (self._dirty or self._dirty_edges): return False
+            changed = any(self._entry(id) != prev for id,prev in self._dirty.items()) \
+                      or any(self._state.edges.get(id) != prev for id,prev in self._dirty_edges.items())
+            if changed: self.controller.write(self._state) # if this raises, the changes are still pending
+            self._dirty.clear()
+            self._dirty_edges.clear()
+            if not changed:
+                self.skipped += 1
+                return False
+            self.flushes += 1
+            return True
+    def flush(self) -> bool:
+        '''
+            Writes any pending changes to the database, returning whether anything was written
+            If a debounced flush failed since the last `.flush()`, its exception is raised instead
+            If writing fails, the changes remain pending, so that flushing may be retried
+        '''
+        if (e := self._error) is not None:
+            self._error = None
+            raise e
+        return self._flush()
+    def discard(self):
+        '''Discards any pending changes, reverting the session's `State` to the database's'''
+        with self._lock:
+            self._cancel()
+            self._dirty.clear()
+            self._dirty_edges.clear()
+            self._error = None
+            if self._state is not None: self._state = self.controller.read()
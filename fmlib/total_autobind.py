@@ -3,13 +3,16 @@
 '''
     FlexiMan library
     Automatically imports and binds to `FlexiLynx`
+    Unless `fmlib.TOTAL_AUTOBIND_LAZY` is set to false before this is imported,
+        each bound submodule is only built when it is first accessed
 '''
 
 #> Imports
-from operator import attrgetter
+from typing import Callable
 from types import ModuleType, SimpleNamespace
-from inspect import getmembers, isroutine
-from functools import partial, partialmethod
+from inspect import getmembers
+from functools import partial, wraps
+from threading import RLock
 
 try: import FlexiLynx as _FlexiLynx
 except ModuleNotFoundError as e:
@@ -30,12 +33,13 @@ type FLType = _FlexiLynx.core.util.FlexiSpace
 unbound = SimpleNamespace()
 ## Setup
 from . import _total_autobind_store
+from . import TOTAL_AUTOBIND_LAZY
 def _boundmodule(modname: str) -> tuple[ModuleType, ModuleType]:
     if hasattr(unbound, modname):
         unboundmod = getattr(unbound, modname)
-        boundmod = globals()[modnname]
+        boundmod = globals()[modname]
     else:
-        setattr(unbound, modname, (unboundmod := globals()[modname]))
+        setattr(unbound, modname, (unboundmod := _unboundmods[modname]))
         boundmod = globals()[modname] = ModuleType(f'TotalBound[M]<{modname}>', unboundmod.__doc__)
         boundmod.__dict__.update({'__doc__': unboundmod.__doc__, '__all__': unboundmod.__all__,
                                   '__module__': __name__,
@@ -44,22 +48,43 @@ def _boundmodule(modname: str) -> tuple[ModuleType, ModuleType]:
 def _fbindobject(mod: ModuleType, name: str, unbound: object, bound: object):
     setattr(mod, name, bound)
     setattr(bound, 'unbound', unbound)
-## Bind functions
-for modname,funcs in _total_autobind_store.marked_f.items():
+def _bindmeth(m: Callable) -> Callable:
+    @wraps(m)
+    def bound(self, *args, **kwargs):
+        return m(self, _FlexiLynx, *args, **kwargs)
+    return bound
+def _bind(modname: str) -> ModuleType:
     boundmod,unboundmod = _boundmodule(modname)
-    for f in funcs:
+    ## Bind functions
+    for f in _total_autobind_store.marked_f.get(modname, ()):
         _fbindobject(boundmod, f.__name__, f, partial(f, _FlexiLynx))
-
-## Bind classes
-for modname,clses in _total_autobind_store.marked_c.items():
-    boundmod,unboundmod = _boundmodule(modname)
-    for c in clses:
+    ## Bind classes
+    for c in _total_autobind_store.marked_c.get(modname, ()):
         _fbindobject(boundmod, c.__name__, c,
                      type(c.__name__, (c,), {'__slots__': (), '__module__': f'{__name__}.{modname}',
-                          **{mn: partialmethod(m, _FlexiLynx)
-                             for mn,m in getmembers(c, lambda m: getattr(m, '_totalautobindable', False))}}))
+                          **{mn: _bindmeth(m) for mn,m in getmembers(c, lambda m: getattr(m, '_totalautobindable', False))}}))
+    if modname in _patches: _patches[modname](boundmod)
+    return boundmod
 
 # Manual patches
-db.Controller._STATE_OBJECT = db.State
-db.Controller._TOTAL_AUTOBOUND = True
-db.State._TOTAL_AUTOBOUND = True
+def _patch_db(db: ModuleType):
+    db.Controller._STATE_OBJECT = db.State
+    db.Controller._TOTAL_AUTOBOUND = True
+    db.State._TOTAL_AUTOBOUND = True
+_patches = {'db': _patch_db}
+
+# Binding modes
+_unboundmods = {modname: globals()[modname] for modname in (_total_autobind_store.marked_f.keys() | _total_autobind_store.marked_c.keys())}
+if TOTAL_AUTOBIND_LAZY:
+    ## Bound modules are built on first access
+    for _modname in _unboundmods: del globals()[_modname]
+    _bindlock = RLock()
+    def __getattr__(name: str) -> ModuleType:
+        if name not in _unboundmods:
+            raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+        with _bindlock:
+            return globals()[name] if name in globals() else _bind(name)
+    def __dir__() -> list[str]:
+        return sorted(globals().keys() | _unboundmods.keys())
+else:
+    for _modname in _unboundmods: _bind(_modname)
@@ -0,0 +1,88 @@
+#!/bin/python3
+
+'''Timing spans, which embedders (and `fleximan.py --timings`) can collect through hooks'''
+
+#> Imports
+import time
+import typing
+import functools
+import itertools
+import contextlib
+import contextvars
+#</Imports
+
+#> Header >/
+__all__ = ('Span', 'add_hook', 'remove_hook', 'hooked', 'span', 'traced')
+
+class Span(typing.NamedTuple):
+    '''
+        A finished span, passed to each hook
+        `start` is the wall-clock time at which the span started, and `duration` is in seconds (from `time.perf_counter()`)
+        `parent` is the `id` of the span that was open when this span started (in the same thread), if any
+    '''
+    id: int
+    parent: int | None
+    name: str
+    start: float
+    duration: float
+    attrs: dict[str, typing.Any]
+
+    def asdict(self) -> dict[str, typing.Any]:
+        '''Returns this span as a flat, JSON-serializable `dict`, with its attributes alongside its fields'''
+        return self.attrs | {'span': self.name, 'id': self.id, 'parent': self.parent, 'start': self.start, 'duration': self.duration}
+
+_hooks = ()
+_ids = itertools.count(1)
+_current = contextvars.ContextVar('fmlib.trace.current', default=None)
+
+# Hooks
+def add_hook(hook: typing.Callable[[Span], None]):
+    '''Adds `hook`, which is called with each `Span` as it finishes (possibly from multiple threads)'''
+    global _hooks
+    _hooks = (*_hooks, hook)
+def remove_hook(hook: typing.Callable[[Span], None]):
+    '''Removes `hook`, if it was added'''
+    global _hooks
+    _hooks = tuple(h for h in _hooks if h is not hook)
+@contextlib.contextmanager
+def hooked(hook: typing.Callable[[Span], None]) -> typing.Iterator[typing.Callable[[Span], None]]:
+    '''Adds `hook` for the duration of the context'''
+    add_hook(hook)
+    try: yield hook
+    finally: remove_hook(hook)
+
+# Spans
+@contextlib.contextmanager
+def span(name: str, **attrs: typing.Any) -> typing.Iterator[dict[str, typing.Any]]:
+    '''
+        Times the context as a span called `name`, with the attributes `attrs`, and passes it to each hook when it finishes
+        The attributes are yielded, so that more can be added from within the context,
+            and if the context raises, the name of the exception's type is added as `error`
+        If there are no hooks when the span starts, then nothing is timed
+    '''
+    if not _hooks:
+        yield attrs
+        return
+    id = next(_ids)
+    parent = _current.get()
+    token = _current.set(id)
+    start = time.time()
+    pstart = time.perf_counter()
+    try: yield attrs
+    except BaseException as e:
+        attrs.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        duration = time.perf_counter() - pstart
+        _current.reset(token)
+        s = Span(id, parent, name, start, duration, attrs)
+        for hook in _hooks: hook(s)
+def traced(name: str) -> typing.Callable[[typing.Callable], typing.Callable]:
+    '''Decorates a function so that each call is timed as a span called `name`'''
+    def decorator(f: typing.Callable) -> typing.Callable:
+        @functools.wraps(f)
+        def traced_f(*args, **kwargs):
+            if not _hooks: return f(*args, **kwargs)
+            with span(name): return f(*args, **kwargs)
+        return traced_f
+    return decorator
@@ -0,0 +1,182 @@
+#!/bin/python3
+
+'''Verification of installed files against the hashes in their blueprints'''
+
+#> Imports
+import os
+import mmap
+import time
+import typing
+import hashlib
+import threading
+import itertools
+from pathlib import Path
+
+from . import FLType
+from . import _total_autobind_store
+from . import packages
+from . import trace
+#</Imports
+
+#> Header >/
+__all__ = ('MMAP_THRESHOLD', 'READ_SIZE', 'hash_file', 'HashCache', 'Verifier')
+
+MMAP_THRESHOLD = 1024 * 1024
+READ_SIZE = 256 * 1024
+
+type FileIdentity = tuple[int, int, int]
+
+def hash_file(path: str, algorithm: str) -> tuple[FileIdentity, bytes] | None:
+    '''
+        Returns the identity (inode, size, and modification time in nanoseconds) and `algorithm` hash of the file at `path`,
+            or `None` if it cannot be read
+        Files of at least `MMAP_THRESHOLD` bytes are hashed through `mmap`, and smaller files are read with `.readinto()`
+    '''
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            st = os.fstat(f.fileno())
+            h = hashlib.new(algorithm)
+            if st.st_size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm: h.update(mm)
+            else:
+                buf = bytearray(min(st.st_size + 1, READ_SIZE))
+                view = memoryview(buf)
+                while n := f.readinto(buf): h.update(view[:n])
+    except OSError: return None
+    return ((st.st_ino, st.st_size, st.st_mtime_ns), h.digest())
+def _hash_files(paths: typing.Sequence[str], algorithm: str) -> list[tuple[FileIdentity, bytes] | None]:
+    return [hash_file(p, algorithm) for p in paths]
+
+@_total_autobind_store.bindable_cls('verify')
+class HashCache:
+    '''
+        A persisted cache of file hashes, keyed on the files' absolute paths,
+            where each entry is only used whilst the file's inode, size, and modification time (in nanoseconds) are unchanged
+        The cache is conventionally kept at `<root>/.fleximan_cache/hashes.pakd` (see `cache.BlueprintCache.DEFAULT_DIRNAME`)
+        Note that the cache is not locked; `.save()` is atomic, but concurrent savers overwrite each other's entries
+    '''
+    __slots__ = ('bound', 'path', 'entries',
+                 '_packer', '_lock', '_dirty')
+
+    DEFAULT_FILENAME = 'hashes.pakd'
+    CACHE_VERSION = 1
+
+    @_total_autobind_store.bindable_meth
+    def __init__(self, fl: FLType, path: Path):
+        self.bound = fl
+        self.path = path
+        self._packer = self.bound.core.util.pack.Packer()
+        self._lock = threading.Lock()
+        self._dirty = False
+        try: packed = self._packer.unpack(self.path.read_bytes())[0]
+        except FileNotFoundError: packed = {}
+        if packed.get('vers') != self.CACHE_VERSION: packed = {}
+        self.entries = {p: (tuple(ident), alg, digest) for p,(ident,alg,digest) in packed.get('entries', {}).items()}
+
+    def get(self, path: str, ident: FileIdentity, algorithm: str) -> bytes | None:
+        '''Returns the cached `algorithm` hash of the file at `path`, if it is cached and its identity is still `ident`'''
+        if ((ent := self.entries.get(path)) is None) or (ent[0] != ident) or (ent[1] != algorithm): return None
+        return ent[2]
+    def put(self, path: str, ident: FileIdentity, algorithm: str, digest: bytes):
+        '''Caches the `algorithm` hash of the file at `path`, whose identity is `ident`'''
+        with self._lock:
+            self.entries[path] = (ident, algorithm, digest)
+            self._dirty = True
+    def save(self):
+        '''Writes the cache to disk if it was changed'''
+        with self._lock:
+            if not self._dirty: return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+            tmp.write_bytes(self._packer.pack({'vers': self.CACHE_VERSION, 'entries': self.entries}))
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+@_total_autobind_store.bindable_cls('verify')
+class Verifier:
+    '''
+        Checks the files tracked by packages against the hashes in their blueprints (in the main part, or in any draft)
+        Files are hashed on a pool of `jobs` processes (if `jobs` is more than 1), which is kept for as long as the `Verifier` is used as a context manager,
+            and, if `cache` is given, only files whose identity changed since they were last hashed are hashed again
+        `.files`, `.hashed`, and `.cached` count how many files were checked, how many were hashed, and how many were found in `cache`,
+            and `.bytes_hashed` and `.hash_time` (in seconds) give `.throughput`
+    '''
+    __slots__ = ('bound', 'jobs', 'cache',
+                 'files', 'hashed', 'cached', 'bytes_hashed', 'hash_time',
+                 '_pool')
+
+    OK = 'ok'
+    MODIFIED = 'modified'
+    MISSING = 'missing'
+    UNKNOWN = 'unknown'
+
+    @_total_autobind_store.bindable_meth
+    def __init__(self, fl: FLType, *, jobs: int = 1, cache: HashCache | None = None):
+        self.bound = fl
+        self.jobs = jobs
+        self.cache = cache
+        self.files = 0
+        self.hashed = 0
+        self.cached = 0
+        self.bytes_hashed = 0
+        self.hash_time = 0.
+        self._pool = None
+
+    def __enter__(self) -> typing.Self:
+        if self.jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor # imports `multiprocessing`, which is slow to import
+            self._pool = ProcessPoolExecutor(self.jobs)
+        return self
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def throughput(self) -> float:
+        '''The rate at which files were hashed, in megabytes per second'''
+        return (self.bytes_hashed / 1_000_000 / self.hash_time) if self.hash_time else 0.
+
+    @trace.traced('verify.hash')
+    def _hash(self, paths: list[str], algorithm: str) -> list[tuple[FileIdentity, bytes] | None]:
+        start = time.perf_counter()
+        if (self._pool is None) or (len(paths) < 2): results = _hash_files(paths, algorithm)
+        else:
+            size = -(-len(paths) // (self.jobs * 4)) # a few batches per process, to balance uneven file sizes
+            batches = [paths[i:i+size] for i in range(0, len(paths), size)]
+            results = [r for batch in self._pool.map(_hash_files, batches, itertools.repeat(algorithm)) for r in batch]
+        self.hash_time += time.perf_counter() - start
+        self.hashed += sum(r is not None for r in results)
+        self.bytes_hashed += sum(r[0][1] for r in results if r is not None)
+        return results
+    def check(self, pkg: packages.PackageType) -> dict[str, str]:
+        '''
+            Returns a `dict` mapping each file tracked by `pkg` (in sorted order) to its status:
+                `OK` if it matches its blueprint, `MODIFIED` if it does not, `MISSING` if it cannot be read,
+                or `UNKNOWN` if its blueprint does not have a hash for it
+        '''
+        algorithm = pkg.blueprint.hash_method
+        expected = {}
+        for part in (pkg.blueprint.main, *(pkg.blueprint.drafts or {}).values()):
+            for f,h in part.files.items(): expected.setdefault(f, set()).add(h)
+        digests = {}
+        stale = []
+        for f in sorted(pkg.files):
+            full = os.path.abspath(pkg.at/f)
+            if self.cache is not None:
+                try: st = os.stat(full)
+                except OSError: pass
+                else:
+                    if (digest := self.cache.get(full, (st.st_ino, st.st_size, st.st_mtime_ns), algorithm)) is not None:
+                        digests[f] = digest
+                        self.cached += 1
+                        continue
+            stale.append((f, full))
+        for (f,full),res in zip(stale, self._hash([full for _,full in stale], algorithm)):
+            if res is None: continue
+            digests[f] = res[1]
+            if self.cache is not None: self.cache.put(full, res[0], algorithm, res[1])
+        self.files += len(pkg.files)
+        return {f: (self.MISSING if f not in digests else self.UNKNOWN if f not in expected
+                    else self.OK if digests[f] in expected[f] else self.MODIFIED)
+                for f in sorted(pkg.files)}